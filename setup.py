@@ -11,7 +11,8 @@ setup(name='WESkit',
       version='0.0.1',
       entry_points={
             "console_scripts": [
-                  "weskit = weskit.__main__:main"
+                  "weskit = weskit.__main__:main",
+                  "weskit-task-events = weskit.tasks.task_event_consumer:main"
             ]
       },
       include_package_data=True
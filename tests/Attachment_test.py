@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import io
+import os
+import stat
+import tarfile
+import zipfile
+
+import pytest
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from weskit.classes.Attachment import ATTACHMENT_FILE_MODE, AttachmentFile, AttachmentStore, \
+    save_attachment, extract_archive, is_archive
+from weskit.exceptions import ClientError
+
+
+def test_attachment_file_is_moved(tmp_path):
+    stream = AttachmentFile(tmp_path / "uploads", max_size=10)
+    stream.write(b"hello")
+    stream.write(b"world")
+    stream.seek(0)
+
+    size, sha256 = save_attachment(FileStorage(stream, "Snakefile"), tmp_path / "Snakefile")
+    assert (size, sha256) == (10, hashlib.sha256(b"helloworld").hexdigest())
+    assert (tmp_path / "Snakefile").read_bytes() == b"helloworld"
+    assert stat.S_IMODE((tmp_path / "Snakefile").stat().st_mode) == ATTACHMENT_FILE_MODE
+    stream.close()
+    assert (tmp_path / "Snakefile").exists()
+    assert list((tmp_path / "uploads").iterdir()) == []
+
+
+def test_attachment_file_size_limit(tmp_path):
+    stream = AttachmentFile(tmp_path, max_size=4)
+    with pytest.raises(RequestEntityTooLarge):
+        stream.write(b"hello")
+    # The partially uploaded file is removed.
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_save_attachment_copies_other_streams(tmp_path):
+    attachment = FileStorage(io.BytesIO(b"hello"), "Snakefile")
+    assert save_attachment(attachment, tmp_path / "Snakefile") == \
+        (5, hashlib.sha256(b"hello").hexdigest())
+    assert (tmp_path / "Snakefile").read_bytes() == b"hello"
+
+    with pytest.raises(ClientError):
+        save_attachment(FileStorage(io.BytesIO(b"hello"), "x"), tmp_path / "x", max_size=4)
+    # The partially written attachment is removed.
+    assert not (tmp_path / "x").exists()
+
+
+def test_extract_zip(tmp_path):
+    archive = tmp_path / "wf.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("wf/Snakefile", "rule all:")
+        zf.writestr("wf/config.yaml", "a: 1")
+    assert is_archive(archive)
+    assert sorted(map(str, extract_archive(archive, tmp_path / "run"))) == \
+        ["wf/Snakefile", "wf/config.yaml"]
+    assert (tmp_path / "run" / "wf" / "Snakefile").read_text() == "rule all:"
+
+    with pytest.raises(ClientError):
+        extract_archive(archive, tmp_path / "small", max_size=10)
+
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("../outside", "x")
+    with pytest.raises(ClientError):
+        extract_archive(archive, tmp_path / "run")
+    assert not (tmp_path / "outside").exists()
+
+
+def test_extract_tar(tmp_path):
+    archive = tmp_path / "wf.tar.gz"
+    with tarfile.open(archive, "w:gz") as tf:
+        data = b"rule all:"
+        info = tarfile.TarInfo("wf/Snakefile")
+        info.size = len(data)
+        tf.addfile(info, io.BytesIO(data))
+        link = tarfile.TarInfo("wf/link")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "/etc/passwd"
+        tf.addfile(link)
+    assert is_archive(archive)
+    with pytest.raises(ClientError):
+        extract_archive(archive, tmp_path / "run")
+    assert (tmp_path / "run" / "wf" / "Snakefile").read_bytes() == b"rule all:"
+    assert not (tmp_path / "run" / "wf" / "link").exists()
+
+
+def test_extract_archive_does_not_overwrite_existing_files(tmp_path):
+    run_dir = tmp_path / "run"
+    os.makedirs(run_dir)
+    (tmp_path / "attachment").write_text("attached")
+    os.link(tmp_path / "attachment", run_dir / "Snakefile")
+    os.symlink(tmp_path, run_dir / "wf")
+    archive = tmp_path / "wf.zip"
+    for member in ["Snakefile", "wf/Snakefile"]:
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr(member, "rule all:")
+        with pytest.raises(ClientError):
+            extract_archive(archive, run_dir)
+    assert (tmp_path / "attachment").read_text() == "attached"
+    assert not (tmp_path / "Snakefile").exists()
+
+
+def test_attachment_store_deduplicates(tmp_path):
+    store = AttachmentStore(tmp_path / "store", grace_period=0)
+    for run in ["run1", "run2"]:
+        os.makedirs(tmp_path / run)
+        attachment = FileStorage(io.BytesIO(b"rule all:"), "Snakefile")
+        assert store.add(attachment, tmp_path / run / "Snakefile") == \
+            (9, hashlib.sha256(b"rule all:").hexdigest())
+
+    stored = store.path(hashlib.sha256(b"rule all:").hexdigest())
+    assert os.path.samefile(stored, tmp_path / "run1" / "Snakefile")
+    assert os.path.samefile(stored, tmp_path / "run2" / "Snakefile")
+    assert stored.stat().st_nlink == 3
+    assert [path.name for path in (tmp_path / "store").rglob("*")
+            if path.is_file()] == [stored.name]
+
+    # Stored attachments are only removed, if no run directory links them anymore.
+    (tmp_path / "run1" / "Snakefile").unlink()
+    assert store.collect_garbage() == 0
+    (tmp_path / "run2" / "Snakefile").unlink()
+    assert store.collect_garbage() == 1
+    assert not stored.exists()
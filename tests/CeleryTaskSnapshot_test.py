@@ -0,0 +1,53 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+import pytest
+from celery import states
+
+from weskit.classes.CeleryTaskSnapshot import CeleryTaskSnapshot
+
+
+def test_fetch_all_in_batches(memory_backend_app):
+    backend = memory_backend_app.backend
+    backend.store_result("succeeded", {"exit_code": 0}, states.SUCCESS)
+    backend.store_result("started", None, states.STARTED)
+    backend.store_result("failed", RuntimeError("oops"), states.FAILURE)
+
+    snapshots = CeleryTaskSnapshot.fetch_all(
+        memory_backend_app,
+        ["succeeded", "started", "failed", "unknown", "succeeded"],
+        batch_size=2)
+
+    assert set(snapshots.keys()) == {"succeeded", "started", "failed", "unknown"}
+    assert snapshots["succeeded"].state == states.SUCCESS
+    assert snapshots["succeeded"].get() == {"exit_code": 0}
+    assert snapshots["started"].state == states.STARTED
+    assert snapshots["unknown"].state == states.PENDING
+    assert snapshots["unknown"].get() is None
+    assert snapshots["failed"].state == states.FAILURE
+    with pytest.raises(RuntimeError):
+        snapshots["failed"].get()
+
+
+def test_fetch_all_matches_async_result(memory_backend_app):
+    memory_backend_app.backend.store_result("task", {"exit_code": 1}, states.SUCCESS)
+    snapshot = CeleryTaskSnapshot.fetch_all(memory_backend_app, ["task"])["task"]
+    result = memory_backend_app.AsyncResult("task")
+    assert snapshot.state == result.state
+    assert snapshot.get() == result.get()
+
+
+def test_fetch_all_without_mget(memory_backend_app, monkeypatch):
+    backend = memory_backend_app.backend
+    backend.store_result("succeeded", {"exit_code": 0}, states.SUCCESS)
+
+    def mget(keys):
+        # Like KeyValueStoreBackend.mget, e.g. for the S3 backend.
+        raise NotImplementedError("Does not support get_many")
+
+    monkeypatch.setattr(backend, "mget", mget)
+    snapshots = CeleryTaskSnapshot.fetch_all(memory_backend_app, ["succeeded", "unknown"])
+    assert snapshots["succeeded"].state == states.SUCCESS
+    assert snapshots["succeeded"].get() == {"exit_code": 0}
+    assert snapshots["unknown"].state == states.PENDING
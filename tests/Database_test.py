@@ -2,11 +2,18 @@
 #
 # SPDX-License-Identifier: MIT
 
+import base64
 import copy
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 
-from weskit.exceptions import DatabaseOperationError, ConcurrentModificationError
+from weskit.api.RunRequestValidator import RunRequestValidator
+from weskit.classes.Database import Database
+from weskit.exceptions import ClientError, DatabaseOperationError, ConcurrentModificationError, \
+    DuplicateRunIdError
 from test_utils import get_mock_run
 from weskit.classes.Run import Run
 from weskit.classes.ProcessingStage import ProcessingStage
@@ -22,8 +29,9 @@ def test_insert_and_load_run(test_database):
     test_database.insert_run(run1)
     run2 = test_database.get_run(run1.id)
     assert run1 == run2
-    run_id_and_states = test_database.list_run_ids_and_stages("test_id")
+    run_id_and_states, next_page_token = test_database.list_run_ids_and_stages("test_id")
     assert len(run_id_and_states) == 1
+    assert next_page_token == ""
 
 
 @pytest.mark.integration
@@ -34,6 +42,29 @@ def test_except_on_duplicate_run(test_database):
     test_database.insert_run(run)
     with pytest.raises(DatabaseOperationError):
         test_database.insert_run(run)
+    with pytest.raises(DuplicateRunIdError):
+        test_database.insert_run(run)
+
+
+def test_create_run_id_is_time_ordered():
+    # No database access needed.
+    database = Database("mongodb://localhost:27017", "not_connected")
+    run_ids = []
+    for _ in range(3):
+        run_ids.append(database.create_run_id())
+        time.sleep(0.002)
+    assert len(set(run_ids)) == 3
+    assert run_ids == sorted(run_ids)
+    assert all(RunRequestValidator.invalid_run_id(str(run_id)) is None for run_id in run_ids)
+
+
+@pytest.mark.integration
+def test_concurrent_initialize(database_container):
+    database = Database(database_container.get_connection_url(), "concurrent_initialize")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        clients = list(pool.map(lambda _: database.client, range(8)))
+    assert all(client is clients[0] for client in clients)
+    database.client.drop_database("concurrent_initialize")
 
 
 @pytest.mark.integration
@@ -91,6 +122,54 @@ def test_get_runs(test_database):
         assert isinstance(run, Run)
 
 
+@pytest.mark.integration
+def test_get_run_version(test_database):
+    run = get_mock_run(workflow_url="tests/wf1/Snakefile",
+                       workflow_type="SMK",
+                       workflow_type_version="7.30.2")
+    test_database.insert_run(run)
+    assert test_database.get_run_version(run.id) == {"db_version": run.db_version,
+                                                      "user_id": run.user_id}
+    run.processing_stage = ProcessingStage.SYSTEM_ERROR
+    run = test_database.update_run(run)
+    assert test_database.get_run_version(run.id)["db_version"] == run.db_version
+    assert test_database.get_run_version(test_database.create_run_id()) is None
+
+
+@pytest.mark.integration
+def test_get_run_by_celery_task_id(test_database):
+    run = get_mock_run(workflow_url="tests/wf1/Snakefile",
+                       workflow_type="SMK",
+                       workflow_type_version="7.30.2")
+    run.celery_task_id = "task-of-the-run"
+    test_database.insert_run(run)
+    assert test_database.get_run_by_celery_task_id("task-of-the-run").id == run.id
+    assert test_database.get_run_by_celery_task_id("other-task") is None
+
+
+@pytest.mark.integration
+def test_get_run_stages(test_database):
+    running = get_mock_run(workflow_url="tests/wf1/Snakefile",
+                           workflow_type="SMK",
+                           workflow_type_version="7.30.2")
+    finished = get_mock_run(workflow_url="tests/wf1/Snakefile",
+                            workflow_type="SMK",
+                            workflow_type_version="7.30.2")
+    finished.processing_stage = ProcessingStage.FINISHED_EXECUTION
+    test_database.insert_runs([running, finished])
+
+    stages = {run_data["id"]: run_data
+              for run_data in test_database.get_run_stages(running.user_id, [])}
+    assert stages[running.id] == {"id": running.id,
+                                  "processing_stage": "RUN_CREATED",
+                                  "db_version": running.db_version}
+    assert finished.id not in stages
+    stages = {run_data["id"]: run_data
+              for run_data in test_database.get_run_stages(running.user_id, [finished.id])}
+    assert stages[finished.id]["processing_stage"] == "FINISHED_EXECUTION"
+    assert test_database.get_run_stages("other user", [finished.id]) == []
+
+
 @pytest.mark.integration
 def test_delete_run(test_database):
     run = get_mock_run(workflow_url="tests/wf1/Snakefile",
@@ -100,3 +179,120 @@ def test_delete_run(test_database):
     assert test_database.delete_run(run)
     find_run = test_database.get_run(run.id)
     assert find_run is None
+
+
+@pytest.mark.integration
+def test_indexes(test_database):
+    index_keys = [list(index["key"].keys())
+                  for index in test_database._runs.index_information().values()]
+    assert ["id"] in index_keys
+    assert ["user_id", "request_time", "id"] in index_keys
+    assert ["processing_stage"] in index_keys
+
+
+@pytest.mark.integration
+def test_insert_runs_and_update_processing_stages(test_database):
+    runs = [get_mock_run(workflow_url="tests/wf1/Snakefile",
+                         workflow_type="SMK",
+                         workflow_type_version="7.30.2")
+            for _ in range(3)]
+    runs[0].processing_stage = ProcessingStage.SYSTEM_ERROR
+    for run in runs[1:]:
+        run.processing_stage = ProcessingStage.PREPARED_EXECUTION
+    test_database.insert_runs(runs)
+
+    modified = test_database.update_processing_stages([run.id for run in runs],
+                                                      ProcessingStage.PREPARED_EXECUTION,
+                                                      ProcessingStage.SUBMITTED_EXECUTION)
+    assert modified == 2
+    stored_runs = [test_database.get_run(run.id) for run in runs]
+    assert stored_runs[0].processing_stage == ProcessingStage.SYSTEM_ERROR
+    assert stored_runs[0].db_version == runs[0].db_version
+    for run, stored_run in zip(runs[1:], stored_runs[1:]):
+        assert stored_run.processing_stage == ProcessingStage.SUBMITTED_EXECUTION
+        assert stored_run.db_version == run.db_version + 1
+
+    with pytest.raises(DuplicateRunIdError):
+        test_database.insert_runs(runs[:1])
+
+
+@pytest.mark.integration
+def test_get_non_terminal_runs(test_database):
+    run = get_mock_run(workflow_url="tests/wf1/Snakefile",
+                       workflow_type="SMK",
+                       workflow_type_version="7.30.2")
+    test_database.insert_run(run)
+    finished_run = get_mock_run(workflow_url="tests/wf1/Snakefile",
+                                workflow_type="SMK",
+                                workflow_type_version="7.30.2")
+    finished_run.processing_stage = ProcessingStage.FINISHED_EXECUTION
+    test_database.insert_run(finished_run)
+
+    run_ids = [r.id for r in test_database.get_non_terminal_runs()]
+    assert run.id in run_ids
+    assert finished_run.id not in run_ids
+
+
+@pytest.mark.integration
+def test_state_counts(test_database):
+    before = test_database.recount_states()
+    run = get_mock_run(workflow_url="tests/wf1/Snakefile",
+                       workflow_type="SMK",
+                       workflow_type_version="7.30.2")
+    test_database.insert_run(run)
+    counts = test_database.get_state_counts()
+    assert counts[ProcessingStage.RUN_CREATED] == before.get(ProcessingStage.RUN_CREATED, 0) + 1
+
+    run.processing_stage = ProcessingStage.PREPARED_EXECUTION
+    run = test_database.update_run(run)
+    counts = test_database.get_state_counts()
+    assert counts[ProcessingStage.RUN_CREATED] == before.get(ProcessingStage.RUN_CREATED, 0)
+    assert counts[ProcessingStage.PREPARED_EXECUTION] == \
+        before.get(ProcessingStage.PREPARED_EXECUTION, 0) + 1
+
+    test_database.delete_run(run)
+    counts = test_database.get_state_counts()
+    assert counts[ProcessingStage.PREPARED_EXECUTION] == \
+        before.get(ProcessingStage.PREPARED_EXECUTION, 0)
+
+    # Drifted counters are corrected by a recount.
+    test_database._state_counts.update_one({"_id": ProcessingStage.RUN_CREATED.name},
+                                           {"$inc": {"count": 5}})
+    assert test_database.recount_states() == before
+    assert test_database.get_state_counts()[ProcessingStage.RUN_CREATED] == \
+        before.get(ProcessingStage.RUN_CREATED, 0)
+
+
+@pytest.mark.integration
+def test_list_runs_in_pages(test_database):
+    user_id = "paging_user"
+    run_ids = []
+    for _ in range(5):
+        run = get_mock_run(workflow_url="tests/wf1/Snakefile",
+                           workflow_type="SMK",
+                           workflow_type_version="7.30.2",
+                           user_id=user_id)
+        test_database.insert_run(run)
+        run_ids.append(run.id)
+
+    listed_ids = []
+    page_token = None
+    for _ in range(3):
+        page, page_token = test_database.list_run_ids_and_stages(user_id, 2, page_token)
+        assert len(page) <= 2
+        listed_ids += [r["id"] for r in page]
+        if page_token == "":
+            break
+    assert page_token == ""
+    assert sorted(listed_ids) == sorted(run_ids)
+
+    with pytest.raises(ClientError):
+        test_database.list_run_ids_and_stages(user_id, 2, "invalid")
+
+
+@pytest.mark.parametrize("key", [[None, 5], [5, "01a14695-1311-2727-119d-e02ddd31c7ad"],
+                                 {"a": 1}, ["2023-01-01"], "string", [None, "no-uuid"]])
+def test_decode_invalid_page_tokens(key):
+    page_token = base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+    with pytest.raises(ClientError):
+        Database._decode_page_token(page_token)
@@ -0,0 +1,86 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import threading
+
+import pytest
+
+from weskit.api.DrsUrlResolver import DrsUrlResolver
+from weskit.exceptions import ClientError
+
+
+class StubResponse:
+
+    def __init__(self, drs_id: str):
+        self.drs_id = drs_id
+
+    def raise_for_status(self):
+        if self.drs_id == "missing":
+            raise ValueError("404 Not Found")
+
+    def json(self):
+        return {"access_methods": [{"type": "s3",
+                                    "access_url": {"url": f"s3://bucket/{self.drs_id}"}}]}
+
+
+class StubSession:
+
+    def __init__(self):
+        self.requested_urls = []
+        self.lock = threading.Lock()
+
+    def get(self, url, timeout):
+        with self.lock:
+            self.requested_urls.append(url)
+        return StubResponse(url.rsplit("/", 1)[-1])
+
+
+@pytest.fixture
+def resolver():
+    resolver = DrsUrlResolver()
+    resolver._session = StubSession()    # type: ignore
+    return resolver
+
+
+def test_resolve_deduplicates_and_caches(resolver):
+    data = {"workflow_params": json.dumps({
+        "inputs": "drs://drs.example.org:5000/obj1 drs://drs.example.org:5000/obj2 local.txt",
+        "reference": "drs://drs.example.org:5000/obj1",
+        "threads": 4})}
+    params = json.loads(resolver.resolve(data)["workflow_params"])
+    assert params == {"inputs": "s3://bucket/obj1 s3://bucket/obj2 local.txt",
+                      "reference": "s3://bucket/obj1",
+                      "threads": 4}
+    assert sorted(resolver.session.requested_urls) == [
+        "http://drs.example.org:5000/ga4gh/drs/v1/objects/obj1",
+        "http://drs.example.org:5000/ga4gh/drs/v1/objects/obj2"]
+
+    resolver.resolve({"workflow_params": json.dumps({"input": "drs://drs.example.org:5000/obj2"})})
+    assert len(resolver.session.requested_urls) == 2
+
+
+def test_requests_without_drs_uris_are_unchanged(resolver):
+    data = {"workflow_params": '{"text": "a  b"}'}
+    assert resolver.resolve(data) == {"workflow_params": '{"text": "a  b"}'}
+    assert resolver.resolve({}) == {}
+    assert resolver.session.requested_urls == []
+
+
+def test_unresolvable_drs_uri(resolver):
+    with pytest.raises(ClientError):
+        resolver.resolve({"workflow_params": json.dumps({
+            "input": "drs://drs.example.org/missing"})})
+
+
+def test_resolver_from_config():
+    resolver = DrsUrlResolver.from_config({"max_workers": 4,
+                                           "connect_timeout": 1.0,
+                                           "read_timeout": 10.0,
+                                           "cache_ttl": 60.0,
+                                           "cache_size": 100})
+    assert resolver.max_workers == 4
+    assert resolver.timeout == (1.0, 10.0)
+    assert resolver.cache_ttl == 60.0
+    assert resolver.cache_size == 100
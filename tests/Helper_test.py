@@ -0,0 +1,68 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from werkzeug.datastructures import ETags
+
+from weskit.api.Helper import Helper
+
+RUN_ID = "01a14695-1311-2727-119d-e02ddd31c7ad"
+
+
+class StubManager:
+    """Counts the run updates, and reads the run versions from the `run`."""
+
+    def __init__(self, task_event_updates: bool):
+        self.task_event_updates = task_event_updates
+        self.run = SimpleNamespace(id=uuid.UUID(RUN_ID), user_id="user", db_version=1)
+        self.updates = 0
+        self.database = SimpleNamespace(get_run_version=lambda run_id: {
+            "user_id": self.run.user_id, "db_version": self.run.db_version})
+
+    def get_run(self, run_id):
+        return self.run
+
+    def get_current_run(self, run_id):
+        self.updates += 1
+        # The run changed since the client's last request.
+        self.run.db_version += 1
+        return self.run
+
+
+@pytest.fixture
+def flask_app():
+    app = Flask(__name__)
+    with app.app_context():
+        yield app
+
+
+def test_current_run_is_updated_before_revalidation(flask_app):
+    manager = StubManager(task_event_updates=False)
+    helper = Helper(SimpleNamespace(manager=manager), SimpleNamespace(id="user"))   # type: ignore
+
+    run, not_modified_response = helper.get_current_run(RUN_ID, ETags([f"{RUN_ID}-1"]))
+    assert manager.updates == 1
+    assert not_modified_response is None
+    assert run.db_version == 2
+
+    run, not_modified_response = helper.get_current_run(RUN_ID, ETags([f"{RUN_ID}-3"]))
+    assert not_modified_response.status_code == 304
+
+
+def test_revalidation_with_task_event_updates(flask_app):
+    manager = StubManager(task_event_updates=True)
+    helper = Helper(SimpleNamespace(manager=manager), SimpleNamespace(id="user"))   # type: ignore
+
+    run, not_modified_response = helper.get_current_run(RUN_ID, ETags([f"{RUN_ID}-1"]))
+    assert run is None
+    assert not_modified_response.status_code == 304
+    assert manager.updates == 0
+
+    run, not_modified_response = helper.get_current_run(RUN_ID, ETags(["outdated"]))
+    assert run is manager.run
+    assert not_modified_response is None
@@ -0,0 +1,39 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import uuid
+from datetime import datetime
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from weskit.api import JSONProvider
+from weskit.api.JSONProvider import OrjsonProvider
+
+
+def test_orjson_provider_matches_default_provider():
+    app = Flask(__name__)
+    data = {
+        "run_id": uuid.UUID("01a14690-79d6-4348-bd8e-95ec46ec7e75"),
+        "start_time": datetime(2023, 1, 2, 3, 4, 5),
+        "outputs": {"filesystem": ["a.txt", "b.txt"]},
+        "b": None,
+        "a": 1.5,
+        "large": 2 ** 70
+    }
+    provider = OrjsonProvider(app)
+    default = DefaultJSONProvider(app)
+    assert json.loads(provider.dumps(data)) == json.loads(default.dumps(data))
+    if JSONProvider.orjson is not None:
+        assert provider.dumps({"b": 1, "a": 2}) == '{"a":2,"b":1}'
+    else:
+        # Without orjson, the default provider is used.
+        assert provider.dumps({"b": 1, "a": 2}) == default.dumps({"b": 1, "a": 2})
+    assert provider.loads('{"a": [1, 2]}') == {"a": [1, 2]}
+
+    with app.app_context():
+        response = provider.response(data)
+        assert response.mimetype == "application/json"
+        assert response.get_json() == json.loads(default.dumps(data))
@@ -0,0 +1,135 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+import json
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+from jwt.exceptions import InvalidSignatureError
+
+from weskit.oidc.Login import Login
+from weskit.oidc.ProviderCache import CachedDocument, ProviderCache
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def jwk(kid: str) -> dict:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048).public_key()
+    return {**json.loads(RSAAlgorithm.to_jwk(key)), "kid": kid, "use": "sig"}
+
+
+def test_cached_document_is_shared_via_file(tmp_path):
+    fetched = []
+
+    def fetch():
+        fetched.append(True)
+        return {"version": len(fetched)}
+
+    path = tmp_path / "document.json"
+    assert CachedDocument(path, fetch).get() == {"version": 1}
+    # E.g. another worker process, or a restarted worker.
+    assert CachedDocument(path, fetch).get() == {"version": 1}
+    assert len(fetched) == 1
+
+
+def test_stale_document_is_refreshed(tmp_path):
+    clock = Clock()
+    document = CachedDocument(tmp_path / "document.json",
+                              lambda: {"fetched_at": clock.now},
+                              max_age=10,
+                              clock=clock)
+    assert document.get() == {"fetched_at": 1000.0}
+    clock.now += 20
+    document.refresh_in_background = document.refresh   # type: ignore
+    # The stale document is returned, while it is refreshed.
+    assert document.get() == {"fetched_at": 1000.0}
+    assert document.get() == {"fetched_at": 1020.0}
+
+
+def test_unknown_key_ids_refetch_jwks(tmp_path):
+    clock = Clock()
+    jwks = {"keys": [jwk("key1")]}
+    jwks_fetches = []
+
+    def fetch_jwks(uri):
+        assert uri == "https://issuer/certs"
+        jwks_fetches.append(uri)
+        return jwks
+
+    cache = ProviderCache("https://issuer",
+                          tmp_path,
+                          fetch_oidc_config=lambda url: {"jwks_uri": "https://issuer/certs"},
+                          fetch_jwks=fetch_jwks,
+                          min_jwks_refresh_interval=10,
+                          clock=clock)
+    key1 = cache.public_key("key1")
+    assert cache.public_key() is key1
+    assert len(jwks_fetches) == 1
+
+    # Key rotation.
+    jwks = {"keys": [jwk("key2"), jwks["keys"][0]]}
+    assert cache.public_key("key2") is not None
+    assert len(jwks_fetches) == 2
+
+    with pytest.raises(InvalidSignatureError):
+        cache.public_key("bogus")
+    # Refetching is rate-limited.
+    assert len(jwks_fetches) == 2
+
+
+def test_failed_jwks_refetch_rejects_token(tmp_path):
+    clock = Clock()
+    jwks_fetches = []
+
+    def fetch_jwks(uri):
+        jwks_fetches.append(uri)
+        if len(jwks_fetches) > 1:
+            raise ConnectionError("Identity provider not reachable")
+        return {"keys": [jwk("key1")]}
+
+    cache = ProviderCache("https://issuer",
+                          tmp_path,
+                          fetch_oidc_config=lambda url: {"jwks_uri": "https://issuer/certs"},
+                          fetch_jwks=fetch_jwks,
+                          min_jwks_refresh_interval=10,
+                          clock=clock)
+    assert cache.public_key("key1") is not None
+    for _ in range(2):
+        with pytest.raises(InvalidSignatureError):
+            cache.public_key("unknown")
+    # The failed attempt counts for the rate limit.
+    assert len(jwks_fetches) == 2
+    clock.now += 10
+    with pytest.raises(InvalidSignatureError):
+        cache.public_key("unknown")
+    assert len(jwks_fetches) == 3
+
+
+def test_login_uses_refreshed_discovery_document(tmp_path):
+    clock = Clock()
+    oidc_configs = iter([{"token_endpoint": "https://issuer/token"},
+                         {"token_endpoint": "https://issuer/v2/token"}])
+    cache = ProviderCache("https://issuer",
+                          tmp_path,
+                          fetch_oidc_config=lambda url: next(oidc_configs),
+                          fetch_jwks=lambda uri: {"keys": [jwk("key1")]},
+                          max_age=10,
+                          clock=clock)
+    login = Login(realm="realm", client_id="client", client_secret="secret",
+                  provider_cache=cache)
+    assert login.token_endpoint == "https://issuer/token"
+
+    clock.now += 20
+    cache._oidc_config.refresh_in_background = cache._oidc_config.refresh   # type: ignore
+    # The stale document is returned, while it is refreshed.
+    assert login.token_endpoint == "https://issuer/token"
+    assert login.token_endpoint == "https://issuer/v2/token"
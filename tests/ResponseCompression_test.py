@@ -0,0 +1,49 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+import gzip
+import json
+
+import pytest
+from flask import Flask, jsonify
+
+from weskit.api.ResponseCompression import ResponseCompression
+
+
+@pytest.fixture
+def compressing_client():
+    app = Flask(__name__)
+    ResponseCompression(min_size=100).init_app(app)
+
+    @app.route("/large")
+    def large():
+        response = jsonify({"outputs": [f"file_{i}.txt" for i in range(100)]})
+        response.set_etag("run-1")
+        return response
+
+    @app.route("/small")
+    def small():
+        return jsonify({"state": "COMPLETE"})
+
+    return app.test_client()
+
+
+def test_gzip_compression(compressing_client):
+    response = compressing_client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.headers["ETag"] == 'W/"run-1"'
+    body = json.loads(gzip.decompress(response.data))
+    assert len(body["outputs"]) == 100
+    assert int(response.headers["Content-Length"]) == len(response.data)
+
+
+def test_no_compression(compressing_client):
+    response = compressing_client.get("/large")
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["ETag"] == '"run-1"'
+
+    response = compressing_client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.json == {"state": "COMPLETE"}
@@ -93,6 +93,23 @@ def test_validate_run_dir_tag(run_request_validator_rundir):
         ) == ["Not a relative path: 'file:/absolute/path/to/file'"]
 
 
+def test_json_fields_are_decoded(run_request_validator):
+    the_request = request(workflow_params='{"input": "file.txt"}',
+                          workflow_engine_parameters='{"max-memory": "150m"}',
+                          tags='{"run_dir": "file:relative/path"}')
+    original_request = dict(the_request)
+    normalized = run_request_validator.validate(the_request)
+    assert normalized["workflow_params"] == {"input": "file.txt"}
+    assert normalized["workflow_engine_parameters"] == {"max-memory": "150m"}
+    assert normalized["tags"] == {"run_dir": "file:relative/path"}
+    assert the_request == original_request
+
+    assert run_request_validator.validate(request(tags="wrong")) == \
+        ["JSON parse-error in tags: Expecting value"]
+    assert run_request_validator.validate(request(tags='["run_dir"]')) == \
+        ["tags must be string with JSON dictionary"]
+
+
 def test_workflow_type(run_request_validator):
     assert isinstance(run_request_validator.validate(request(workflow_type="SMK",
                                                              workflow_type_version="7.30.2")),
@@ -165,7 +182,7 @@ def test_validate_workflow_params(run_request_validator):
     assert run_request_validator.validate(request(
         workflow_params="{}"
     )) == {
-        'workflow_params': '{}',
+        'workflow_params': {},
         'workflow_type': 'SMK',
         'workflow_type_version': '7.30.2',
         'workflow_url': 'file:tests/wf/Snakefile',
@@ -174,7 +191,7 @@ def test_validate_workflow_params(run_request_validator):
     assert run_request_validator.validate(request(
         workflow_params='{"engine-environment": "bla"}'
     )) == {
-        'workflow_params': '{"engine-environment": "bla"}',
+        'workflow_params': {"engine-environment": "bla"},
         'workflow_type': 'SMK',
         'workflow_type_version': '7.30.2',
         'workflow_url': 'file:tests/wf/Snakefile',
@@ -182,7 +199,7 @@ def test_validate_workflow_params(run_request_validator):
     assert run_request_validator.validate(request(
         workflow_params='{"engine-environment": []}'
     )) == {
-        'workflow_params': '{"engine-environment": []}',
+        'workflow_params': {"engine-environment": []},
         'workflow_type': 'SMK',
         'workflow_type_version': '7.30.2',
         'workflow_url': 'file:tests/wf/Snakefile',
@@ -203,7 +220,7 @@ def test_validate_workflow_engine_parameters(run_request_validator):
     assert run_request_validator.validate(request(
         workflow_params="{}"
     )) == {
-               'workflow_params': '{}',
+               'workflow_params': {},
                'workflow_type': 'SMK',
                'workflow_type_version': '7.30.2',
                'workflow_url': 'file:tests/wf/Snakefile',
@@ -212,7 +229,7 @@ def test_validate_workflow_engine_parameters(run_request_validator):
     assert run_request_validator.validate(request(
         workflow_params='{"engine-environment": "bla"}'
     )) == {
-               'workflow_params': '{"engine-environment": "bla"}',
+               'workflow_params': {"engine-environment": "bla"},
                'workflow_type': 'SMK',
                'workflow_type_version': '7.30.2',
                'workflow_url': 'file:tests/wf/Snakefile',
@@ -220,7 +237,7 @@ def test_validate_workflow_engine_parameters(run_request_validator):
     assert run_request_validator.validate(request(
         workflow_params='{"engine-environment": []}'
     )) == {
-               'workflow_params': '{"engine-environment": []}',
+               'workflow_params': {"engine-environment": []},
                'workflow_type': 'SMK',
                'workflow_type_version': '7.30.2',
                'workflow_url': 'file:tests/wf/Snakefile',
@@ -0,0 +1,125 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+import itertools
+import json
+import uuid
+
+from pymongo.errors import OperationFailure
+
+from weskit.api.Helper import run_event_messages
+from weskit.classes.ProcessingStage import ProcessingStage
+from weskit.classes.RunStageEvents import RunStageEvent, RunStageEvents, \
+    RunStageEventStreams
+
+RUN_ID = uuid.UUID("01a14695-1311-2727-119d-e02ddd31c7ad")
+
+
+class PollingDatabase:
+    """A database without change streams, in which the run progresses with every poll."""
+
+    def __init__(self):
+        self.stages = iter(["SUBMITTED_EXECUTION", "SUBMITTED_EXECUTION",
+                            "STARTED_EXECUTION", "FINISHED_EXECUTION"])
+        self.version = 0
+
+    def watch_run_stages(self, user_id, **kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", 40573)
+
+    def get_run_stages(self, user_id, run_ids):
+        stage = next(self.stages, None)
+        if stage is None:
+            return []
+        self.version += 1
+        return [{"id": RUN_ID, "processing_stage": stage, "db_version": self.version}]
+
+
+def test_polled_run_stage_events():
+    events = RunStageEvents(PollingDatabase(),    # type: ignore
+                            "user",
+                            heartbeat_interval=60,
+                            poll_interval=0,
+                            max_duration=60)
+    assert list(itertools.islice(events, 3)) == [
+        RunStageEvent(RUN_ID, ProcessingStage.SUBMITTED_EXECUTION, 1),
+        RunStageEvent(RUN_ID, ProcessingStage.STARTED_EXECUTION, 3),
+        RunStageEvent(RUN_ID, ProcessingStage.FINISHED_EXECUTION, 4)]
+
+
+class ChangeStream:
+
+    def __init__(self, changes):
+        self.changes = iter(changes)
+
+    def try_next(self):
+        return next(self.changes, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class WatchingDatabase:
+    """A database with change streams, which are filtered by the user."""
+
+    def __init__(self):
+        self.watched_user_ids = []
+
+    def watch_run_stages(self, user_id, **kwargs):
+        self.watched_user_ids.append(user_id)
+        return ChangeStream([{"fullDocument": {"id": RUN_ID,
+                                               "user_id": user_id,
+                                               "processing_stage": "STARTED_EXECUTION",
+                                               "db_version": 2}}])
+
+    def get_run_stages(self, user_id, run_ids):
+        return []
+
+
+def test_watched_run_stage_events():
+    database = WatchingDatabase()
+    events = RunStageEvents(database,    # type: ignore
+                            "user",
+                            heartbeat_interval=60,
+                            max_duration=60)
+    assert list(itertools.islice(events, 2)) == [
+        RunStageEvent(RUN_ID, ProcessingStage.STARTED_EXECUTION, 2),
+        None]
+    assert database.watched_user_ids == ["user"]
+
+
+def test_run_stage_event_streams_are_limited():
+    streams = RunStageEventStreams(WatchingDatabase(),    # type: ignore
+                                   max_streams=2,
+                                   heartbeat_interval=60,
+                                   max_duration=60)
+    first = streams.open("user1")
+    second = streams.open("user2")
+    assert first is not None and second is not None
+    assert streams.open("user3") is None
+
+    first.close()
+    # Closing is idempotent and releases the stream's slot only once.
+    first.close()
+    third = streams.open("user3")
+    assert third is not None
+    assert third.user_id == "user3"
+    assert third.heartbeat_interval == 60
+    assert streams.open("user4") is None
+
+
+def test_run_event_messages():
+    messages = list(run_event_messages([
+        RunStageEvent(RUN_ID, ProcessingStage.STARTED_EXECUTION, 3),
+        None]))
+    assert messages[0] == "retry: 1000\n\n"
+    lines = messages[1].splitlines()
+    assert lines[0] == f"id: {RUN_ID}-3"
+    assert lines[1] == "event: state"
+    assert json.loads(lines[2][len("data: "):]) == {"run_id": str(RUN_ID),
+                                                    "state": "RUNNING",
+                                                    "db_version": 3}
+    assert messages[2] == ": keep-alive\n\n"
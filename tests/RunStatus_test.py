@@ -11,6 +11,8 @@ from weskit.classes.ProcessingStage import ProcessingStage
 def test_runstatus_from_processingstage():
     assert RunStatus.from_stage(ProcessingStage.AWAITING_START) == \
         RunStatus.INITIALIZING
+    assert RunStatus.from_stage(ProcessingStage.PREPARING) == \
+        RunStatus.INITIALIZING
     assert RunStatus.from_stage(ProcessingStage.STARTED_EXECUTION) == \
         RunStatus.RUNNING
     assert RunStatus.from_stage(ProcessingStage.FINISHED_EXECUTION) == \
@@ -189,3 +189,78 @@ def test_run_merge_processing_stage():
         ProcessingStage.SUBMITTED_EXECUTION
     assert submitted_execution.merge(finished).processing_stage == \
         ProcessingStage.FINISHED_EXECUTION
+
+
+def test_run_modified_fields():
+    run = Run(**mock_run_data)
+    assert run.modified_fields == []
+
+    run.processing_stage = ProcessingStage.SUBMITTED_EXECUTION
+    run.outputs = {**run.outputs, "group_c": ["file_c1"]}
+    assert run.modified_fields == ["outputs", "processing_stage"]
+    assert run.to_bson_serializable(run.modified_fields) == {
+        "outputs": run.outputs,
+        "processing_stage": "SUBMITTED_EXECUTION"
+    }
+
+
+def test_run_merge_uses_other_as_reference():
+    stored = Run(**updated(mock_run_data, db_version=3, celery_task_id=None))
+    local = Run(**mock_run_data)
+    local.processing_stage = ProcessingStage.PREPARED_EXECUTION
+
+    merged = local.merge(stored)
+    assert merged.db_version == stored.db_version
+    assert merged.modified_fields == ["celery_task_id", "processing_stage"]
+    assert not stored.merge(stored).modified
+
+
+def test_run_from_bson_serializable_tracks_modifications():
+    stored = Run(**mock_run_data).to_bson_serializable()
+
+    run = Run.from_bson_serializable(stored)
+    assert not run.modified
+    assert run == Run(**mock_run_data)
+    assert not run.modified
+
+    run = Run.from_bson_serializable(stored)
+    run.outputs = {**run.outputs, "group_a": run.outputs["group_a"] + ["file_a2"]}
+    # The execution_log may be modified in place.
+    run.execution_log["exit_code"] = 1
+    assert run.modified_fields == ["exit_code", "outputs", "execution_log"]
+
+    run = Run.from_bson_serializable(stored)
+    run.celery_task_id = "another_task_id"
+    assert run.modified_fields == ["celery_task_id"]
+    run.celery_task_id = mock_run_data["celery_task_id"]
+    assert not run.modified
+
+
+def test_run_merge_keeps_identical_fields_encoded():
+    stored = Run(**mock_run_data).to_bson_serializable()
+    local = Run.from_bson_serializable(stored)
+    local.processing_stage = ProcessingStage.PREPARED_EXECUTION
+    current = Run.from_bson_serializable(stored)
+
+    merged = local.merge(current)
+    assert merged.modified_fields == ["processing_stage"]
+    assert set(merged._encoded.keys()) == set(Run._LAZY_FIELDS)
+    assert set(current._encoded.keys()) == set(Run._LAZY_FIELDS)
+
+    merged.execution_log["exit_code"] = 1
+    assert merged.modified_fields == ["exit_code", "execution_log", "processing_stage"]
+    assert not current.modified
+
+
+def test_run_from_bson_serializable_with_legacy_logs():
+    stored = Run(**mock_run_data).to_bson_serializable()
+    stored["execution_log"] = '{"stdout_file": ".weskit/stdout"}'
+    # Older WESkit versions stored the log content as list of lines.
+    stored["stdout"] = ["line 1", "line 2"]
+    stored["stderr"] = []
+
+    run = Run.from_bson_serializable(stored)
+    assert run.stdout == {"path": ".weskit/stdout", "size": None, "lines": 2}
+    # No log file name in the execution log.
+    assert run.stderr is None
+    assert not run.modified
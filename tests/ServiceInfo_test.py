@@ -2,8 +2,11 @@
 #
 # SPDX-License-Identifier: MIT
 
+import json
 from unittest import TestCase
 
+from weskit.api.ServiceInfo import ServiceInfo
+from weskit.classes.ProcessingStage import ProcessingStage
 from weskit.utils import create_validator
 
 
@@ -19,6 +22,54 @@ def test_validate_config(test_validation, test_config):
     assert not max_memory["api"]
 
 
+class CountingDatabase:
+
+    def __init__(self):
+        self.reads = 0
+
+    def get_state_counts(self):
+        self.reads += 1
+        return {ProcessingStage.RUN_CREATED: 2,
+                ProcessingStage.PREPARED_EXECUTION: 1,
+                ProcessingStage.FINISHED_EXECUTION: 3}
+
+
+def test_system_state_counts_are_cached(test_config, swagger):
+    database = CountingDatabase()
+    service_info = ServiceInfo(test_config["static_service_info"],
+                               test_config["workflow_engines"],
+                               swagger,
+                               database,     # type: ignore
+                               state_counts_ttl=60)
+    counts = service_info.system_state_counts()
+    assert counts["INITIALIZING"] == 3
+    assert counts["COMPLETE"] == 3
+    assert counts["RUNNING"] == 0
+    assert service_info.system_state_counts() == counts
+    assert database.reads == 1
+
+    service_info._state_counts_ttl = 0
+    service_info.system_state_counts()
+    assert database.reads == 2
+
+
+def test_response_etag(test_config, swagger):
+    database = CountingDatabase()
+    service_info = ServiceInfo(test_config["static_service_info"],
+                               test_config["workflow_engines"],
+                               swagger,
+                               database,     # type: ignore
+                               state_counts_ttl=0)
+    body, etag = service_info.response()
+    assert json.loads(body)["supported_wes_versions"] == ["1.0.0"]
+    assert service_info.response() == (body, etag)
+
+    database.get_state_counts = lambda: {ProcessingStage.RUN_CREATED: 1}    # type: ignore
+    changed_body, changed_etag = service_info.response()
+    assert json.loads(changed_body)["system_state_counts"]["INITIALIZING"] == 1
+    assert changed_etag != etag
+
+
 # def test_get_id(service_info):
 #     assert service_info.id() == "weskit.api"
 #
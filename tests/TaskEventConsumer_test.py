@@ -0,0 +1,68 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from types import SimpleNamespace
+
+from celery import states
+
+from weskit.classes.ProcessingStage import ProcessingStage
+from weskit.classes.TaskEventConsumer import TaskEventConsumer
+
+
+class StubManager:
+    """Records the updates of the runs, instead of writing them to the database."""
+
+    def __init__(self, celery_app, runs):
+        self.celery_app = celery_app
+        self.database = SimpleNamespace(get_run_by_celery_task_id=runs.get)
+        self.updates = []
+
+    def update_run(self, run, max_tries, celery_task):
+        self.updates.append((run.id, celery_task))
+        return run
+
+
+def test_task_events_update_runs(memory_backend_app):
+    runs = {
+        "running": SimpleNamespace(id="run1", processing_stage=ProcessingStage.SUBMITTED_EXECUTION),
+        "finished": SimpleNamespace(id="run2", processing_stage=ProcessingStage.FINISHED_EXECUTION)
+    }
+    manager = StubManager(memory_backend_app, runs)
+    consumer = TaskEventConsumer(manager)    # type: ignore
+
+    assert consumer.on_task_event({"type": "task-started", "uuid": "running"}).id == "run1"
+    assert manager.updates[-1][1].state == states.STARTED
+
+    memory_backend_app.backend.store_result("running", {"exit_code": 0}, states.SUCCESS)
+    consumer.on_task_event({"type": "task-succeeded", "uuid": "running"})
+    assert manager.updates[-1][1].state == states.SUCCESS
+    assert manager.updates[-1][1].get() == {"exit_code": 0}
+
+    # Terminal runs, tasks of no run, and other events are not updated.
+    assert consumer.on_task_event({"type": "task-started", "uuid": "finished"}).id == "run2"
+    assert consumer.on_task_event({"type": "task-failed", "uuid": "other"}) is None
+    assert consumer.on_task_event({"type": "task-received", "uuid": "running"}) is None
+    assert len(manager.updates) == 2
+
+
+def test_success_event_without_result(memory_backend_app):
+    runs = {"task": SimpleNamespace(id="run",
+                                    processing_stage=ProcessingStage.STARTED_EXECUTION)}
+    manager = StubManager(memory_backend_app, runs)
+    consumer = TaskEventConsumer(manager)    # type: ignore
+    assert consumer.on_task_event({"type": "task-succeeded", "uuid": "task"}) is None
+    assert manager.updates == []
+
+
+def test_failing_updates_do_not_stop_the_consumer(memory_backend_app):
+    runs = {"task": SimpleNamespace(id="run",
+                                    processing_stage=ProcessingStage.STARTED_EXECUTION)}
+    manager = StubManager(memory_backend_app, runs)
+
+    def update_run(run, max_tries, celery_task):
+        raise RuntimeError("No progression rules for stage")
+
+    manager.update_run = update_run
+    consumer = TaskEventConsumer(manager)    # type: ignore
+    assert consumer.on_task_event({"type": "task-failed", "uuid": "task"}) is None
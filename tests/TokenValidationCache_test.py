@@ -0,0 +1,53 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from weskit.oidc.TokenValidationCache import TokenValidation, TokenValidationCache
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cached_validations_expire():
+    clock = Clock()
+    cache = TokenValidationCache(max_age=60, failure_max_age=5, clock=clock)
+    cache.put("valid", TokenValidation())
+    cache.put("short-lived", TokenValidation(), token_expires_at=clock.now + 10)
+    cache.put("invalid", TokenValidation("Online validation failed"))
+    assert cache.get("valid").is_valid
+    assert cache.get("invalid").error == "Online validation failed"
+    assert cache.get("unknown") is None
+
+    clock.now += 6
+    assert cache.get("invalid") is None
+    assert cache.get("short-lived") is not None
+    clock.now += 5
+    assert cache.get("short-lived") is None
+    assert cache.get("valid") is not None
+    clock.now += 50
+    assert cache.get("valid") is None
+
+
+def test_expired_tokens_are_not_cached():
+    clock = Clock()
+    cache = TokenValidationCache(clock=clock)
+    cache.put("expired", TokenValidation(), token_expires_at=clock.now - 1)
+    assert cache.get("expired") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_tokens_are_evicted():
+    cache = TokenValidationCache(max_size=2)
+    cache.put("token1", TokenValidation())
+    cache.put("token2", TokenValidation())
+    assert cache.get("token1") is not None
+    cache.put("token3", TokenValidation())
+    assert cache.get("token2") is None
+    assert cache.get("token1") is not None
+    assert cache.get("token3") is not None
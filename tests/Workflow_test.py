@@ -12,8 +12,10 @@ from werkzeug.datastructures import FileStorage
 from werkzeug.datastructures import ImmutableMultiDict
 
 from test_utils import get_mock_run, is_within_timeout, assert_stage_is_not_failed
+from weskit.classes.Manager import Manager
 from weskit.classes.ProcessingStage import ProcessingStage
 from weskit.exceptions import ClientError
+from weskit.tasks.UpdateRunsTask import update_runs
 from weskit.utils import to_filename
 
 
@@ -310,6 +312,146 @@ def test_missing_celery_id(manager):
     assert run.processing_stage == ProcessingStage.SYSTEM_ERROR
 
 
+@pytest.mark.integration
+def test_update_runs_continues_after_failure(manager, monkeypatch):
+    runs = [get_mock_run(workflow_url="file:wf1/Snakefile",
+                         workflow_type="SMK",
+                         workflow_type_version="7.30.2")
+            for _ in range(2)]
+    for run in runs:
+        run.processing_stage = ProcessingStage.REQUESTED_CANCEL
+        manager.database.insert_run(run)
+
+    update_run = manager.update_run
+
+    def failing_update_run(run, *args):
+        if run.id == runs[0].id:
+            raise RuntimeError("No progression rules for stage")
+        return update_run(run, *args)
+
+    monkeypatch.setattr(manager, "update_run", failing_update_run)
+    updated_ids = [run.id for run in manager.update_runs()]
+    assert runs[0].id not in updated_ids
+    assert runs[1].id in updated_ids
+    assert manager.get_run(runs[1].id).processing_stage == ProcessingStage.SYSTEM_ERROR
+
+
+@pytest.mark.integration
+def test_update_runs_task(manager, monkeypatch):
+    run = get_mock_run(workflow_url="file:wf1/Snakefile",
+                       workflow_type="SMK",
+                       workflow_type_version="7.30.2")
+    run.processing_stage = ProcessingStage.REQUESTED_CANCEL
+    manager.database.insert_run(run)
+
+    # Use the test manager instead of one created from the environment of a worker process. The
+    # manager is a cached_property, which is set (and restored) in the task's __dict__, such that
+    # no manager is created from the environment just to be replaced.
+    monkeypatch.setitem(update_runs.__dict__, "manager", manager)
+    update_runs()
+
+    db_run = manager.get_run(run.id)
+    assert db_run is not None
+    assert db_run.processing_stage == ProcessingStage.SYSTEM_ERROR
+
+
+@pytest.mark.integration
+def test_submit_run(manager,
+                    celery_worker):
+    run = manager.submit_run({"workflow_params": '{"text": "hello world"}',
+                              "workflow_url": "file:wf1/Snakefile",
+                              "workflow_type": "SMK",
+                              "workflow_type_version": "7.30.2"},
+                             user_id="test_id")
+    # The run is inserted fully prepared, and marked as submitted with a single update.
+    run = manager.get_run(run.id)
+    assert run.db_version == 1
+    assert run.rundir_rel_workflow_path is not None
+    assert run.start_time is not None
+
+    start_time = time.time()
+    while run.processing_stage != ProcessingStage.FINISHED_EXECUTION:
+        assert is_within_timeout(start_time), "Test timed out"
+        assert_stage_is_not_failed(run.processing_stage)
+        time.sleep(1)
+        run = manager.update_run(run)
+    assert "hello_world.txt" in to_filename(run.outputs["filesystem"])
+
+    failed_run = manager.submit_run({"workflow_params": "{}",
+                                     "workflow_url": "file:wf1/missing/Snakefile",
+                                     "workflow_type": "SMK",
+                                     "workflow_type_version": "7.30.2"},
+                                    user_id="test_id")
+    failed_run = manager.get_run(failed_run.id)
+    assert failed_run.processing_stage == ProcessingStage.SYSTEM_ERROR
+    assert failed_run.celery_task_id is None
+
+
+@pytest.mark.integration
+def test_submit_run_async_preparation(manager,
+                                      celery_worker,
+                                      monkeypatch):
+    sent_runs = []
+    monkeypatch.setattr(manager, "async_preparation", True)
+    monkeypatch.setattr(manager, "_send_prepare_task", sent_runs.append)
+    run = manager.submit_run({"workflow_params": '{"text": "hello world"}',
+                              "workflow_url": "file:wf1/Snakefile",
+                              "workflow_type": "SMK",
+                              "workflow_type_version": "7.30.2"},
+                             user_id="test_id")
+    # The run is only inserted. Its preparation is left to the prepare_run task.
+    assert [sent_run.id for sent_run in sent_runs] == [run.id]
+    run = manager.get_run(run.id)
+    assert run.processing_stage == ProcessingStage.PREPARING
+    assert run.celery_task_id is None
+    assert run.rundir_rel_workflow_path is None
+
+    run = manager.prepare_and_execute(run.id)
+    assert run.processing_stage == ProcessingStage.PREPARED_EXECUTION
+    assert manager.prepare_and_execute(run.id) is None
+
+    run = manager.get_run(run.id)
+    start_time = time.time()
+    while run.processing_stage != ProcessingStage.FINISHED_EXECUTION:
+        assert is_within_timeout(start_time), "Test timed out"
+        assert_stage_is_not_failed(run.processing_stage)
+        time.sleep(1)
+        run = manager.update_run(run)
+    assert "hello_world.txt" in to_filename(run.outputs["filesystem"])
+
+
+@pytest.mark.integration
+def test_submit_runs_with_colliding_run_ids(manager,
+                                            celery_worker,
+                                            monkeypatch):
+    existing_run = get_mock_run(workflow_url="file:wf1/Snakefile",
+                                workflow_type="SMK",
+                                workflow_type_version="7.30.2")
+    manager.database.insert_run(existing_run)
+    create_run_id = manager.database.create_run_id
+    run_ids = iter([existing_run.id])
+    monkeypatch.setattr(manager.database, "create_run_id",
+                        lambda: next(run_ids, None) or create_run_id())
+
+    request = {"workflow_params": '{"text": "hello world"}',
+               "workflow_url": "file:wf1/Snakefile",
+               "workflow_type": "SMK",
+               "workflow_type_version": "7.30.2"}
+    runs = manager.submit_runs([dict(request), dict(request)], user_id="test_id")
+    # Only the colliding run got a new ID. Its run directory was moved accordingly.
+    assert existing_run.id not in [run.id for run in runs]
+    for run in runs:
+        run = manager.get_run(run.id)
+        assert run.processing_stage == ProcessingStage.SUBMITTED_EXECUTION
+        assert run.sub_dir.name == str(run.id)
+        assert (run.run_dir(manager.weskit_context) / f"{run.id}.yaml").is_file()
+
+    run_ids = iter([existing_run.id])
+    run = manager.submit_run(dict(request), user_id="test_id")
+    assert run.id != existing_run.id
+    assert manager.get_run(run.id).processing_stage == ProcessingStage.SUBMITTED_EXECUTION
+
+
 @pytest.mark.integration
 def test_run_id_existence(manager):
     run = get_mock_run(workflow_url="file:wf1/Snakefile",
@@ -324,3 +466,13 @@ def test_run_id_existence(manager):
     # run_id is not an actual run
     # and thus has no databse entry
     assert run_list == []
+
+
+def test_log_file_reference(tmp_path):
+    (tmp_path / "stdout").write_text("line 1\nline 2\nno newline")
+    assert Manager._log_file_reference(tmp_path, "stdout") == \
+           {"path": "stdout", "size": 24, "lines": 3}
+    (tmp_path / "stderr").write_text("")
+    assert Manager._log_file_reference(tmp_path, "stderr") == \
+           {"path": "stderr", "size": 0, "lines": 0}
+    assert Manager._log_file_reference(tmp_path, "missing") is None
@@ -13,6 +13,7 @@ import nest_asyncio
 import requests
 import time
 import yaml
+from celery import Celery
 from testcontainers.core.container import DockerContainer
 from testcontainers.mongodb import MongoDbContainer
 from testcontainers.mysql import MySqlContainer
@@ -249,6 +250,7 @@ def test_database(database_container):
     database.initialize()
     yield database
     database._runs.drop()
+    database._state_counts.drop()
 
 
 @pytest.fixture(scope="session")
@@ -273,6 +275,16 @@ def celery_config(redis_container):
     }
 
 
+@pytest.fixture
+def memory_backend_app():
+    """
+    A Celery app with an in-memory result backend, e.g. to store task results without Redis.
+    """
+    app = Celery("memory_backend_test", backend="cache+memory://")
+    yield app
+    app.close()
+
+
 @pytest.fixture(scope="session")
 def service_info(test_config, swagger, test_database):
     yield ServiceInfo(
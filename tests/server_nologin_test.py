@@ -24,6 +24,17 @@ class TestOpenEndpoint:
             "SMK": "7.30.2"
         }
 
+    @pytest.mark.integration
+    def test_get_service_info_not_modified(self, test_client_nologin):
+        response = test_client_nologin.get("/ga4gh/wes/v1/service-info")
+        etag = response.headers["ETag"]
+        assert response.cache_control.max_age is not None
+
+        response = test_client_nologin.get("/ga4gh/wes/v1/service-info",
+                                           headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+
 
 class TestWithoutLogin:
     """
@@ -413,6 +413,36 @@ class TestWithHeaderToken:
 
         assert response.status_code == 200
 
+    @pytest.mark.integration
+    def test_submit_workflow_batch(self,
+                                   test_client,
+                                   OIDC_credentials):
+        request = {
+            "workflow_params": {"text": "hello world"},
+            "workflow_url": "file:tests/wf1/Snakefile",
+            "workflow_type": "SMK",
+            "workflow_type_version": "7.30.2"
+        }
+        response = test_client.post(
+            "/weskit/v1/runs:batch",
+            json=[request, {"workflow_type": "SMK"}, request],
+            headers=OIDC_credentials.headerToken)
+        assert response.status_code == 200
+        results = response.json["runs"]
+        assert len(results) == 3
+        assert results[1]["status_code"] == 400
+        for result in [results[0], results[2]]:
+            status_response = test_client.get(
+                f"/ga4gh/wes/v1/runs/{result['run_id']}/status",
+                headers=OIDC_credentials.headerToken)
+            assert status_response.status_code == 200
+            assert status_response.json["state"] != "SYSTEM_ERROR"
+
+        response = test_client.post("/weskit/v1/runs:batch",
+                                    json={"runs": [request]},
+                                    headers=OIDC_credentials.headerToken)
+        assert response.status_code == 400
+
     @pytest.mark.integration
     def test_fails_requests(self,
                             test_client,
@@ -661,6 +691,103 @@ class TestWithHeaderToken:
                                    headers=OIDC_credentials.headerToken)
         assert response.status_code == 404
 
+    @pytest.mark.integration
+    def test_list_runs_paged(self,
+                             test_client,
+                             test_run,
+                             OIDC_credentials):
+        response = test_client.get("/ga4gh/wes/v1/runs?page_size=1",
+                                   headers=OIDC_credentials.headerToken)
+        assert response.status_code == 200, response.json
+        assert len(response.json["runs"]) == 1
+
+        response = test_client.get("/weskit/v1/runs?page_size=1",
+                                   headers=OIDC_credentials.headerToken)
+        assert response.status_code == 200, response.json
+        assert len(response.json) == 1
+        assert "Next-Page-Token" in response.headers
+
+        for route in ["/ga4gh/wes/v1/runs", "/weskit/v1/runs"]:
+            response = test_client.get(f"{route}?page_size=0",
+                                       headers=OIDC_credentials.headerToken)
+            assert response.status_code == 400
+            response = test_client.get(f"{route}?page_token=invalid",
+                                       headers=OIDC_credentials.headerToken)
+            assert response.status_code == 400
+
+    @pytest.mark.integration
+    def test_get_run_stdout(self,
+                            test_client,
+                            test_run,
+                            OIDC_credentials):
+        url = f"/weskit/v1/runs/{test_run.id}/stdout"
+        response = test_client.get(url, headers={**OIDC_credentials.headerToken,
+                                                 "Accept": "text/plain"})
+        assert response.status_code == 200
+        assert response.mimetype == "text/plain"
+        assert len(response.data) == test_run.stdout["size"]
+
+        # Without "Accept: text/plain", the lines are returned as JSON, like by earlier versions.
+        text = response.data.decode()
+        response = test_client.get(url, headers=OIDC_credentials.headerToken)
+        assert response.status_code == 200
+        assert response.json == {"content": text.splitlines()}
+
+    @pytest.mark.integration
+    def test_get_run_stdout_parts(self,
+                                  test_client,
+                                  test_run,
+                                  OIDC_credentials):
+        # The log of a running workflow is located via the run's start time.
+        context = WESApp.from_current_app(flask_current_app).manager.weskit_context
+        assert test_run.stdout_file(context) == \
+            test_run.run_dir(context) / test_run.stdout["path"]
+
+        url = f"/weskit/v1/runs/{test_run.id}/stdout"
+        full = test_client.get(url, headers={**OIDC_credentials.headerToken,
+                                             "Accept": "text/plain"}).data
+        response = test_client.get(f"{url}?offset=0&limit=5",
+                                   headers=OIDC_credentials.headerToken)
+        assert response.status_code == 200
+        assert response.data == full[:5]
+        assert response.headers["Next-Offset"] == str(min(5, len(full)))
+
+        response = test_client.get(f"{url}?offset={response.headers['Next-Offset']}",
+                                   headers=OIDC_credentials.headerToken)
+        assert response.data == full[5:]
+        assert response.headers["Next-Offset"] == str(len(full))
+
+        response = test_client.get(f"{url}?tail=1",
+                                   headers=OIDC_credentials.headerToken)
+        assert response.data == b"".join(full.splitlines(keepends=True)[-1:])
+        assert response.headers["Next-Offset"] == str(len(full))
+
+        response = test_client.get(f"{url}?tail=1&offset=0",
+                                   headers=OIDC_credentials.headerToken)
+        assert response.status_code == 400
+
+    @pytest.mark.integration
+    def test_get_run_not_modified(self,
+                                  test_client,
+                                  test_run,
+                                  OIDC_credentials):
+        for url in [f"/ga4gh/wes/v1/runs/{test_run.id}",
+                    f"/ga4gh/wes/v1/runs/{test_run.id}/status"]:
+            response = test_client.get(url, headers=OIDC_credentials.headerToken)
+            assert response.status_code == 200
+            etag = response.headers["ETag"]
+            assert etag.startswith(f'"{test_run.id}-')
+
+            response = test_client.get(url, headers={**OIDC_credentials.headerToken,
+                                                     "If-None-Match": etag})
+            assert response.status_code == 304
+            assert response.headers["ETag"] == etag
+            assert response.data == b""
+
+            response = test_client.get(url, headers={**OIDC_credentials.headerToken,
+                                                     "If-None-Match": '"outdated"'})
+            assert response.status_code == 200
+
 
 class TestExceptionError:
 
@@ -688,8 +815,10 @@ class TestExceptionError:
         # fails to get run status
         self.raise_error(test_client, f"/ga4gh/wes/v1/runs/{run_id}/status", OIDC_credentials)
 
-        # fails to get serviceInfo
-        self.raise_error(test_client, "/ga4gh/wes/v1/service-info", OIDC_credentials)
+        # serviceInfo does not use the manager (the runs are updated by the update_runs task)
+        response = test_client.get("/ga4gh/wes/v1/service-info",
+                                   headers=OIDC_credentials.headerToken)
+        assert response.status_code == 200
 
         # fails to list runs
         self.raise_error(test_client, "/ga4gh/wes/v1/runs", OIDC_credentials)
@@ -0,0 +1,31 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+import pytest
+
+from weskit.utils import read_file_range, read_file_tail
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "stdout"
+    path.write_bytes(b"first\nsecond\nthird\n")
+    return path
+
+
+def test_read_file_range(log_file):
+    assert read_file_range(log_file, 0, 5) == (b"first", 5)
+    assert read_file_range(log_file, 6, 100) == (b"second\nthird\n", 19)
+    assert read_file_range(log_file, 19, 100) == (b"", 19)
+
+
+def test_read_file_tail(log_file):
+    assert read_file_tail(log_file, 1, 100) == (b"third\n", 19)
+    assert read_file_tail(log_file, 2, 100, chunk_size=4) == (b"second\nthird\n", 19)
+    assert read_file_tail(log_file, 10, 100) == (b"first\nsecond\nthird\n", 19)
+    # At most `limit` bytes are read, even if that is not a complete line.
+    assert read_file_tail(log_file, 2, 8) == (b"d\nthird\n", 19)
+
+    log_file.write_bytes(b"first\nsecond")
+    assert read_file_tail(log_file, 1, 100) == (b"second", 12)
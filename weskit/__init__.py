@@ -9,12 +9,13 @@ import os
 import sys
 from logging.config import dictConfig
 from pathlib import Path
-from typing import cast
+from typing import cast, List, Union
 
 import yaml
 from celery import Celery
 from flask_cors import CORS
 
+from weskit.api.DrsUrlResolver import DrsUrlResolver
 from weskit.api.RunRequestValidator import RunRequestValidator
 from weskit.api.wes import bp as wes_bp
 from weskit.classes.Database import Database
@@ -22,6 +23,8 @@ from weskit.classes.EngineExecutorType import EngineExecutorType
 from weskit.classes.ErrorCodes import ErrorCodes
 from weskit.classes.Manager import Manager
 from weskit.classes.PathContext import PathContext
+from weskit.classes.RunStageEvents import RunStageEventStreams
+from weskit.api.ResponseCompression import ResponseCompression
 from weskit.api.ServiceInfo import ServiceInfo
 from weskit.classes.WESApp import WESApp
 from weskit.classes.WorkflowEngineFactory import WorkflowEngineFactory
@@ -31,15 +34,22 @@ from weskit.utils import create_validator
 logger = logging.getLogger(__name__)
 
 
-def read_swagger():
-    """Read the swagger file."""
+def read_swagger_header():
+    """
+    Read the top-level fields of the swagger file (e.g. "info" with the API version), but not the
+    large "paths" and "definitions" sections, which are not needed by the server.
+    """
     # This is hardcoded, because if it is changed, probably also quite some
     # code needs to be changed.
     swagger_file = "weskit/api/workflow_execution_service_1.0.0.yaml"
+    header = []
     with open(swagger_file, "r") as yaml_file:
-        swagger = yaml.safe_load(yaml_file)
+        for line in yaml_file:
+            if line.startswith("paths:"):
+                break
+            header.append(line)
 
-    return swagger
+    return yaml.safe_load("".join(header))
 
 
 def create_database(database_url=None) -> Database:
@@ -51,6 +61,70 @@ def create_database(database_url=None) -> Database:
     return Database(database_url, "WES")
 
 
+def validate_config(config: dict) -> Union[dict, List[str]]:
+    """
+    Validate the WESkit configuration against the validation specification (by default
+    `config/validation.yaml`, or WESKIT_VALIDATION_CONFIG). Return the normalized config (with
+    default values set) or a list of error messages.
+    """
+    validation_config_file = Path(os.getenv(
+        "WESKIT_VALIDATION_CONFIG",
+        os.path.join("config", "validation.yaml"))).absolute()
+
+    with open(validation_config_file, "r") as yaml_file:
+        validation = yaml.safe_load(yaml_file)
+        logger.debug("Read validation specification from " +
+                     str(validation_config_file))
+
+    return create_validator(validation)(config)
+
+
+def create_manager(celery: Celery,
+                   database: Database,
+                   config: dict) -> Manager:
+    """
+    Create the Manager from the validated configuration and the WESKIT_WORKFLOWS,
+    WESKIT_SINGULARITY_CONTAINERS, and WESKIT_DATA environment variables. This is used by the
+    REST server, but also by Celery tasks that need to process runs (e.g. update_runs).
+    """
+    workflows_base_dir = Path(os.getenv(
+        "WESKIT_WORKFLOWS",
+        os.path.join(os.getcwd(), "workflows"))).absolute()
+
+    singularity_containers_base_dir = Path(os.getenv(
+        "WESKIT_SINGULARITY_CONTAINERS",
+        os.path.join(os.getcwd(), "singularity_containers"))).absolute()
+
+    weskit_data = Path(os.getenv("WESKIT_DATA", "./tmp")).absolute()
+
+    container_context = PathContext(data_dir=weskit_data,
+                                    workflows_dir=workflows_base_dir,
+                                    singularity_containers_dir=singularity_containers_base_dir)
+
+    executor_type = EngineExecutorType.from_string(config["executor"]["type"])
+    if executor_type.needs_login_credentials:
+        executor_context = PathContext(data_dir=config["executor"]["remote_data_dir"],
+                                       workflows_dir=config["executor"]["remote_workflows_dir"],
+                                       singularity_containers_dir=config["executor"]
+                                       ["singularity_containers_dir"])
+    else:
+        executor_context = container_context
+
+    return Manager(celery_app=celery,
+                   database=database,
+                   config=config,
+                   workflow_engines=WorkflowEngineFactory.
+                   create(config["workflow_engines"], executor_context),
+                   weskit_context=container_context,
+                   executor_context=executor_context,
+                   require_workdir_tag=config["require_workdir_tag"],
+                   async_preparation=config["async_preparation"],
+                   max_attachment_size=config["max_attachment_size"],
+                   extract_attachment_archive=config["extract_attachment_archive"],
+                   deduplicate_attachments=config["deduplicate_attachments"],
+                   task_event_updates=config["task_event_updates"])
+
+
 def create_app(celery: Celery,
                database: Database) -> WESApp:
     logger.info(f"Process ID (create_app) = {os.getpid()}")
@@ -64,18 +138,6 @@ def create_app(celery: Celery,
         "WESKIT_LOG_CONFIG",
         os.path.join("config", "log-config.yaml"))).absolute()
 
-    validation_config_file = Path(os.getenv(
-        "WESKIT_VALIDATION_CONFIG",
-        os.path.join("config", "validation.yaml"))).absolute()
-
-    workflows_base_dir = Path(os.getenv(
-        "WESKIT_WORKFLOWS",
-        os.path.join(os.getcwd(), "workflows"))).absolute()
-
-    singularity_containers_base_dir = Path(os.getenv(
-        "WESKIT_SINGULARITY_CONTAINERS",
-        os.path.join(os.getcwd(), "singularity_containers"))).absolute()
-
     weskit_data = Path(os.getenv("WESKIT_DATA", "./tmp")).absolute()
 
     request_validation_config = \
@@ -90,16 +152,11 @@ def create_app(celery: Celery,
         config = yaml.safe_load(yaml_file)
         logger.info("Read config from " + str(config_file))
 
-    with open(validation_config_file, "r") as yaml_file:
-        validation = yaml.safe_load(yaml_file)
-        logger.debug("Read validation specification from " +
-                     str(validation_config_file))
-
     with open(request_validation_config, "r") as yaml_file:
         request_validation = yaml.safe_load(yaml_file)
 
     # Validate configuration YAML.
-    validation_result = create_validator(validation)(config)
+    validation_result = validate_config(config)
     if isinstance(validation_result, list):
         logger.error(f"Could not validate '{config_file}': %s" % validation_result)
         sys.exit(ErrorCodes.CONFIGURATION_ERROR.value)
@@ -107,34 +164,13 @@ def create_app(celery: Celery,
         # The validation result contains the normalized config (with default values set).
         config = validation_result
 
-    container_context = PathContext(data_dir=weskit_data,
-                                    workflows_dir=workflows_base_dir,
-                                    singularity_containers_dir=singularity_containers_base_dir)
-
-    executor_type = EngineExecutorType.from_string(config["executor"]["type"])
-    if executor_type.needs_login_credentials:
-        executor_context = PathContext(data_dir=config["executor"]["remote_data_dir"],
-                                       workflows_dir=config["executor"]["remote_workflows_dir"],
-                                       singularity_containers_dir=config["executor"]
-                                       ["singularity_containers_dir"])
-    else:
-        executor_context = container_context
-
     # Insert the "celery" section from the configuration file into the Celery config.
     celery.conf.update(**config.get("celery", {}))
-    manager = \
-        Manager(celery_app=celery,
-                database=database,
-                config=config,
-                workflow_engines=WorkflowEngineFactory.
-                create(config["workflow_engines"], executor_context),
-                weskit_context=container_context,
-                executor_context=executor_context,
-                require_workdir_tag=config["require_workdir_tag"])
+    manager = create_manager(celery, database, config)
 
     service_info = ServiceInfo(config["static_service_info"],
                                config["workflow_engines"],
-                               read_swagger(),
+                               read_swagger_header(),
                                database)
 
     # Create validators for each of the request types in the
@@ -152,6 +188,8 @@ def create_app(celery: Celery,
                  service_info=service_info,
                  request_validators=request_validators,
                  log_config=log_config,
+                 run_stage_event_streams=RunStageEventStreams(database, **config["run_events"]),
+                 drs_url_resolver=DrsUrlResolver.from_config(config["drs"]),
                  logger=logger)
     print(app.manager)
 
@@ -161,6 +199,9 @@ def create_app(celery: Celery,
     if config["cors"]["enabled"]:
         CORS(app)
 
+    if config["response_compression"]["enabled"]:
+        ResponseCompression(min_size=config["response_compression"]["min_size"]).init_app(app)
+
     OIDCFactory.setup(app, config)
 
     return app
@@ -6,66 +6,182 @@ from __future__ import annotations
 
 import json
 import logging
-import os
 import socket
-import re
-import requests
-from copy import deepcopy
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from json import JSONDecodeError
-from os.path import normpath, commonprefix
-from pathlib import Path
-from typing import List, Optional, Dict, Callable, TypeVar, Union, Any
+from typing import Callable, Dict, List, Optional, Set, Tuple
 from urllib.parse import urlparse
 
-from werkzeug.datastructures import FileStorage, ImmutableMultiDict
+import requests
+from requests.adapters import HTTPAdapter
+
+from weskit.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+
+class DrsUrlResolver:
+    """
+    Replace the drs:// URIs in the (whitespace-separated) values of the workflow_params by access
+    URLs from the DRS servers.
+
+    The distinct DRS objects of a request are resolved concurrently (at most `max_workers` at a
+    time) over a pooled HTTP session, with a (connect, read) `timeout` per request. The access
+    URLs are cached for `cache_ttl` seconds (e.g. to not exceed the validity of signed URLs) for
+    at most `cache_size` DRS URIs, evicting the least recently used ones.
+    """
+
+    def __init__(self,
+                 max_workers: int = 16,
+                 timeout: Tuple[float, float] = (5.0, 30.0),
+                 cache_ttl: float = 300.0,
+                 cache_size: int = 10000,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._clock = clock
+        self._cache: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._local_addresses: Optional[Set[str]] = None
 
-logger = logging.Logger(__file__)
+    @property
+    def session(self) -> requests.Session:
+        # Created lazily, such that no connections are shared with forked (uWSGI) workers.
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.max_workers,
+                                      pool_maxsize=self.max_workers)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
 
+    @property
+    def local_addresses(self) -> Set[str]:
+        if self._local_addresses is None:
+            local_addresses = {"localhost", "127.0.0.1"}
+            try:
+                local_addresses.add(socket.gethostbyname(socket.gethostname()))
+            except OSError as e:
+                logger.warning(f"Could not determine the IP address of this host: {e}")
+            self._local_addresses = local_addresses
+        return self._local_addresses
 
+    def _cached(self, drs_uri: str) -> Optional[str]:
+        with self._lock:
+            entry = self._cache.get(drs_uri)
+            if entry is None:
+                return None
+            expires_at, access_url = entry
+            if expires_at <= self._clock():
+                del self._cache[drs_uri]
+                return None
+            self._cache.move_to_end(drs_uri)
+            return access_url
 
-def drsUrlResolver(data):
-    parse_result = json.loads(data["workflow_params"])
-    for param in parse_result:
-        input_objs = []
-        for input_obj in parse_result[param].split():
-            parsed_url = urlparse(input_obj)
+    def _cache_access_url(self, drs_uri: str, access_url: str) -> None:
+        with self._lock:
+            self._cache[drs_uri] = (self._clock() + self.cache_ttl, access_url)
+            self._cache.move_to_end(drs_uri)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
 
-            if parsed_url.scheme != "drs":
-                input_objs.append(input_obj)
+    @staticmethod
+    def _drs_api_url(hostname: str, port: Optional[int], endpoint: str) -> str:
+        netloc = hostname if port is None else f"{hostname}:{port}"
+        return f"http://{netloc}/ga4gh/drs/v1/{endpoint}"
+
+    def _fetch_access_url(self, drs_uri: str) -> str:
+        parsed_url = urlparse(drs_uri)
+        hostname = str(parsed_url.hostname)
+        drs_id = parsed_url.path
+        try:
+            response = self.session.get(
+                self._drs_api_url(hostname, parsed_url.port, "objects") + drs_id,
+                timeout=self.timeout)
+            response.raise_for_status()
+            access_methods = response.json()["access_methods"]
+            if hostname in self.local_addresses or access_methods[0]["type"] == "s3":
+                return access_methods[0]["access_url"]["url"]
+            else:
+                file_access_id = access_methods[1]["access_id"]
+                return self._drs_api_url(hostname, parsed_url.port, "stream") + \
+                    drs_id + "/" + file_access_id
+        except (requests.RequestException, ValueError, LookupError, TypeError) as e:
+            raise ClientError(f"Could not resolve DRS URI '{drs_uri}': {e}") from e
+
+    def resolve_all(self, drs_uris: Set[str]) -> Dict[str, str]:
+        """
+        Return the access URLs of the DRS URIs. Raises a ClientError, if any DRS URI cannot be
+        resolved.
+        """
+        access_urls: Dict[str, str] = {}
+        unresolved: List[str] = []
+        for drs_uri in drs_uris:
+            access_url = self._cached(drs_uri)
+            if access_url is None:
+                unresolved.append(drs_uri)
             else:
+                access_urls[drs_uri] = access_url
+
+        if len(unresolved) == 1:
+            fetched = [self._fetch_access_url(unresolved[0])]
+        elif len(unresolved) > 1:
+            logger.debug(f"Resolving {len(unresolved)} DRS URIs")
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unresolved))) as pool:
+                fetched = list(pool.map(self._fetch_access_url, unresolved))
+        else:
+            fetched = []
+
+        for drs_uri, access_url in zip(unresolved, fetched):
+            self._cache_access_url(drs_uri, access_url)
+            access_urls[drs_uri] = access_url
+        return access_urls
+
+    @staticmethod
+    def from_config(config: dict) -> DrsUrlResolver:
+        """
+        Create the resolver from the "drs" section of the WESkit configuration.
+        """
+        return DrsUrlResolver(max_workers=config["max_workers"],
+                              timeout=(config["connect_timeout"], config["read_timeout"]),
+                              cache_ttl=config["cache_ttl"],
+                              cache_size=config["cache_size"])
+
+    def resolve(self, data: dict) -> dict:
+        """
+        Resolve the DRS URIs in the workflow_params of the run request. Requests without DRS URIs
+        (or without valid workflow_params, which are reported by the validation) are returned
+        unchanged.
+        """
+        workflow_params = data.get("workflow_params")
+        if not isinstance(workflow_params, str) or "drs://" not in workflow_params:
+            return data
+        try:
+            parse_result = json.loads(workflow_params)
+        except JSONDecodeError:
+            return data
+        if not isinstance(parse_result, dict):
+            return data
+
+        split_values = {param: value.split()
+                        for param, value in parse_result.items()
+                        if isinstance(value, str)}
+        drs_uris = {input_obj
+                    for input_objs in split_values.values()
+                    for input_obj in input_objs
+                    if urlparse(input_obj).scheme == "drs"}
+        access_urls = self.resolve_all(drs_uris)
 
-                ##drs object url
-                drs_hostname = parsed_url.hostname
-                drs_port = parsed_url.port
-                drs_id = parsed_url.path
-                drs_objects_path ="objects"
-                ga4gh_drs_base_url = "http://" + drs_hostname + ":{}/ga4gh/{}/v1/{}"
-                drs_object_url = ga4gh_drs_base_url.format(drs_port,"drs", drs_objects_path)
-                http_method = "GET"
-                request_url = drs_object_url + drs_id
-
-
-                drs_obj = requests.request(http_method, request_url)
-                if drs_hostname in ['localhost', '127.0.0.1', socket.gethostbyname(socket.gethostname())]:
-                    access_methods = drs_obj.json()["access_methods"]
-                    access_url = access_methods[0]["access_url"]["url"]
-                    input_objs.append(access_url)
-
-                else:
-                    access_methods = drs_obj.json()["access_methods"]
-                    if access_methods[0]["type"] == 's3':
-                        access_url = access_methods[0]["access_url"]["url"]
-                        input_objs.append(access_url)
-                    else:
-                        print(access_methods)
-                        file_access_id = access_methods[1]["access_id"]
-                        drs_streaming_url = ga4gh_drs_base_url.format(drs_port,"drs", "stream") + drs_id + "/" +file_access_id
-                        input_objs.append(drs_streaming_url)
-                    
-        parse_result[param] = " ".join(input_objs)
-    data["workflow_params"] = json.dumps(parse_result)
-    return data
-
-
-    
-# drsUrlResolver()
\ No newline at end of file
+        for param, input_objs in split_values.items():
+            parse_result[param] = " ".join(access_urls.get(input_obj, input_obj)
+                                           for input_obj in input_objs)
+        data["workflow_params"] = json.dumps(parse_result)
+        return data
@@ -2,18 +2,33 @@
 #
 # SPDX-License-Identifier: MIT
 
+import json
 import logging
-from typing import Optional
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Mapping, Optional, Tuple, Union
+from uuid import UUID
+
+from flask import Response, jsonify, make_response, send_file, stream_with_context
+from werkzeug.datastructures import ETags, MIMEAccept
 
 from weskit.api.RunRequestValidator import RunRequestValidator
+from weskit.classes.Database import DEFAULT_PAGE_SIZE
 from weskit.classes.Run import Run
+from weskit.classes.RunStageEvents import RunStageEvent
 from weskit.api.RunStatus import RunStatus
 from weskit.classes.WESApp import WESApp
 from weskit.exceptions import ClientError
 from weskit.oidc.User import User
+from weskit.utils import read_file_range, read_file_tail
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of bytes returned by a single request for a part of a log.
+MAX_LOG_CHUNK_SIZE = 1024 * 1024
+
+# Maximum number of run requests in a single batch submission.
+MAX_BATCH_SIZE = 1000
+
 
 class Helper:
     """
@@ -49,40 +64,268 @@ class Helper:
 
         return None
 
-    def get_log_response(self, run_id: str, log_name: str):
+    def get_log_response(self,
+                         run_id: str,
+                         log_name: str,
+                         args: Optional[Mapping[str, str]] = None,
+                         accept: Optional[MIMEAccept] = None):
         """
-        Safe access to "stderr" or "stdout" (= log_name) data.
+        Safe access to "stderr" or "stdout" (= log_name) data. Without query parameters, the
+        complete log of a completed run is returned. If the client `accept`s "text/plain" (rather
+        than "application/json"), the log file is streamed as plain text. Otherwise, the lines of
+        the log are returned in the "content" field of a JSON object, as by earlier versions.
+
+        With `offset` (and optionally `limit`) or `tail` query parameters only a part of the log
+        is returned, also while the run is still running. See `get_log_part_response`.
         """
         manager = self.app.manager
-        run = manager.get_run(run_id)
+        run = manager.get_current_run(run_id)
         if run is None:
             raise RuntimeError(f"Could not find run with identifier {run_id}")
-        else:
-            run = manager.update_run(run)
         access_denied_response = self.get_access_denied_response(run_id, run)
 
         if access_denied_response is None:
+            if args is not None and \
+                    any(name in args for name in ["offset", "limit", "tail"]):
+                return self.get_log_part_response(run, log_name, args)
+
             run_ga4gh_status = RunStatus.from_stage(run.processing_stage)
             if run_ga4gh_status is not RunStatus.COMPLETE:
                 return {"msg": "Run '%s' is not in COMPLETED state" % run_id,
                         "status_code": 409
                         }, 409     # CONFLICT (with current resource state)
             else:
-                return {"content": getattr(run, log_name)}, 200
+                log_file = getattr(run, log_name)
+                run_dir = run.run_dir(manager.weskit_context)
+                if log_file is None or run_dir is None:
+                    return {"msg": f"No {log_name} for run '{run_id}'",
+                            "status_code": 404
+                            }, 404     # NOT FOUND
+                log_path = run_dir / log_file["path"]
+                if accept is not None and \
+                        accept.best_match(["application/json", "text/plain"]) == "text/plain":
+                    # Stream the file in chunks, rather than loading it into memory.
+                    return send_file(log_path, mimetype="text/plain", max_age=0)
+                else:
+                    with open(log_path, "r", errors="replace") as f:
+                        return {"content": f.read().splitlines()}, 200
         else:
             return access_denied_response
 
+    def get_log_part_response(self, run: Run, log_name: str, args: Mapping[str, str]):
+        """
+        Return at most `limit` bytes of the log starting at byte `offset`, or the last `tail`
+        lines of the log. Only the requested part of the file is read. The "Next-Offset" header
+        contains the offset from which to continue reading. Clients can thus poll for new log
+        content of a running workflow with this offset, and only new bytes are transferred.
+
+        As long as there is no log file (e.g. the run is still queued), the response is empty.
+        """
+        offset, limit, tail = self.get_log_part_parameters(args)
+        log_path = self._log_path(run, log_name)
+        if log_path is None or not log_path.is_file():
+            data, next_offset = b"", offset
+        elif tail is not None:
+            data, next_offset = read_file_tail(log_path, tail, limit)
+        else:
+            data, next_offset = read_file_range(log_path, offset, limit)
+
+        response = make_response(data, 200)
+        response.mimetype = "text/plain"
+        response.headers["Next-Offset"] = str(next_offset)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def _log_path(self, run: Run, log_name: str) -> Optional[Path]:
+        context = self.app.manager.weskit_context
+        log_file = getattr(run, log_name)
+        if log_file is not None:
+            run_dir = run.run_dir(context)
+            return run_dir / log_file["path"] if run_dir is not None else None
+        # No reference yet, because the run is not finished. The run's start time determines the
+        # log directory (see run_command).
+        return run.stdout_file(context) if log_name == "stdout" else run.stderr_file(context)
+
+    def get_log_part_parameters(self, args: Mapping[str, str]) \
+            -> Tuple[int, int, Optional[int]]:
+        """
+        Offset, limit (in bytes), and number of tail lines for reading a part of a log from the
+        request's query parameters. Larger limits than `MAX_LOG_CHUNK_SIZE` are reduced to that
+        size.
+        """
+        offset = self._non_negative_int_parameter(args, "offset")
+        limit = self._non_negative_int_parameter(args, "limit")
+        tail = self._non_negative_int_parameter(args, "tail")
+        if tail is not None and offset is not None:
+            raise ClientError("Only one of 'offset' and 'tail' may be given")
+        if limit is not None and limit < 1:
+            raise ClientError(f"Invalid limit: '{limit}'")
+        return (offset if offset is not None else 0,
+                min(limit, MAX_LOG_CHUNK_SIZE) if limit is not None else MAX_LOG_CHUNK_SIZE,
+                tail)
+
+    @staticmethod
+    def _non_negative_int_parameter(args: Mapping[str, str], name: str) -> Optional[int]:
+        value = args.get(name, None)
+        if value is None:
+            return None
+        try:
+            number = int(value)
+        except ValueError:
+            raise ClientError(f"Invalid {name}: '{value}'")
+        if number < 0:
+            raise ClientError(f"Invalid {name}: '{value}'")
+        return number
+
+    def get_page_parameters(self, args: Mapping[str, str]) -> Tuple[int, Optional[str]]:
+        """
+        Page size and page token for listing runs from the request's query parameters. Larger page
+        sizes than the default are reduced to the default.
+        """
+        page_size = args.get("page_size", None)
+        if page_size is None:
+            return DEFAULT_PAGE_SIZE, args.get("page_token", None)
+        try:
+            size = int(page_size)
+        except ValueError:
+            raise ClientError(f"Invalid page size: '{page_size}'")
+        if size < 1:
+            raise ClientError(f"Invalid page size: '{page_size}'")
+        return min(size, DEFAULT_PAGE_SIZE), args.get("page_token", None)
+
+    def assert_run_request_batch(self, data: Any):
+        if not isinstance(data, list):
+            raise ClientError("Malformed request: JSON array of run requests expected")
+        if len(data) > MAX_BATCH_SIZE:
+            raise ClientError(f"Too many run requests: {len(data)} > {MAX_BATCH_SIZE}")
+
+    def normalize_batch_run_request(self, item: Any) -> Dict[str, Any]:
+        """
+        Convert a run request from a batch into the form of a single run request, in which
+        the JSON fields are JSON strings.
+        """
+        if not isinstance(item, dict):
+            raise ClientError("JSON object expected")
+        if "workflow_params" not in item:
+            raise ClientError("Missing 'workflow_params'")
+        return {key: json.dumps(value)
+                if key in ["workflow_params", "workflow_engine_parameters", "tags"] and
+                not isinstance(value, str) else value
+                for key, value in item.items()}
+
     def assert_user_id(self, user_id: str):
         msg = RunRequestValidator.invalid_user_id(user_id)
         if msg:
             raise ClientError("Syntactically invalid user ID: '%s'" % user_id)
 
+    def get_current_run(self,
+                        run_id: str,
+                        if_none_match: ETags) -> Tuple[Optional[Run], Optional[Response]]:
+        """
+        Return the current run (see `Manager.get_current_run`), or a 304 (NOT MODIFIED) response
+        instead, if the client's `If-None-Match` contains the ETag of the current version of the
+        user's run.
+
+        With `task_event_updates`, the runs in the database are current, and only the version of
+        the run is read for the comparison, so unchanged runs are not serialized. Otherwise, the
+        run is updated from the Celery result backend first, such that revalidating clients also
+        see the state changes.
+        """
+        manager = self.app.manager
+        if not manager.task_event_updates:
+            run = manager.get_current_run(run_id)
+            if run is not None and run.user_id == self.user.id:
+                return run, self._not_modified_response(run_id, run.db_version, if_none_match)
+            return run, None
+        elif if_none_match:
+            version = manager.database.get_run_version(UUID(run_id))
+            if version is not None and version["user_id"] == self.user.id:
+                not_modified_response = self._not_modified_response(run_id,
+                                                                    version["db_version"],
+                                                                    if_none_match)
+                if not_modified_response is not None:
+                    return None, not_modified_response
+        return manager.get_run(run_id), None
+
+    @staticmethod
+    def _not_modified_response(run_id: str,
+                               db_version: int,
+                               if_none_match: ETags) -> Optional[Response]:
+        if not if_none_match:
+            return None
+        etag = run_etag(run_id, db_version)
+        # Weak comparison, because compressed responses have weak ETags (see ResponseCompression).
+        if not if_none_match.contains_weak(etag):
+            return None
+        response = make_response("", 304)
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response
+
+    def get_run_events_response(self):
+        """
+        A server-sent events (SSE) stream of the state changes of the user's runs. The stream
+        ends after a few minutes; clients (e.g. EventSource) reconnect automatically. If the
+        maximum number of streams is open, the request is answered with 503 (Service Unavailable).
+        """
+        streams = self.app.run_stage_event_streams
+        events = streams.open(self.user.id)
+        if events is None:
+            logger.warning(f"Maximum of {streams.max_streams} run event streams reached")
+            return {"msg": "Too many open run event streams. Retry later.",
+                    "status_code": 503
+                    }, 503, {"Retry-After": str(int(streams.heartbeat_interval))}
+        response = self.app.response_class(stream_with_context(run_event_messages(events)),
+                                           mimetype="text/event-stream")
+        # Called by the WSGI server, when the stream ends or the client disconnects.
+        response.call_on_close(events.close)
+        response.cache_control.no_cache = True
+        # Do not buffer the stream in reverse proxies (nginx).
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
     def assert_run_id_syntax(self, run_id: str):
         msg = RunRequestValidator.invalid_run_id(run_id)
         if msg:
             raise ClientError("Syntactically invalid run ID: '%s'" % run_id)
 
 
+def run_etag(run_id: Union[str, UUID], db_version: int) -> str:
+    """
+    The ETag of a run representation. The db_version changes with every modification of the run.
+    """
+    return f"{run_id}-{db_version}"
+
+
+def run_response(run: Run, body: dict) -> Response:
+    """
+    A JSON response with the ETag of the run. Clients need to revalidate (see
+    `Helper.get_current_run`), because the run changes while it is processed.
+    """
+    response = jsonify(body)
+    response.set_etag(run_etag(run.id, run.db_version))
+    response.cache_control.no_cache = True
+    return response
+
+
+def run_event_messages(events: Iterable[Optional[RunStageEvent]]) -> Iterator[str]:
+    """
+    Format the run stage events as server-sent event messages with "run_id", "state" and
+    "db_version". Missing events are sent as comments, to keep the connection alive.
+    """
+    yield "retry: 1000\n\n"
+    for event in events:
+        if event is None:
+            yield ": keep-alive\n\n"
+        else:
+            data = json.dumps({"run_id": str(event.run_id),
+                               "state": RunStatus.from_stage(event.processing_stage).name,
+                               "db_version": event.db_version})
+            yield f"id: {run_etag(event.run_id, event.db_version)}\n" \
+                  f"event: state\n" \
+                  f"data: {data}\n\n"
+
+
 def run_log(run: Run) -> dict:
     run_ga4gh_status = RunStatus.from_stage(run.processing_stage).name
     return {
@@ -0,0 +1,81 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+import gzip
+import logging
+from typing import Callable, Dict, Optional
+
+from flask import Flask, Response, request
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None   # type: ignore
+
+logger = logging.getLogger(__name__)
+
+
+def _gzip(data: bytes) -> bytes:
+    # A medium compression level. Higher levels cost a lot of CPU for little gain on JSON.
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _zstd(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+class ResponseCompression:
+    """
+    Compress responses with the best encoding accepted by the client (zstd if the zstandard
+    package is installed, or gzip). Only JSON and text responses with at least `min_size` bytes
+    are compressed. Streamed responses (e.g. whole log files) are left as they are.
+
+    Compressed responses get weak ETags, because they are not byte-identical to the uncompressed
+    representation. ETags are compared weakly for `If-None-Match`, so conditional requests still
+    work.
+    """
+
+    def __init__(self,
+                 min_size: int = 1024) -> None:
+        self.min_size = min_size
+        self.encoders: Dict[str, Callable[[bytes], bytes]] = {}
+        if zstandard is not None:
+            self.encoders["zstd"] = _zstd
+        self.encoders["gzip"] = _gzip
+
+    def init_app(self, app: Flask) -> None:
+        app.after_request(self.compress)
+
+    @staticmethod
+    def _is_compressible(response: Response) -> bool:
+        mimetype = response.mimetype or ""
+        return mimetype == "application/json" or mimetype.startswith("text/")
+
+    def _encoding(self) -> Optional[str]:
+        return request.accept_encodings.best_match(list(self.encoders.keys()))
+
+    def compress(self, response: Response) -> Response:
+        if response.status_code < 200 or \
+                response.status_code in (204, 206, 304) or \
+                response.direct_passthrough or \
+                response.is_streamed or \
+                "Content-Encoding" in response.headers or \
+                not self._is_compressible(response):
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = self._encoding()
+        if encoding is None:
+            return response
+
+        response.set_data(self.encoders[encoding](data))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
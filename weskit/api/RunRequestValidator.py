@@ -8,11 +8,10 @@ import json
 import logging
 import os
 import re
-from copy import deepcopy
 from json import JSONDecodeError
 from os.path import normpath, commonprefix
 from pathlib import Path
-from typing import List, Optional, Dict, Callable, TypeVar, Union, Any
+from typing import List, Optional, Dict, Callable, TypeVar, Union, Any, Tuple
 from urllib.parse import urlparse
 
 from werkzeug.datastructures import FileStorage, ImmutableMultiDict
@@ -46,13 +45,20 @@ class RunRequestValidator(object):
         else:
             return []
 
+    # Run request fields with JSON dictionaries encoded as strings.
+    JSON_FIELDS = ["workflow_params", "workflow_engine_parameters", "tags"]
+
     def validate(self,
                  data: dict) \
             -> Union[dict, List[str]]:
         """Validate the overall structure, types and values of the run request
         fields. workflow_params and workflow_engine_parameters are not tested
         semantically but their structure is validated.
-        Either return the normalized data or a list of error messages."""
+        Either return the normalized data or a list of error messages.
+
+        In the normalized data, the JSON fields (see `JSON_FIELDS`) are decoded, such that they
+        do not need to be parsed again (see `Manager.submit_run`). The input data is not
+        modified."""
 
         T = TypeVar('T')
 
@@ -67,9 +73,10 @@ class RunRequestValidator(object):
         else:
             workflow_attachment_errors = []
 
-        # copy request data without "workflow_attachment"
-        request_data = deepcopy({x: data[x] for x in data if x != "workflow_attachment"})
-        logger.debug(f"Request w/o attachments to validate = {request_data}")
+        # Copy request data without "workflow_attachment". The values are not modified, so a
+        # shallow copy suffices.
+        request_data = {x: data[x] for x in data if x != "workflow_attachment"}
+        logger.debug("Request w/o attachments to validate = %s", request_data)
         syntax_validation_result = self._validate_and_normalize_syntax(request_data)
         stx_errors: List[str] = []
         if isinstance(syntax_validation_result, list):
@@ -83,22 +90,29 @@ class RunRequestValidator(object):
             normalized_data.get("workflow_type_version", None))   # not optional by standard
         url_errors = apply_if_not_none(normalized_data.get("workflow_url", None),
                                        self._validate_workflow_url)
-        workdir_tag_errors = self._validate_rundir_tag(
-            normalized_data.get("tags", None))
-        wep_errors = self._validate_params(normalized_data, "workflow_engine_parameters")
-        wp_errors = self._validate_params(normalized_data, "workflow_params")
+        wp_errors, workflow_params = \
+            self._parse_params(normalized_data, "workflow_params")
+        wep_errors, workflow_engine_parameters = \
+            self._parse_params(normalized_data, "workflow_engine_parameters")
+        tags_errors, tags = self._parse_params(normalized_data, "tags")
+        workdir_tag_errors = self._validate_rundir_tag(tags) if len(tags_errors) == 0 else []
 
         all_errors = stx_errors + wtnv_errors + url_errors + \
-            workdir_tag_errors + workflow_attachment_errors + \
+            workdir_tag_errors + tags_errors + workflow_attachment_errors + \
             wp_errors + wep_errors
 
         validation_result: Union[Dict[Any, Any], List[str]]
         if len(all_errors) > 0:
             validation_result = list(filter(lambda v: v != [] and v is not None, all_errors))
         else:
-            validation_result = normalized_data
-
-        logger.debug(f"Validation result = {validation_result}")
+            validation_result = dict(normalized_data)
+            validation_result["workflow_params"] = workflow_params
+            if workflow_engine_parameters is not None:
+                validation_result["workflow_engine_parameters"] = workflow_engine_parameters
+            if tags is not None:
+                validation_result["tags"] = tags
+
+        logger.debug("Validation result = %s", validation_result)
         return validation_result
 
     def _validate_and_normalize_syntax(self, data: dict) \
@@ -191,12 +205,11 @@ class RunRequestValidator(object):
 
         return result
 
-    def _validate_rundir_tag(self, tags) -> List[str]:
+    def _validate_rundir_tag(self, tags: Optional[Dict[str, Any]]) -> List[str]:
         try:
             if self.require_rundir_tag:
                 if tags is None:
                     return ["'run_dir' tag is required but tags field is missing"]
-                tags = json.loads(tags)
                 if "run_dir" not in tags.keys():
                     return ["'run_dir' tag is required and missing"]
                 parsed_url = urlparse(tags["run_dir"])
@@ -248,18 +261,23 @@ class RunRequestValidator(object):
         return []
 
     @staticmethod
-    def _validate_params(normalized_data: Dict[str, Any], field_name: str) -> List[str]:
+    def _parse_params(normalized_data: Dict[str, Any], field_name: str) \
+            -> Tuple[List[str], Optional[Dict[str, Any]]]:
+        """
+        Decode the JSON dictionary in the field. Return the errors and the decoded dictionary
+        (None, if the field is missing or invalid).
+        """
         params = normalized_data.get(field_name, None)
         if params is None:
-            return []
+            return [], None
         elif not isinstance(params, str):
-            return [f"{field_name} must be string with JSON dictionary"]
+            return [f"{field_name} must be string with JSON dictionary"], None
         else:
             try:
                 parse_result = json.loads(params)
             except JSONDecodeError as e:
-                return [f"JSON parse-error in {field_name}: {e.msg}"]
-            if isinstance(parse_result, Dict):
-                return []
+                return [f"JSON parse-error in {field_name}: {e.msg}"], None
+            if isinstance(parse_result, dict):
+                return [], parse_result
             else:
-                return [f"{field_name} must be string with JSON dictionary"]
+                return [f"{field_name} must be string with JSON dictionary"], None
@@ -61,6 +61,7 @@ class RunStatus(enum.Enum):
     def from_stage(stage: ProcessingStage) -> RunStatus:
         weskit_stage_to_status = {
                                     ProcessingStage.RUN_CREATED: RunStatus.INITIALIZING,
+                                    ProcessingStage.PREPARING: RunStatus.INITIALIZING,
                                     ProcessingStage.PREPARED_EXECUTION: RunStatus.INITIALIZING,
                                     ProcessingStage.SUBMITTED_EXECUTION: RunStatus.INITIALIZING,
                                     ProcessingStage.AWAITING_START: RunStatus.INITIALIZING,
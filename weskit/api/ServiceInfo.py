@@ -3,7 +3,12 @@
 # SPDX-License-Identifier: MIT
 
 import datetime
-from typing import Dict, List, Any
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from werkzeug.utils import cached_property
 
 from weskit.classes.Database import Database
 from weskit.classes.WorkflowEngineFactory import ConfParameters
@@ -14,17 +19,25 @@ from weskit.api.RunStatus import RunStatus
 class ServiceInfo:
     """Note that the static_service_info is not validated in here. External
     validation is required. ServiceInfo returns whatever it gets as static
-    service info."""
+    service info.
+
+    The system state counts are read from the database's materialized counters and cached
+    for `state_counts_ttl` seconds. All other fields of the service-info response only depend on
+    the configuration and are computed only once (see `response`)."""
     def __init__(self,
                  static_service_info: dict,
                  engines_config: dict,
                  swagger,
-                 database: Database):
+                 database: Database,
+                 state_counts_ttl: float = 5.0):
         self._static_service_info = static_service_info
         self._engine_configuration = engines_config
         self._db = database
         self._swagger = swagger
         self._metadata_separator = "|"
+        self._state_counts_ttl = state_counts_ttl
+        self._state_counts: Optional[Tuple[float, Dict[str, int]]] = None
+        self._response: Optional[Tuple[Dict[str, int], str, str]] = None
 
     def id(self) -> str:
         return self._static_service_info["id"]
@@ -128,15 +141,60 @@ class ServiceInfo:
         return result
 
     def system_state_counts(self) -> Dict[str, int]:
+        cached = self._state_counts
+        if cached is not None and time.monotonic() - cached[0] < self._state_counts_ttl:
+            return cached[1]
+        counts = self._read_system_state_counts()
+        self._state_counts = (time.monotonic(), counts)
+        return counts
 
-        counts_data: List[Any] = self._db.count_states()
-        counts: Dict = {status.name: 0 for status in RunStatus}
-        for counts_datum in counts_data:
-            status = RunStatus.from_stage(
-                stage=ProcessingStage.from_string(counts_datum["_id"]["processing_stage"]))
-            counts[status.name] += counts_datum["count"]
+    def _read_system_state_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {status.name: 0 for status in RunStatus}
+        stage: ProcessingStage
+        for stage, count in self._db.get_state_counts().items():
+            counts[RunStatus.from_stage(stage=stage).name] += count
         return counts
 
+    @property
+    def state_counts_ttl(self) -> float:
+        return self._state_counts_ttl
+
+    @cached_property
+    def static_response(self) -> Dict[str, Any]:
+        """
+        The fields of the service-info response that only depend on the configuration.
+
+        Note that there is a deviation between the Swagger file and the model reported at
+        https://ga4gh.github.io/workflow-execution-service-schemas/docs
+        This latter version seems to fit to no file in the repository (e.g. no "organization"
+        field is mentioned anywhere in the repository!). Furthermore, the Swagger is used to
+        autogenerate client APIs. Therefore, we consider the Swagger to represent the standard.
+        """
+        return {
+            "contact_info_url": self.contact_url(),
+            "workflow_type_versions": self.workflow_type_versions(),
+            "supported_wes_versions": self.supported_wes_versions(),
+            "supported_filesystem_protocols": self.supported_filesystem_protocols(),
+            "workflow_engine_versions": self.workflow_engine_versions(),
+            "default_workflow_engine_parameters": self.default_workflow_engine_parameters(),
+            "auth_instructions_url": self.auth_instructions_url(),
+            "tags": self.tags()
+        }
+
+    def response(self) -> Tuple[str, str]:
+        """
+        The JSON-serialized service-info response and its (strong) ETag. The JSON is only
+        serialized again, if the system state counts changed.
+        """
+        counts = self.system_state_counts()
+        cached = self._response
+        if cached is None or cached[0] != counts:
+            body = json.dumps({**self.static_response, "system_state_counts": counts},
+                              sort_keys=True)
+            cached = (counts, body, hashlib.sha256(body.encode("utf-8")).hexdigest())
+            self._response = cached
+        return cached[1], cached[2]
+
     def auth_instructions_url(self) -> str:
         return self._static_service_info["auth_instructions_url"]
 
@@ -8,14 +8,12 @@ from flask import Blueprint
 from flask import current_app, jsonify, request
 from flask_jwt_extended import current_user
 
-from weskit.api.Helper import Helper, run_log
+from weskit.api.Helper import Helper, run_log, run_response
 from weskit.exceptions import ClientError
 from weskit.oidc.Decorators import login_required
 from weskit.api.RunStatus import RunStatus
 from weskit.classes.ProcessingStage import ProcessingStage
 
-from weskit.api.DrsUrlResolver import drsUrlResolver
-
 bp = Blueprint("wes", __name__)
 
 
@@ -29,12 +27,14 @@ def GetRunLog(run_id):
     try:
         ctx = Helper(current_app, current_user)
         ctx.assert_run_id_syntax(run_id)
-        manager = current_app.manager
-        run = manager.update_run(manager.get_run(run_id))
+        run, not_modified_response = ctx.get_current_run(run_id, request.if_none_match)
+        if not_modified_response is not None:
+            return not_modified_response
+
         access_denied_response = ctx.get_access_denied_response(run_id, run)
 
         if access_denied_response is None:
-            return run_log(run), 200
+            return run_response(run, run_log(run)), 200
         else:
             return access_denied_response
 
@@ -80,15 +80,17 @@ def GetRunStatus(run_id):
     try:
         ctx = Helper(current_app, current_user)
         ctx.assert_run_id_syntax(run_id)
-        manager = current_app.manager
-        run = manager.update_run(manager.get_run(run_id))
+        run, not_modified_response = ctx.get_current_run(run_id, request.if_none_match)
+        if not_modified_response is not None:
+            return not_modified_response
+
         access_denied_response = ctx.get_access_denied_response(run_id, run)
 
         if access_denied_response is None:
-            return {
+            return run_response(run, {
                 "run_id": run_id,
                 "state": RunStatus.from_stage(run.processing_stage).name
-            }, 200
+            }), 200
         else:
             return access_denied_response
 
@@ -105,51 +107,14 @@ def GetRunStatus(run_id):
 def GetServiceInfo(*args, **kwargs):
     logger.info("GetServiceInfo")
     try:
-        current_app.manager.update_runs()
-        response = {
-            # Note that there is a deviation between the Swagger file and the model reported at
-            # https://ga4gh.github.io/workflow-execution-service-schemas/docs
-            # This latter version seems to fit to no file in the repository (e.g. no "organization"
-            # field is mentioned anywhere in the repository!). Furthermore, the Swagger is used to
-            # autogenerate client APIs. Therefore, we consider the Swagger to represent the
-            # standard
-
-            # "id":
-            #     current_app.service_info.id(),
-            # "name":
-            #     current_app.service_info.name(),
-            # "type":
-            #     current_app.service_info.type(),
-            # "description":
-            #     current_app.service_info.description(),
-            # "organization":
-            #     current_app.service_info.organization(),
-            # "documentationUrl":
-            #     current_app.service_info.documentation_url(),
-            "contact_info_url":
-                current_app.service_info.contact_url(),
-            # "createdAt":
-            #     rfc3339(current_app.service_info.created_at()),
-            # "updatedAt":
-            #     rfc3339(current_app.service_info.updated_at()),
-            "workflow_type_versions":
-                current_app.service_info.workflow_type_versions(),
-            "supported_wes_versions":
-                current_app.service_info.supported_wes_versions(),
-            "supported_filesystem_protocols":
-                current_app.service_info.supported_filesystem_protocols(),
-            "workflow_engine_versions":
-                current_app.service_info.workflow_engine_versions(),
-            "default_workflow_engine_parameters":
-                current_app.service_info.default_workflow_engine_parameters(),
-            "system_state_counts":
-                current_app.service_info.system_state_counts(),
-            "auth_instructions_url":
-                current_app.service_info.auth_instructions_url(),
-            "tags":
-                current_app.service_info.tags()
-        }
-        return response, 200
+        service_info = current_app.service_info
+        body, etag = service_info.response()
+        response = current_app.response_class(body, status=200, mimetype="application/json")
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = int(service_info.state_counts_ttl)
+        # Answer `If-None-Match` requests with the same ETag with 304 (NOT MODIFIED).
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(e, exc_info=True)
         raise e
@@ -161,16 +126,21 @@ def ListRuns(*args, **kwargs):
     logger.info("ListRuns")
     try:
         ctx = Helper(current_app, current_user)
-        current_app.manager.update_runs()
+        page_size, page_token = ctx.get_page_parameters(request.args)
+        run_infos, next_page_token = current_app.manager.database.\
+            list_run_ids_and_stages(ctx.user.id, page_size, page_token)
         runs = [{
             "run_id": str(run_info["id"]),
             "state": RunStatus.from_stage(ProcessingStage.from_string(
                 run_info["processing_stage"])).name
-        } for run_info in current_app.manager.database.list_run_ids_and_stages(ctx.user.id)]
+        } for run_info in run_infos]
         return jsonify({
             "runs": runs,
-            "next_page_token": ""
+            "next_page_token": next_page_token
         }), 200
+    except ClientError as e:
+        logger.warning(e, exc_info=True)
+        return {"msg": e.message, "status_code": 400}, 400
     except Exception as e:
         logger.error(e, exc_info=True)
         raise e
@@ -191,7 +161,7 @@ def RunWorkflow(*args, **kwargs):
             
         #DRS URL resolve
         
-        data = drsUrlResolver(data)
+        data = current_app.drs_url_resolver.resolve(data)
             
         validator = current_app.request_validators["run_request"]
         validation_result = validator.validate(data)
@@ -201,18 +171,10 @@ def RunWorkflow(*args, **kwargs):
                 "status_code": 400
             }, 400
         else:
-            run = current_app.manager.\
-                create_and_insert_run(validated_request=validation_result,
-                                      user_id=ctx.user.id)
-
-        logger.info("Preparing execution %s" % run.id)
-        run = current_app.manager.\
-            prepare_execution(run, files=request.files)
-        run = current_app.manager.database.update_run(run)
-
-        logger.info("Executing Workflow %s" % run.id)
-        run = current_app.manager.execute(run)
-        run = current_app.manager.database.update_run(run)
+            run = current_app.manager.submit_run(validation_result,
+                                                 user_id=ctx.user.id,
+                                                 files=request.files)
+            logger.info("Submitted run %s" % run.id)
 
         return {"run_id": run.id}, 200
 
@@ -224,16 +186,85 @@ def RunWorkflow(*args, **kwargs):
         raise e
 
 
+@bp.route("/weskit/v1/runs:batch", methods=["POST"])
+@login_required()
+def RunWorkflows(*args, **kwargs):
+    """
+    Submit many runs at once. The body is a JSON array of run requests with the same fields as
+    the form data of a single run request (but without attachments). The JSON fields
+    (e.g. "workflow_params") may be given as JSON strings or as JSON values.
+
+    The response contains a result for each request in the order of the requests: either the
+    "run_id" or the error "msg" and "status_code" of a request that could not be validated.
+    """
+    logger.info("RunWorkflows")
+    try:
+        ctx = Helper(current_app, current_user)
+        data = request.get_json(silent=True)
+        ctx.assert_run_request_batch(data)
+
+        validator = current_app.request_validators["run_request"]
+        results = [None] * len(data)
+        validated_requests = []
+        validated_indices = []
+        for index, item in enumerate(data):
+            try:
+                validation_result = validator.validate(
+                    current_app.drs_url_resolver.resolve(
+                        ctx.normalize_batch_run_request(item)))
+            except ClientError as e:
+                validation_result = [e.message]
+            if isinstance(validation_result, list):
+                results[index] = {"msg": "Malformed request: {}".format(validation_result),
+                                  "status_code": 400}
+            else:
+                validated_requests.append(validation_result)
+                validated_indices.append(index)
+
+        runs = current_app.manager.submit_runs(validated_requests, ctx.user.id)
+        for index, run in zip(validated_indices, runs):
+            results[index] = {"run_id": run.id}
+
+        return {"runs": results}, 200
+
+    except ClientError as e:
+        logger.warning(e, exc_info=True)
+        return {"msg": e.message, "status_code": 400}, 400
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        raise e
+
+
 @bp.route("/weskit/v1/runs", methods=["GET"])
 @login_required()
 def ListRunsExtended(*args, **kwargs):
     logger.info("ListRunsExtended")
     try:
         ctx = Helper(current_app, current_user)
-        current_app.manager.update_runs()
-        response = current_app.manager.database.\
-            list_run_ids_and_stages_and_times(ctx.user.id)
-        return jsonify(response), 200
+        page_size, page_token = ctx.get_page_parameters(request.args)
+        response, next_page_token = current_app.manager.database.\
+            list_run_ids_and_stages_and_times(ctx.user.id, page_size, page_token)
+        # The response is a plain list of runs. The token for the next page is in a header.
+        return jsonify(response), 200, {"Next-Page-Token": next_page_token}
+    except ClientError as e:
+        logger.warning(e, exc_info=True)
+        return {"msg": e.message, "status_code": 400}, 400
+    except Exception as e:
+        logger.error(e, exc_info=True)
+        raise e
+
+
+@bp.route("/weskit/v1/runs/events", methods=["GET"])
+@login_required()
+def GetRunEvents(*args, **kwargs):
+    """
+    Stream the state changes of the runs of the user as server-sent events. Each "state" event
+    contains the "run_id", the "state" and the "db_version" of the run.
+    """
+    logger.info("GetRunEvents")
+    try:
+        ctx = Helper(current_app, current_user)
+        return ctx.get_run_events_response()
     except Exception as e:
         logger.error(e, exc_info=True)
         raise e
@@ -243,14 +274,21 @@ def ListRunsExtended(*args, **kwargs):
 @login_required()
 def GetRunStderr(run_id):
     """
-    Return a dictionary with a "content" field that contains the standard error of the requested
-    run.
+    Return a dictionary with a "content" field that contains the lines of the standard
+    error of the requested run, or with "Accept: text/plain" the log as plain text.
+
+    With the `offset` (and `limit`) or `tail` query parameters, only a part of the log is
+    returned as plain text, also for running workflows. The "Next-Offset" header contains the
+    offset for polling the next part.
     """
     try:
         ctx = Helper(current_app, current_user)
         logger.info("GetStderr %s" % run_id)
         ctx.assert_run_id_syntax(run_id)
-        return ctx.get_log_response(run_id, "stderr")
+        return ctx.get_log_response(run_id, "stderr", request.args, request.accept_mimetypes)
+    except ClientError as e:
+        logger.warning(e, exc_info=True)
+        return {"msg": e.message, "status_code": 400}, 400
     except Exception as e:
         logger.error(e, exc_info=True)
         raise e
@@ -260,14 +298,21 @@ def GetRunStderr(run_id):
 @login_required()
 def GetRunStdout(run_id):
     """
-    Return a dictionary with a "content" field that contains the standard output of the requested
-    run.
+    Return a dictionary with a "content" field that contains the lines of the standard
+    output of the requested run, or with "Accept: text/plain" the log as plain text.
+
+    With the `offset` (and `limit`) or `tail` query parameters, only a part of the log is
+    returned as plain text, also for running workflows. The "Next-Offset" header contains the
+    offset for polling the next part.
     """
     try:
         ctx = Helper(current_app, current_user)
         logger.info("GetStdout %s" % run_id)
         ctx.assert_run_id_syntax(run_id)
-        return ctx.get_log_response(run_id, "stdout")
+        return ctx.get_log_response(run_id, "stdout", request.args, request.accept_mimetypes)
+    except ClientError as e:
+        logger.warning(e, exc_info=True)
+        return {"msg": e.message, "status_code": 400}, 400
     except Exception as e:
         logger.error(e, exc_info=True)
         raise e
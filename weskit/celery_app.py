@@ -42,12 +42,78 @@ def read_config():
     return config
 
 
+# Default interval in seconds in which the processing stages of the non-terminal runs are updated.
+DEFAULT_RUN_UPDATE_INTERVAL = 10.0
+
+
+def run_update_schedule(interval: float) -> dict:
+    """
+    The `celery beat` schedule for the periodic update of all runs in non-terminal processing
+    stages (see `weskit.tasks.UpdateRunsTask`). Updates that were not started within one interval
+    expire, because the next scheduled update will do the same work.
+    """
+    return {
+        "update-runs": {
+            "task": "weskit.tasks.UpdateRunsTask.update_runs",
+            "schedule": float(interval),
+            "options": {"expires": float(interval)}
+        }
+    }
+
+
+# Default interval in seconds in which the materialized run counts per processing stage are
+# recounted to correct drift.
+DEFAULT_STATE_RECOUNT_INTERVAL = 3600.0
+
+
+def state_recount_schedule(interval: float) -> dict:
+    """
+    The `celery beat` schedule for the periodic recount of the runs per processing stage (see
+    `weskit.classes.Database.recount_states`).
+    """
+    return {
+        "recount-states": {
+            "task": "weskit.tasks.RecountStatesTask.recount_states",
+            "schedule": float(interval),
+            "options": {"expires": float(interval)}
+        }
+    }
+
+
+# Default interval in seconds in which unreferenced stored attachments are removed.
+DEFAULT_ATTACHMENT_GC_INTERVAL = 86400.0
+
+
+def attachment_gc_schedule(interval: float) -> dict:
+    """
+    The `celery beat` schedule for the periodic removal of stored attachments that are not linked
+    from any run directory anymore (see `weskit.classes.Attachment.AttachmentStore`).
+    """
+    return {
+        "collect-attachment-garbage": {
+            "task": "weskit.tasks.CollectAttachmentGarbageTask.collect_attachment_garbage",
+            "schedule": float(interval),
+            "options": {"expires": float(interval)}
+        }
+    }
+
+
 def update_celery_config_from_env():
     # Insert the "celery" section from the configuration file into the Celery config.
     # Always start with the static weskit.celeryconfig and add what is found in the
     # weskit.yaml's `celery` block.
     celery_app.config_from_object(weskit.celeryconfig)
-    celery_app.conf.update(**read_config().get("celery", {}))
+    config = read_config()
+    celery_app.conf.beat_schedule = {
+        **run_update_schedule(config.get("run_update_interval", DEFAULT_RUN_UPDATE_INTERVAL)),
+        **state_recount_schedule(config.get("state_recount_interval",
+                                            DEFAULT_STATE_RECOUNT_INTERVAL)),
+        **attachment_gc_schedule(config.get("attachment_gc_interval",
+                                            DEFAULT_ATTACHMENT_GC_INTERVAL))
+    }
+    # Workers send task events for the task event consumer (see `weskit.tasks.task_event_consumer`).
+    celery_app.conf.worker_send_task_events = config.get("task_event_updates", False)
+    celery_app.conf.update(**config.get("celery", {}))
 
 
 # Initialize the celery application just with the default configs from the weskit.celeryconfig
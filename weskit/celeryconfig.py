@@ -13,3 +13,10 @@ serializer = "WESkitJSON"
 task_serializer = "WESkitJSON"
 result_serializer = "WESkitJSON"
 accept_content = ["application/x-WESkitJSON"]
+
+# Modules with task definitions that are imported by the workers.
+imports = ["weskit.tasks.CommandTask",
+           "weskit.tasks.PrepareRunTask",
+           "weskit.tasks.UpdateRunsTask",
+           "weskit.tasks.RecountStatesTask",
+           "weskit.tasks.CollectAttachmentGarbageTask"]
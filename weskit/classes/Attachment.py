@@ -0,0 +1,362 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import tarfile
+import tempfile
+import time
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import IO, List, Optional, Tuple
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from weskit.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks in which attachments are copied and extracted.
+ATTACHMENT_CHUNK_SIZE = 64 * 1024
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def _file_mode() -> int:
+    # The umask can only be read by setting it. This is done once at import time, because
+    # os.umask() is not thread-safe.
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# Permissions of saved attachments, like those of files created with open(). Files created with
+# mkstemp() are only accessible by their owner.
+ATTACHMENT_FILE_MODE = _file_mode()
+
+
+class AttachmentFile:
+    """
+    A file to which an uploaded attachment is streamed while the request is parsed. The
+    SHA-256 checksum and the size are computed on the fly, and the size limit is enforced while
+    streaming (with a 413 response). The file is created in the upload directory, which should be
+    on the same filesystem as the run directories, such that it can be moved (rather than copied)
+    into the run directory (see `save_attachment`). If it is not moved, the file is removed when
+    it is closed at the end of the request.
+    """
+
+    def __init__(self,
+                 directory: Path,
+                 max_size: Optional[int] = None) -> None:
+        os.makedirs(directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=directory, prefix=".attachment-")
+        self.path = Path(path)
+        self.max_size = max_size
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._file: IO[bytes] = os.fdopen(fd, "w+b")
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            self.close()
+            raise RequestEntityTooLarge(f"Attachment exceeds {self.max_size} bytes")
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    def move_to(self, target: Path) -> None:
+        self._file.flush()
+        os.fchmod(self._file.fileno(), ATTACHMENT_FILE_MODE)
+        os.replace(self.path, target)
+        self.path = target
+
+    def close(self) -> None:
+        self._file.close()
+        if self.path.name.startswith(".attachment-"):
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        # Everything else (read, seek, tell, ...) is done on the underlying file.
+        return getattr(self._file, name)
+
+
+def _copy(source: IO[bytes],
+          target: IO[bytes],
+          max_size: Optional[int],
+          copied: int = 0,
+          sha256: Optional["hashlib._Hash"] = None) -> int:
+    """
+    Copy the source to the target in chunks. Raise a ClientError, if more than `max_size` bytes
+    (in total, including the `copied` bytes) would be copied. Returns the total size.
+    """
+    while True:
+        chunk = source.read(ATTACHMENT_CHUNK_SIZE)
+        if not chunk:
+            return copied
+        copied += len(chunk)
+        if max_size is not None and copied > max_size:
+            raise ClientError(f"Attachment exceeds {max_size} bytes")
+        if sha256 is not None:
+            sha256.update(chunk)
+        target.write(chunk)
+
+
+def save_attachment(attachment: FileStorage,
+                    target: Path,
+                    max_size: Optional[int] = None) -> Tuple[int, str]:
+    """
+    Save the attachment to the target path and return its size and SHA-256 checksum. Attachments
+    that were streamed into an AttachmentFile are just moved. Other attachments are copied in
+    chunks (with the size limit enforced while copying). The saved file gets the permissions
+    of newly created files (according to the umask).
+    """
+    stream = attachment.stream
+    if isinstance(stream, AttachmentFile):
+        stream.move_to(target)
+        return stream.size, stream.sha256
+    else:
+        sha256 = hashlib.sha256()
+        try:
+            with open(target, "wb") as fh:
+                size = _copy(stream, fh, max_size, sha256=sha256)
+        except ClientError:
+            # Do not leave the partially written attachment.
+            os.unlink(target)
+            raise
+        return size, sha256.hexdigest()
+
+
+def is_archive(path: Path) -> bool:
+    return path.name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _member_path(name: str) -> Path:
+    path = PurePosixPath(name)
+    if path.is_absolute() or ".." in path.parts:
+        raise ClientError(f"Forbidden path in attachment archive: '{name}'")
+    return Path(*path.parts)
+
+
+def _make_member_dirs(target_dir: Path, path: Path) -> None:
+    """
+    Create the directory (relative to the target directory) of an archive member. Symbolic links
+    and files in the target directory are not followed or replaced.
+    """
+    directory = target_dir
+    for part in path.parts:
+        directory = directory / part
+        try:
+            os.mkdir(directory)
+        except FileExistsError:
+            if directory.is_symlink() or not directory.is_dir():
+                raise ClientError(f"Attachment archive member '{path}' conflicts with existing "
+                                  f"file '{directory.relative_to(target_dir)}'")
+
+
+def _extract_member(source: IO[bytes],
+                    target_dir: Path,
+                    path: Path,
+                    max_size: Optional[int],
+                    total: int) -> int:
+    """
+    Extract an archive member into a new file. Existing files (e.g. attachments, which may be
+    hard links into the attachment store) are not overwritten, and symbolic links are not
+    followed. A file that exceeds the size limit is removed. Returns the total extracted size.
+    """
+    _make_member_dirs(target_dir, path.parent)
+    target_path = target_dir / path
+    try:
+        fd = os.open(target_path,
+                     os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0),
+                     0o666)
+    except FileExistsError:
+        raise ClientError(f"Attachment archive member '{path}' would overwrite an existing file")
+    with os.fdopen(fd, "wb") as target:
+        try:
+            return _copy(source, target, max_size, total)
+        except ClientError:
+            os.unlink(target_path)
+            raise
+
+
+def _extract_zip(archive: Path, target_dir: Path, max_size: Optional[int]) -> List[Path]:
+    extracted = []
+    total = 0
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            path = _member_path(info.filename)
+            if info.is_dir():
+                _make_member_dirs(target_dir, path)
+                continue
+            with zf.open(info) as source:
+                total = _extract_member(source, target_dir, path, max_size, total)
+            extracted.append(path)
+    return extracted
+
+
+def _extract_tar(archive: Path, target_dir: Path, max_size: Optional[int]) -> List[Path]:
+    extracted = []
+    total = 0
+    with tarfile.open(archive) as tf:
+        for info in tf:
+            path = _member_path(info.name)
+            if info.isdir():
+                _make_member_dirs(target_dir, path)
+                continue
+            if not info.isfile():
+                raise ClientError("Only regular files and directories are allowed in attachment "
+                                  f"archives: '{info.name}'")
+            source = tf.extractfile(info)
+            with source:   # type: ignore
+                total = _extract_member(source, target_dir, path, max_size, total)   # type: ignore
+            extracted.append(path)
+    return extracted
+
+
+def extract_archive(archive: Path,
+                    target_dir: Path,
+                    max_size: Optional[int] = None) -> List[Path]:
+    """
+    Extract a zip or tar archive into the target directory and return the paths of the extracted
+    files relative to the target directory. Only regular files and directories within the target
+    directory are extracted. Existing files in the target directory are neither overwritten nor
+    followed (if they are symbolic links). The total size of the extracted files is limited to
+    `max_size` bytes (enforced while extracting). Raises a ClientError, if the archive cannot be
+    extracted.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    try:
+        if archive.name.lower().endswith(".zip"):
+            return _extract_zip(archive, target_dir, max_size)
+        else:
+            return _extract_tar(archive, target_dir, max_size)
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise ClientError(f"Could not extract attachment archive '{archive.name}': {e}")
+
+
+def write_checksums(path: Path, checksums: List[Tuple[Path, str]]) -> None:
+    """
+    Write the checksums in the format of `sha256sum`, such that they can be checked with
+    `sha256sum -c`.
+    """
+    with open(path, "w") as fh:
+        for filename, sha256 in checksums:
+            fh.write(f"{sha256}  {filename}\n")
+
+
+class AttachmentStore:
+    """
+    A content-addressed store of attachments, in which each distinct attachment is stored only
+    once, keyed by its SHA-256 checksum. The run directories get hard links to the stored files,
+    such that repeated submissions of the same attachments need (almost) no additional disk space
+    or write I/O. The stored files are read-only, because they are shared by all runs.
+
+    The hard link count of a stored file is its reference count: A stored file with a single link
+    is not referenced by any run directory anymore and is removed by `collect_garbage`.
+
+    If the run directory is on another filesystem (or the filesystem does not support hard links),
+    the stored file is copied into the run directory.
+    """
+
+    def __init__(self,
+                 directory: Path,
+                 grace_period: float = 3600.0) -> None:
+        self.directory = directory
+        # Unreferenced files are only removed if their link count did not change within the grace
+        # period, to not remove files that were just stored, but are not linked yet.
+        self.grace_period = grace_period
+
+    def path(self, sha256: str) -> Path:
+        return self.directory / sha256[:2] / sha256
+
+    def add(self,
+            attachment: FileStorage,
+            target: Path,
+            max_size: Optional[int] = None) -> Tuple[int, str]:
+        """
+        Store the attachment (unless an identical one is already stored) and link it to the target
+        path. Returns the size and SHA-256 checksum of the attachment.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, incoming = tempfile.mkstemp(dir=self.directory, prefix=".incoming-")
+        os.close(fd)
+        incoming_path = Path(incoming)
+        try:
+            size, sha256 = save_attachment(attachment, incoming_path, max_size)
+            stored_path = self.path(sha256)
+            if not self._link(stored_path, target):
+                os.makedirs(stored_path.parent, exist_ok=True)
+                os.chmod(incoming_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                os.replace(incoming_path, stored_path)
+                if not self._link(stored_path, target):
+                    raise RuntimeError(f"Stored attachment vanished: {stored_path}")
+                logger.debug(f"Stored attachment {sha256}")
+            else:
+                logger.debug(f"Reusing stored attachment {sha256}")
+        finally:
+            try:
+                os.unlink(incoming_path)
+            except FileNotFoundError:
+                pass
+        return size, sha256
+
+    @staticmethod
+    def _link(stored_path: Path, target: Path) -> bool:
+        """
+        Link (or copy) the stored file to the target. Returns False, if there is no stored file
+        (e.g. because it was just removed by the garbage collection).
+        """
+        try:
+            if target.exists():
+                target.unlink()
+            os.link(stored_path, target)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.debug(f"Cannot link {stored_path} ({e}). Copying")
+            try:
+                shutil.copyfile(stored_path, target)
+            except FileNotFoundError:
+                return False
+        return True
+
+    def collect_garbage(self) -> int:
+        """
+        Remove the stored files that are not linked from any run directory anymore, and left-over
+        incoming files. Returns the number of removed files.
+        """
+        removed = 0
+        threshold = time.time() - self.grace_period
+        if not self.directory.exists():
+            return removed
+        for path in self.directory.glob("*/*"):
+            try:
+                stat_result = path.stat()
+                if stat_result.st_nlink == 1 and stat_result.st_ctime < threshold:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        for path in self.directory.glob(".incoming-*"):
+            try:
+                if path.stat().st_ctime < threshold:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        logger.debug(f"Removed {removed} unreferenced attachments from {self.directory}")
+        return removed
@@ -0,0 +1,95 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List
+
+from celery import Celery, states
+from celery.backends.base import KeyValueStoreBackend
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CeleryTaskSnapshot:
+    """
+    The state and result of a Celery task at the time the result backend was queried. This
+    provides the subset of the AsyncResult interface used for updating runs (`state` and
+    `get()`), but in contrast to AsyncResult does not query the backend again on every access.
+    """
+    task_id: str
+    state: str
+    result: Any = None
+
+    def get(self) -> Any:
+        if self.state in states.PROPAGATE_STATES and isinstance(self.result, BaseException):
+            raise self.result
+        return self.result
+
+    @staticmethod
+    def from_meta(task_id: str, meta: Dict[str, Any]) -> CeleryTaskSnapshot:
+        return CeleryTaskSnapshot(task_id=task_id,
+                                  state=meta["status"],
+                                  result=meta.get("result"))
+
+    @staticmethod
+    def fetch_all(celery_app: Celery,
+                  task_ids: Iterable[str],
+                  batch_size: int = 1000) -> Dict[str, CeleryTaskSnapshot]:
+        """
+        Retrieve the states and results of the tasks with a few bulk queries to the result backend
+        (e.g. Redis MGET), with at most `batch_size` tasks per query. Backends without bulk
+        retrieval (including key-value backends that do not implement `mget`, like S3) are
+        queried task by task.
+
+        Like for AsyncResult, tasks that are unknown to the backend (not yet started, or their
+        results expired) are reported as PENDING.
+        """
+        unique_ids = list(dict.fromkeys(task_ids))
+        backend = celery_app.backend
+        if isinstance(backend, KeyValueStoreBackend):
+            try:
+                snapshots: Dict[str, CeleryTaskSnapshot] = {}
+                for start in range(0, len(unique_ids), batch_size):
+                    batch = unique_ids[start:start + batch_size]
+                    snapshots.update(CeleryTaskSnapshot._fetch_batch(backend, batch))
+                return snapshots
+            except NotImplementedError:
+                # KeyValueStoreBackend.mget is not implemented by all key-value backends.
+                pass
+        logger.debug(f"No bulk retrieval for {type(backend).__name__}. "
+                     f"Querying {len(unique_ids)} tasks one by one")
+        return CeleryTaskSnapshot._fetch_one_by_one(celery_app, unique_ids)
+
+    @staticmethod
+    def _fetch_one_by_one(celery_app: Celery,
+                          task_ids: List[str]) -> Dict[str, CeleryTaskSnapshot]:
+        snapshots = {}
+        for task_id in task_ids:
+            result = celery_app.AsyncResult(task_id)
+            snapshots[task_id] = CeleryTaskSnapshot(task_id=task_id,
+                                                    state=result.state,
+                                                    result=result.result)
+        return snapshots
+
+    @staticmethod
+    def _fetch_batch(backend: KeyValueStoreBackend,
+                     task_ids: List[str]) -> Dict[str, CeleryTaskSnapshot]:
+        keys = [backend.get_key_for_task(task_id) for task_id in task_ids]
+        values = backend.mget(keys)
+        if hasattr(values, "items"):
+            # Some clients (e.g. memcached) return a mapping with only the found keys.
+            values = [values.get(key) for key in keys]
+
+        snapshots = {}
+        for task_id, value in zip(task_ids, values):
+            if not value:
+                meta: Dict[str, Any] = {"status": states.PENDING, "result": None}
+            else:
+                meta = backend.decode_result(value)
+            snapshots[task_id] = CeleryTaskSnapshot.from_meta(task_id, meta)
+        return snapshots
@@ -2,22 +2,34 @@
 #
 # SPDX-License-Identifier: MIT
 
+import base64
+import json
 import logging
+import threading
 import uuid
-from typing import List, Optional, Callable, cast, Dict, Sequence, Mapping, Any
+from collections import Counter
+from typing import List, Optional, Callable, cast, Dict, Sequence, Mapping, Any, Tuple, \
+    Iterable
 
+import ulid
 from bson import CodecOptions, UuidRepresentation, InvalidDocument
-from bson.son import SON
-from pymongo import ReturnDocument, MongoClient
+from pymongo import ASCENDING, ReturnDocument, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
+from pymongo.change_stream import ChangeStream
 from pymongo.collection import Collection as MongoCollection
 from pymongo.database import Database as MongoDatabase
 from pymongo.results import InsertOneResult
 
+from weskit.classes.ProcessingStage import ProcessingStage
 from weskit.classes.Run import Run
-from weskit.exceptions import ConcurrentModificationError, DatabaseOperationError
+from weskit.exceptions import ClientError, ConcurrentModificationError, \
+    DatabaseOperationError, DuplicateRunIdError
 
 logger = logging.getLogger(__name__)
 
+# Number of runs per page, if not requested otherwise.
+DEFAULT_PAGE_SIZE = 1000
+
 
 class Database:
     """Database abstraction."""
@@ -36,21 +48,71 @@ class Database:
 
         self.__client: Optional[MongoClient] = None
         self.__db: Optional[MongoDatabase] = None
+        # The database is initialized lazily by the first request thread that accesses it. The
+        # lock is reentrant, because the initialization itself accesses the database.
+        self.__initialization_lock = threading.RLock()
+        self.__initialized = False
 
     def initialize(self):
-        if self.__client is None:
-            # For encoding/decoding with bson see
-            # See https://pymongo.readthedocs.io/en/stable/examples/uuid.html#standard
-            # and https://pymongo.readthedocs.io/en/stable/examples/custom_type.html#custom-type-example  # noqa
-            # Philip: I tried this but then MongoDB converted every string to Path. Could not
-            #         figure out how to convert just the path-encoding strings back to Path.
-            self.__client = MongoClient(self.server_url)
-
-            self.__db = MongoDatabase(self.__client, self.database_name)
-
-            # Create an index to enforce a uniqueness constraint.
-            runs = self.__db["run"]
-            runs.create_index("id", unique=True)
+        """
+        Create the (thread-safe, pooled) MongoClient and set up the database (indexes, counters).
+        Concurrent calls from multiple threads initialize the database only once, and return only
+        after the initialization is completed.
+        """
+        if self.__initialized:
+            return
+        with self.__initialization_lock:
+            if self.__client is None:
+                # For encoding/decoding with bson see
+                # See https://pymongo.readthedocs.io/en/stable/examples/uuid.html#standard
+                # and https://pymongo.readthedocs.io/en/stable/examples/custom_type.html#custom-type-example  # noqa
+                # Philip: I tried this but then MongoDB converted every string to Path. Could not
+                #         figure out how to convert just the path-encoding strings back to Path.
+                self.__client = MongoClient(self.server_url)
+
+                self.__db = MongoDatabase(self.__client, self.database_name)
+                try:
+                    self._create_indexes(self.__db["run"])
+
+                    if self.__db["run_state_counts"].estimated_document_count() == 0:
+                        # E.g. a fresh database or a database from before the counters were
+                        # introduced.
+                        self.recount_states()
+                except Exception:
+                    # Let the next access retry the initialization, e.g. if the database server
+                    # was not yet reachable.
+                    self.__client.close()
+                    self.__client = None
+                    self.__db = None
+                    raise
+
+                self.__initialized = True
+
+    @staticmethod
+    def _create_indexes(runs: MongoCollection) -> None:
+        """
+        Create the indexes needed by the queries on the run collection. Existing indexes with the
+        same specification are left untouched.
+        """
+        # Create an index to enforce a uniqueness constraint.
+        runs.create_index("id", unique=True)
+        # Listing the runs of a user, sorted by their request time (keyset pagination).
+        runs.create_index([("user_id", ASCENDING), ("request_time", ASCENDING), ("id", ASCENDING)])
+        runs.create_index("processing_stage")
+        # Matching Celery task events to runs. Runs without task (yet) are not indexed.
+        runs.create_index("celery_task_id",
+                          partialFilterExpression={"celery_task_id": {"$type": "string"}})
+        # The runs that need updates. This index is small, because most runs are terminal.
+        try:
+            runs.create_index(
+                [("processing_stage", ASCENDING), ("id", ASCENDING)],
+                name="non_terminal_runs",
+                partialFilterExpression={"processing_stage": {"$in": [
+                    stage.name for stage in ProcessingStage.NON_TERMINAL_STAGES()]}})
+        except OperationFailure as e:
+            # `$in` in partial index filters is only supported by MongoDB >= 6.0. The
+            # processing_stage index serves the same queries, if the partial index is missing.
+            logger.warning(f"Could not create partial index on non-terminal runs: {e}")
 
     @property
     def client(self) -> MongoClient:
@@ -68,6 +130,17 @@ class Database:
                                       codec_options=CodecOptions(
                                           uuid_representation=UuidRepresentation.STANDARD))
 
+    @property
+    def _state_counts(self) -> MongoCollection:
+        """
+        Materialized number of runs per processing stage, with documents
+        `{"_id": <processing stage name>, "count": <number of runs>}`. The counts are incremented
+        and decremented with every insertion, stage change and deletion of a run. Because these
+        are not transactional with the run modifications, they may drift and are periodically
+        recounted (see `recount_states`).
+        """
+        return self.db.get_collection("run_state_counts")
+
     def aggregate_runs(self, pipeline):
         return dict(self._runs.aggregate(pipeline))
 
@@ -81,6 +154,79 @@ class Database:
         else:
             return None
 
+    def get_run_by_celery_task_id(self, celery_task_id: str) -> Optional[Run]:
+        """
+        Return the run that is executed by the Celery task, or None if the task executes no run
+        (e.g. other WESkit tasks).
+        """
+        run_data = self._runs.find_one(
+            filter={"celery_task_id": celery_task_id},
+            projection={"_id": False})
+        if run_data is not None:
+            return Run.from_bson_serializable(run_data)
+        else:
+            return None
+
+    def get_run_version(self, run_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+        """
+        Return only the "db_version" and "user_id" of the run, or None if there is no such run.
+        This is a single lookup on the run ID index, e.g. to check whether a client's copy of the
+        run is still current.
+        """
+        return self._runs.find_one(
+            filter={"id": run_id},
+            projection={"_id": False, "db_version": True, "user_id": True})
+
+    def get_non_terminal_runs(self) -> List[Run]:
+        """
+        Get all runs that are not in a terminal processing stage, i.e. that need updates.
+        """
+        return self.get_runs({"processing_stage": {"$in": [
+            stage.name for stage in ProcessingStage.NON_TERMINAL_STAGES()]}})
+
+    def get_run_stages(self,
+                       user_id: str,
+                       run_ids: Iterable[uuid.UUID]) -> List[Dict[str, Any]]:
+        """
+        Return the "id", "processing_stage" and "db_version" of all non-terminal runs of the
+        user, and of the user's runs with the given IDs (e.g. runs that were non-terminal before).
+        """
+        return list(self._runs.find(
+            {"user_id": user_id,
+             "$or": [{"processing_stage": {"$in": [
+                         stage.name for stage in ProcessingStage.NON_TERMINAL_STAGES()]}},
+                     {"id": {"$in": list(run_ids)}}]},
+            projection={"_id": False, "id": True, "processing_stage": True, "db_version": True}))
+
+    def watch_run_stages(self,
+                         user_id: str,
+                         run_id: Optional[uuid.UUID] = None,
+                         max_await_time_ms: Optional[int] = None) -> ChangeStream:
+        """
+        Open a change stream of the inserted runs of the user (or only the run with the `run_id`)
+        and of the changes of their processing stages. The changes are filtered by the server. The
+        "fullDocument" of the changes contains only the "id", "user_id", "processing_stage" and
+        "db_version" of the run. Change streams are only supported by replica sets (raises an
+        OperationFailure otherwise).
+        """
+        run_filter: Dict[str, Any] = {"fullDocument.user_id": user_id}
+        if run_id is not None:
+            run_filter["fullDocument.id"] = run_id
+        return self._runs.watch(
+            pipeline=[
+                {"$match": {"$or": [
+                    {"operationType": {"$in": ["insert", "replace"]}},
+                    {"operationType": "update",
+                     "updateDescription.updatedFields.processing_stage": {"$exists": True}}],
+                    **run_filter}},
+                {"$project": {"operationType": True,
+                              "fullDocument.id": True,
+                              "fullDocument.user_id": True,
+                              "fullDocument.processing_stage": True,
+                              "fullDocument.db_version": True}}],
+            full_document="updateLookup",
+            max_await_time_ms=max_await_time_ms)
+
     def get_runs(self, query) -> List[Run]:
         runs = []
         runs_data = self._runs.find(query,
@@ -90,47 +236,204 @@ class Database:
                 runs.append(Run.from_bson_serializable(run_data))
         return runs
 
-    def list_run_ids_and_stages(self, user_id: str) -> List[Dict[str, str]]:
+    @staticmethod
+    def _encode_page_token(run_data: Mapping[str, Any]) -> str:
+        # The token is opaque to the client. It is the (request_time, id) key of the last run on
+        # the page.
+        key = json.dumps([run_data["request_time"], str(run_data["id"])])
+        # Without padding, the token can be used in URLs without escaping.
+        return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def _decode_page_token(page_token: str) -> Tuple[Optional[str], uuid.UUID]:
+        """
+        Decode the page token into the (request_time, id) key. The token comes from the client,
+        so its structure and types are checked, and any invalid token raises a ClientError.
+        """
+        try:
+            padded_token = page_token + "=" * (-len(page_token) % 4)
+            key = json.loads(base64.urlsafe_b64decode(padded_token))
+            if not isinstance(key, list) or len(key) != 2:
+                raise ValueError("Page token is not a (request_time, id) pair")
+            request_time, run_id = key
+            if not (request_time is None or isinstance(request_time, str)) or \
+                    not isinstance(run_id, str):
+                raise ValueError("Page token has invalid request_time or id")
+            return request_time, uuid.UUID(run_id)
+        except Exception as e:
+            raise ClientError(f"Invalid page token: '{page_token}'") from e
+
+    def _find_user_runs_page(self,
+                             user_id: str,
+                             projection: Dict[str, bool],
+                             page_size: int,
+                             page_token: Optional[str]) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Keyset pagination over the runs of a user, ordered by (request_time, id). Return the
+        runs of the page and the token for the next page, which is empty if this is the last page.
+        """
         if user_id is None:
             raise ValueError("Can only list runs for specific user.")
-        return list(self._runs.find(
-            projection={"_id": False,
-                        "id": True,
-                        "exit_code": True,
-                        "processing_stage": True,
-                        "user_id": True,
-                        },
-            filter={"user_id": user_id}))
+        if page_size < 1:
+            raise ValueError(f"Page size must be positive, got {page_size}")
+        query: Dict[str, Any] = {"user_id": user_id}
+        if page_token:
+            request_time, run_id = self._decode_page_token(page_token)
+            # Runs without request_time are sorted first. `$gt` does not compare null to strings.
+            later_runs = {"request_time": {"$ne": None}} if request_time is None \
+                else {"request_time": {"$gt": request_time}}
+            query["$or"] = [later_runs,
+                            {"request_time": request_time, "id": {"$gt": run_id}}]
+
+        # Fetch one more run than requested to know whether there is a next page.
+        runs_data = list(self._runs.
+                         find(filter=query,
+                              projection=dict(projection, _id=False, id=True, request_time=True)).
+                         sort([("request_time", ASCENDING), ("id", ASCENDING)]).
+                         limit(page_size + 1))
+        if len(runs_data) > page_size:
+            runs_data = runs_data[:page_size]
+            return runs_data, self._encode_page_token(runs_data[-1])
+        else:
+            return runs_data, ""
+
+    def list_run_ids_and_stages(self,
+                                user_id: str,
+                                page_size: int = DEFAULT_PAGE_SIZE,
+                                page_token: Optional[str] = None) \
+            -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Return a page of the runs of the user, and the token for the next page (see
+        `_find_user_runs_page`).
+        """
+        return self._find_user_runs_page(user_id,
+                                         {"exit_code": True,
+                                          "processing_stage": True,
+                                          "user_id": True},
+                                         page_size, page_token)
+
+    def get_state_counts(self) -> Dict[ProcessingStage, int]:
+        """
+        The number of runs per processing stage from the materialized counters. This is a cheap
+        read of a few small documents, rather than an aggregation over all runs.
+        """
+        return {ProcessingStage.from_string(doc["_id"]): doc["count"]
+                for doc in self._state_counts.find()}
 
-    def count_states(self) -> List[Any]:
+    def recount_states(self) -> Dict[ProcessingStage, int]:
         """
-        Returns the statistics of all job-states ever, for all users.
+        Recount the runs per processing stage and replace the materialized counters. This
+        corrects any drift of the counters, e.g. from failures between a run modification and
+        the counter update.
         """
         pipeline: Sequence[Mapping[str, Any]] = [
-            {"$unwind": "$processing_stage"},
-            {"$group": {"_id": {"processing_stage": "$processing_stage",
-                                "exit_code": "$exit_code"
-                                }, "count": {"$sum": 1}}},
-            {"$sort": SON([("count", -1), ("_id", -1)])}
-            ]
-        counts_data = list(self._runs.aggregate(pipeline))
-        return counts_data
+            {"$group": {"_id": "$processing_stage", "count": {"$sum": 1}}}
+        ]
+        counts = {doc["_id"]: doc["count"] for doc in self._runs.aggregate(pipeline)}
+        self._state_counts.bulk_write(
+            [UpdateOne({"_id": stage.name},
+                       {"$set": {"count": counts.get(stage.name, 0)}},
+                       upsert=True)
+             for stage in ProcessingStage])
+        return {ProcessingStage.from_string(stage): count for stage, count in counts.items()}
+
+    def _count_stage_change(self,
+                            old_stage: Optional[ProcessingStage],
+                            new_stage: Optional[ProcessingStage],
+                            count: int = 1) -> None:
+        """
+        Update the materialized state counters for `count` runs that moved from `old_stage` to
+        `new_stage`. None means that the runs were inserted or deleted, respectively. Failures are
+        only logged, because the run modification itself already succeeded. The periodic recount
+        corrects the counters.
+        """
+        if old_stage == new_stage or count == 0:
+            return
+        operations = []
+        if old_stage is not None:
+            operations.append(UpdateOne({"_id": old_stage.name},
+                                        {"$inc": {"count": -count}}, upsert=True))
+        if new_stage is not None:
+            operations.append(UpdateOne({"_id": new_stage.name},
+                                        {"$inc": {"count": count}}, upsert=True))
+        try:
+            self._state_counts.bulk_write(operations, ordered=False)
+        except PyMongoError as e:
+            logger.warning(f"Could not update state counts ({old_stage} -> {new_stage}): {e}")
 
     def create_run_id(self) -> uuid.UUID:
-        run_id = uuid.uuid4()
-        while not self.get_run(run_id) is None:
-            run_id = uuid.uuid4()
-        return run_id
+        """
+        Create a time-ordered run ID: A ULID (48 bit millisecond timestamp, 80 random bits) as
+        UUID. Consecutive insertions therefore mostly append to the unique index on the run IDs.
+
+        The ID is not checked against the database. Uniqueness is enforced by the unique index,
+        i.e. `insert_run` raises a DuplicateRunIdError for the (very unlikely) case of a collision.
+        """
+        return ulid.new().uuid
 
     def insert_run(self, run: Run) -> None:
         try:
             insert_result: InsertOneResult = self._runs.insert_one(run.to_bson_serializable())
+        except DuplicateKeyError as e:
+            raise DuplicateRunIdError(f"Run ID {run.id} is already used", [run.id]) from e
         except Exception as e:
             # Wrap the pymongo exception into a WESkitError
             raise DatabaseOperationError(f"Exception during insert_run for {run.id}: {str(e)}") \
                 from e
         if not insert_result.acknowledged:
             raise DatabaseOperationError(f"Attempt to insert run {run.id} failed")
+        self._count_stage_change(None, run.processing_stage)
+
+    def insert_runs(self, runs: Sequence[Run]) -> None:
+        """
+        Insert many new runs with a single bulk insert. If only run IDs collided, the other runs
+        are inserted and a DuplicateRunIdError with the colliding IDs is raised, such that only
+        the colliding runs need to be inserted again (with new IDs). On other errors, the runs
+        that were inserted are set to SYSTEM_ERROR, and a DatabaseOperationError is raised.
+        """
+        if len(runs) == 0:
+            return
+        try:
+            self._runs.insert_many([run.to_bson_serializable() for run in runs], ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            failed_indices = {error["index"] for error in errors}
+            inserted_runs = [run for index, run in enumerate(runs)
+                             if index not in failed_indices]
+            if all(error["code"] == 11000 for error in errors):
+                for stage, count in Counter(run.processing_stage
+                                            for run in inserted_runs).items():
+                    self._count_stage_change(None, stage, count)
+                raise DuplicateRunIdError(f"Run IDs already used during insert_runs: {e}",
+                                          [runs[index].id for index in sorted(failed_indices)]) \
+                    from e
+            # The runs of a batch are only submitted together.
+            self._runs.update_many({"id": {"$in": [run.id for run in inserted_runs]}},
+                                   {"$set": {"processing_stage":
+                                             ProcessingStage.SYSTEM_ERROR.name},
+                                    "$inc": {"db_version": 1}})
+            self._count_stage_change(None, ProcessingStage.SYSTEM_ERROR, len(inserted_runs))
+            raise DatabaseOperationError(f"Exception during insert_runs: {e}") from e
+        except Exception as e:
+            raise DatabaseOperationError(f"Exception during insert_runs: {e}") from e
+        for stage, count in Counter(run.processing_stage for run in runs).items():
+            self._count_stage_change(None, stage, count)
+
+    def update_processing_stages(self,
+                                 run_ids: Sequence[uuid.UUID],
+                                 old_stage: ProcessingStage,
+                                 new_stage: ProcessingStage) -> int:
+        """
+        Set the processing stage of all runs with the given IDs that are in `old_stage` to
+        `new_stage` with a single update. Runs that were concurrently changed to another stage
+        are not modified. Returns the number of modified runs.
+        """
+        result = self._runs.update_many({"id": {"$in": list(run_ids)},
+                                         "processing_stage": old_stage.name},
+                                        {"$set": {"processing_stage": new_stage.name},
+                                         "$inc": {"db_version": 1}})
+        self._count_stage_change(old_stage, new_stage, result.modified_count)
+        return result.modified_count
 
     def _update_run(self,
                     run: Run,
@@ -138,18 +441,18 @@ class Database:
                     max_tries: int = 1) \
             -> Run:
         # Only update in the database, if the run was actually changed. Specifically, we update
-        # only if the db_version field is unchanged. This relies on that the find_one_and_replace
+        # only if the db_version field is unchanged. This relies on that the find_one_and_update
         # function is transactional. On every successful update the db_version counter is
-        # incremented.
+        # incremented. Only the modified fields are written.
         logger.debug(f"Trying to update run {run.id} in database (left tries = {max_tries})")
         try:
             updated_run_dict = \
                 self._runs. \
-                find_one_and_replace({"id": run.id, "db_version": run.db_version},
-                                     dict(run.to_bson_serializable(),
-                                          db_version=run.db_version + 1),
-                                     return_document=ReturnDocument.AFTER,
-                                     projection={'_id': False})
+                find_one_and_update({"id": run.id, "db_version": run.db_version},
+                                    {"$set": run.to_bson_serializable(run.modified_fields),
+                                     "$inc": {"db_version": 1}},
+                                    return_document=ReturnDocument.AFTER,
+                                    projection={'_id': False})
             if updated_run_dict is None:
                 # Nothing updated. Let's search the value that should have been replaced.
                 stored_run_dict = self._runs.find_one({"id": run.id},
@@ -177,11 +480,19 @@ class Database:
                         else:
                             logger.debug("Trying to resolve concurrent modification of run "
                                          f"'{run.id}'")
-                            merged_run = resolution_fun(run,
-                                                        Run.from_bson_serializable(stored_run_dict))
+                            stored_run = Run.from_bson_serializable(stored_run_dict)
+                            merged_run = resolution_fun(run, stored_run)
+                            if not merged_run.modified:
+                                # The stored run already contains all local modifications.
+                                return stored_run
                             return self._update_run(merged_run, resolution_fun, max_tries - 1)
             else:
-                return Run.from_bson_serializable(updated_run_dict)
+                updated_run = Run.from_bson_serializable(updated_run_dict)
+                # The filter on the db_version ensures that the run was in the stage it had
+                # when it was read (or merged).
+                self._count_stage_change(run.stored_processing_stage,
+                                         updated_run.processing_stage)
+                return updated_run
         except InvalidDocument as ex:
             raise DatabaseOperationError(f"DB error with run {run.id}: {run}", ex)
 
@@ -206,7 +517,7 @@ class Database:
         to resolve concurrent modifications runs, after that a ConcurrentModificationError is
         thrown.
 
-        If a run is found with the same version number then it is replaced with the new one. The
+        If a run is found with the same version number then its modified fields are updated. The
         version number written to the database will be incremented. It is assumed, that this
         value in the database does not have only the same db_version value, but is actually the
         same run.
@@ -218,9 +529,8 @@ class Database:
         If an error occurs, raises a DatabaseModificationError (e.g. if there is no value to be
         modified, because the run was never inserted).
 
-        Note: Usually, data in runs is small, so replacement won't pose a big problem. If there
-              are big values (e.g. stderr/stdout of runs) then this operation might get slower,
-              though.
+        Only the fields that were modified locally (see `Run.modified_fields`) are written to
+        the database. Unmodified large values (e.g. stderr/stdout of runs) are not transferred.
         """
         if max_tries < 1:
             raise ValueError(f"I should try to update at least once, got max_tries={max_tries}")
@@ -239,13 +549,26 @@ class Database:
                 return Run.from_bson_serializable(stored_run_dict)
 
     def delete_run(self, run: Run) -> bool:
-        return self._runs \
-            .delete_one({"id": run.id}) \
-            .acknowledged
-
-    def list_run_ids_and_stages_and_times(self, user_id: str) -> list:
-        if user_id is None:
-            raise ValueError("Can only list runs for specific user.")
+        # findAndModify commands are always acknowledged.
+        deleted_run_dict = self._runs.find_one_and_delete({"id": run.id},
+                                                          projection={"processing_stage": True})
+        if deleted_run_dict is not None:
+            self._count_stage_change(
+                ProcessingStage.from_string(deleted_run_dict["processing_stage"]), None)
+        return True
+
+    def list_run_ids_and_stages_and_times(self,
+                                          user_id: str,
+                                          page_size: int = DEFAULT_PAGE_SIZE,
+                                          page_token: Optional[str] = None) \
+            -> Tuple[List[Dict[str, Any]], str]:
+        runs_data, next_page_token = \
+            self._find_user_runs_page(user_id,
+                                      {"processing_stage": True,
+                                       "start_time": True,
+                                       "user_id": True,
+                                       "request": True},
+                                      page_size, page_token)
         return list(map(
             lambda r: {
                 "run_id": r["id"],
@@ -254,4 +577,4 @@ class Database:
                 "user_id": r["user_id"],
                 "request": r["request"]
             },
-            self._runs.find(filter={"user_id": user_id})))
+            runs_data)), next_page_token
@@ -6,19 +6,22 @@ import json
 import logging
 import os
 from pathlib import Path
-from typing import Dict, Any, cast, Union
+from typing import Dict, Any, cast, Tuple, Union
 from typing import Optional, List
 from urllib.parse import urlparse
 from uuid import UUID, uuid4
 
 import yaml
-from celery import Celery, Task
+from celery import Celery, Task, group
 from celery.app.control import Control
 from trs_cli.client import TRSClient
 from werkzeug.datastructures import FileStorage, ImmutableMultiDict
 from werkzeug.utils import secure_filename
 
 from weskit.tasks.CommandTask import run_command
+from weskit.classes.Attachment import \
+    AttachmentStore, extract_archive, is_archive, save_attachment, write_checksums
+from weskit.classes.CeleryTaskSnapshot import CeleryTaskSnapshot
 from weskit.classes.Database import Database
 from weskit.classes.PathContext import PathContext
 from weskit.classes.Run import Run
@@ -26,11 +29,14 @@ from weskit.classes.ProcessingStage import ProcessingStage
 from weskit.classes.TrsWorkflowInstaller \
     import TrsWorkflowInstaller, WorkflowInfo, WorkflowInstallationMetadata
 from weskit.classes.executor.Executor import ExecutionSettings
-from weskit.exceptions import ClientError
-from weskit.utils import return_pre_signed_url, now
+from weskit.exceptions import ClientError, DatabaseOperationError, DuplicateRunIdError
+from weskit.utils import return_pre_signed_url, now, updated
 
 ConfigParams = Dict[str, Dict[str, Any]]
 
+# Size of the chunks in which log files are read.
+LOG_CHUNK_SIZE = 64 * 1024
+
 logger = logging.getLogger(__name__)
 
 
@@ -43,7 +49,12 @@ class Manager:
                  workflow_engines: dict,
                  weskit_context: PathContext,
                  executor_context: PathContext,
-                 require_workdir_tag: bool) -> None:
+                 require_workdir_tag: bool,
+                 async_preparation: bool = False,
+                 max_attachment_size: Optional[int] = None,
+                 extract_attachment_archive: bool = False,
+                 deduplicate_attachments: bool = False,
+                 task_event_updates: bool = False) -> None:
         self.config = config
         self.workflow_engines = workflow_engines
         self.weskit_context = weskit_context
@@ -51,6 +62,13 @@ class Manager:
         self.celery_app = celery_app
         self.database = database
         self.require_workdir_tag = require_workdir_tag
+        self.async_preparation = async_preparation
+        self.max_attachment_size = max_attachment_size
+        self.extract_attachment_archive = extract_attachment_archive
+        self.task_event_updates = task_event_updates
+        self.attachment_store: Optional[AttachmentStore] = \
+            AttachmentStore(self.weskit_context.data_dir / ".attachments") \
+            if deduplicate_attachments else None
         # Register the relevant tasks with fully qualified name (see import).
         # The function needs to be static.
         self.celery_app.task(run_command)
@@ -59,6 +77,19 @@ class Manager:
     def _run_task(self) -> Task:
         return self.celery_app.tasks["weskit.tasks.CommandTask.run_command"]
 
+    @property
+    def attachment_upload_dir(self) -> Path:
+        """
+        Uploaded attachments are streamed into this directory, before they are moved into the run
+        directory. It is in the data directory, such that moving does not copy the data.
+        """
+        return self.weskit_context.data_dir / ".uploads"
+
+    def _send_prepare_task(self, run: Run) -> None:
+        # The task is sent by name, because the task module imports the manager factory.
+        self.celery_app.send_task("weskit.tasks.PrepareRunTask.prepare_run",
+                                  args=[str(run.id)])
+
     def cancel(self, run: Run) -> Run:
         """
         See https://docs.celeryproject.org/en/latest/userguide/workers.html
@@ -69,22 +100,19 @@ class Manager:
         raise NotImplementedError()
         if run.processing_stage.is_running:
             run.processing_stage = ProcessingStage.REQUESTED_CANCEL
-            # This is a quickfix for executing the tests.
-            # This might be a bad solution for multithreaded use-cases,
-            # because the current working directory is touched.
-            cwd = os.getcwd()
+            # Revoking only sends a broadcast message to the workers. The process-global current
+            # working directory is not touched, which would be unsafe with concurrent requests.
             Control(self.celery_app). \
                 revoke(task_id=run.celery_task_id,
                        terminate=True,
                        signal='SIGKILL')
-            os.chdir(cwd)
         elif run.processing_stage.is_initializing:
             # We cannot yet cancel a run in the initializing state. Ignore the request!
             # TODO Try updating the state until it is RUNNING. Then cancel the RUNNING run.
             pass
         return run
 
-    def _update_run_results(self, run: Run, celery_task) -> Run:
+    def _update_run_results(self, run: Run, celery_task: CeleryTaskSnapshot) -> Run:
         """
         For the semantics of Celery's built-in states, see
 
@@ -98,23 +126,21 @@ class Manager:
             # The command itself may have failed, though, because run_command catches execution
             # errors of the command and lets the Celery job succeed.
             result = celery_task.get()
+            # The outputs are replaced, rather than modified in place (see `Run`).
+            outputs = dict(run.outputs)
             if "WESKIT_S3_ENDPOINT" in os.environ:
-                run.outputs["S3"] = [return_pre_signed_url(outfile=out, workdir=result["workdir"])
-                                     for out in result["output_files"]]
-            run.outputs["filesystem"] = result["output_files"]
+                outputs["S3"] = [return_pre_signed_url(outfile=out, workdir=result["workdir"])
+                                 for out in result["output_files"]]
+            outputs["filesystem"] = result["output_files"]
+            run.outputs = outputs
             run.execution_log = result
 
-            run_dir_abs = run.run_dir(self.weskit_context)
+            run_dir_abs = cast(Path, run.run_dir(self.weskit_context))
             if run.exit_code is not None and run.exit_code >= 0:
-                # Command (in Celery job) was executed (successfully or not)
-                # WARNING: Updates of > 4 mb can be slow with MongoDB.
-                try:
-                    os.path.isfile(run_dir_abs / result["stdout_file"])
-                    os.path.isfile(run_dir_abs / result["stderr_file"])
-                except FileNotFoundError as e:
-                    logger.error("%s during update of the run results" % (e))
-                    run.processing_stage = ProcessingStage.EXECUTOR_ERROR
-                    return run
+                # Command (in Celery job) was executed (successfully or not). The logs stay in
+                # their files. The run only references them.
+                run.stdout = self._log_file_reference(run_dir_abs, result["stdout_file"])
+                run.stderr = self._log_file_reference(run_dir_abs, result["stderr_file"])
             else:
                 # run_command produces exit_code < 0 if there are technical errors during the
                 # command execution (other than workflow engine errors; e.g. SSH connection).
@@ -125,18 +151,47 @@ class Manager:
                                                                          run.exit_code)
         return run
 
+    @staticmethod
+    def _log_file_reference(run_dir: Path, log_file: str) -> Optional[Dict[str, Any]]:
+        """
+        Reference to a log file (path relative to the run directory, size in bytes, and number
+        of lines). Return None, if the file is not accessible (e.g. with remote executors).
+        """
+        try:
+            size = 0
+            lines = 0
+            last_byte = b"\n"
+            with open(run_dir / log_file, "rb") as fh:
+                for chunk in iter(lambda: fh.read(LOG_CHUNK_SIZE), b""):
+                    size += len(chunk)
+                    lines += chunk.count(b"\n")
+                    last_byte = chunk[-1:]
+            if last_byte != b"\n":
+                # Last line without trailing newline.
+                lines += 1
+            return {"path": log_file, "size": size, "lines": lines}
+        except OSError as e:
+            logger.warning(f"Could not access log file '{log_file}' in '{run_dir}': {e}")
+            return None
+
     def update_run(self,
                    run: Run,
-                   max_tries: int = 1) -> Run:
+                   max_tries: int = 1,
+                   celery_task: Optional[CeleryTaskSnapshot] = None) -> Run:
         """
         Given an old Run and a new Run (that may or may not differ from the old Run version),
         retrieve the Celery state and update the run.
         Then, if there is a change compared to the old Run, update the run in the database.
+
+        If a `celery_task` snapshot of the run's task is provided (see `update_runs`), the
+        result backend is not queried.
         """
         if run.celery_task_id is not None:
             # backend deletes celery state after a predefined expiry time
             # AsyncResult sets celery state to "PENDING" if ID is not in backend
-            celery_task = self._run_task.AsyncResult(run.celery_task_id)
+            if celery_task is None:
+                celery_task = CeleryTaskSnapshot.fetch_all(self.celery_app,
+                                                           [run.celery_task_id])[run.celery_task_id]
             logger.debug("Run %s with processing stage %s has Celery task %s in state '%s'" % (
                 run.id, run.processing_stage.name, run.celery_task_id, celery_task.state))
             # celery state should not be pending for finished runs
@@ -161,44 +216,132 @@ class Manager:
         """
         if isinstance(run_id, str):
             run_id = UUID(run_id)
-        query: dict
+        runs: List[Run]
         if run_id is None:
             # Generally updating finished runs does not make much sense and creates problems with
             # deleted runs. On the long run, with increasing numbers of runs there will also be
             # a performance problem when updating accumulated finished runs.
-            query = {"run_stage": {"$not": {"$in": [state.name
-                     for state in ProcessingStage.TERMINAL_STAGES()]}}}
+            runs = self.database.get_non_terminal_runs()
         else:
-            query = {"run_id": run_id}
+            runs = self.database.get_runs({"id": run_id})
 
-        runs = self.database.get_runs(query)
         logger.debug(f"Updating state of {len(runs)} runs")
-        return list(map(lambda run: self.update_run(run, max_tries), runs))
-
-    def create_and_insert_run(self, validated_request, user_id)\
+        # Retrieve the Celery states of all runs with few bulk queries to the result backend.
+        celery_tasks = CeleryTaskSnapshot.fetch_all(
+            self.celery_app,
+            [run.celery_task_id for run in runs if run.celery_task_id is not None])
+        updated_runs = []
+        for run in runs:
+            # A single run that cannot be updated should not block the update of all other runs.
+            try:
+                updated_runs.append(
+                    self.update_run(run, max_tries,
+                                    celery_tasks.get(cast(str, run.celery_task_id))))
+            except Exception as e:
+                # E.g. database errors, or conflicting stages that cannot be merged.
+                logger.error(f"Could not update run {run.id}", exc_info=e)
+        return updated_runs
+
+    def _create_run(self, validated_request, user_id) -> Run:
+        """
+        Create a new run (in memory) from the validated request. The JSON fields are usually
+        already decoded by the RunRequestValidator. Only fields that are still JSON strings are
+        decoded here.
+        """
+        for field in ["workflow_params", "workflow_engine_parameters", "tags"]:
+            if isinstance(validated_request.get(field), str):
+                validated_request[field] = json.loads(validated_request[field])
+        validated_request.setdefault("tags", None)
+
+        return Run(id=self.database.create_run_id(),
+                   processing_stage=ProcessingStage.RUN_CREATED,
+                   request_time=now(),
+                   exit_code=None,
+                   request=validated_request,
+                   user_id=user_id)
+
+    def create_and_insert_run(self, validated_request, user_id, max_tries: int = 3)\
             -> Optional[Run]:
+        """
+        Create a new run and insert it into the database. On the unlikely collision of the new run
+        ID with an existing one, the insertion is retried with a new ID at most `max_tries` times.
+        """
+        runs = [self._create_run(validated_request, user_id)]
+        self._insert_new_runs(runs, [None], max_tries)
+        logger.debug(f"Created run {runs[0].id}")
+        return runs[0]
+
+    def _insert_new_runs(self,
+                         runs: List[Run],
+                         task_arguments: List[Optional[Dict[str, Any]]],
+                         max_tries: int = 3) -> None:
+        """
+        Insert new runs with a single insert. On the unlikely collision of run IDs with existing
+        ones, only the colliding runs get new IDs (see `_renew_run_id`) and are inserted again, at
+        most `max_tries` times. `runs` and their run_command `task_arguments` are updated in place.
 
-        validated_request["workflow_params"] = json.loads(validated_request["workflow_params"])
-
-        if "workflow_engine_parameters" in validated_request.keys():
-            validated_request["workflow_engine_parameters"] = \
-                json.loads(validated_request["workflow_engine_parameters"])
-
-        if "tags" in validated_request.keys():
-            validated_request["tags"] = json.loads(validated_request["tags"])
-        else:
-            validated_request["tags"] = None
-
-        run = Run(id=self.database.create_run_id(),
-                  processing_stage=ProcessingStage.RUN_CREATED,
-                  request_time=now(),
-                  exit_code=None,
-                  request=validated_request,
-                  user_id=user_id)
-        self.database.insert_run(run)
+        If the IDs still collide after `max_tries`, the already inserted runs are set to
+        SYSTEM_ERROR (their tasks are not published) and the DuplicateRunIdError is raised.
+        """
+        pending = list(range(len(runs)))
+        for tries_left in reversed(range(max_tries)):
+            try:
+                if len(pending) == 1:
+                    self.database.insert_run(runs[pending[0]])
+                else:
+                    self.database.insert_runs([runs[index] for index in pending])
+                return
+            except DuplicateRunIdError as e:
+                colliding_ids = set(e.run_ids)
+                pending = [index for index in pending if runs[index].id in colliding_ids]
+                if tries_left == 0:
+                    inserted_ids = [run.id for index, run in enumerate(runs)
+                                    if index not in pending]
+                    for stage in [ProcessingStage.PREPARING, ProcessingStage.PREPARED_EXECUTION]:
+                        self.database.update_processing_stages(inserted_ids,
+                                                               stage,
+                                                               ProcessingStage.SYSTEM_ERROR)
+                    raise e
+                logger.warning(f"{e.message}. Retrying with new run IDs")
+                for index in pending:
+                    runs[index], task_arguments[index] = self._renew_run_id(runs[index])
+
+    def _renew_run_id(self, run: Run) -> Tuple[Run, Optional[Dict[str, Any]]]:
+        """
+        Give a new (not yet inserted) run a new ID. For a prepared run, the run directory and the
+        files named after the run ID are moved accordingly, and the arguments of its run_command
+        task are created again (None, if the run is not prepared).
+        """
+        new_run = Run(**updated(dict(run), id=self.database.create_run_id()))
+        if run.sub_dir is None:
+            return new_run, None
 
-        logger.debug(f"Created run {run.id}")
-        return run
+        try:
+            old_run_dir = cast(Path, run.run_dir(self.weskit_context))
+            if not self.require_workdir_tag:
+                new_run.sub_dir = self._default_sub_dir(new_run.id)
+            new_run_dir = cast(Path, new_run.run_dir(self.weskit_context))
+            if new_run_dir != old_run_dir and old_run_dir.exists():
+                os.makedirs(new_run_dir.parent, exist_ok=True)
+                os.rename(old_run_dir, new_run_dir)
+            for suffix in [".yaml", ".sha256"]:
+                old_file = new_run_dir / f"{run.id}{suffix}"
+                if old_file.exists():
+                    os.rename(old_file, new_run_dir / f"{new_run.id}{suffix}")
+        except OSError as e:
+            logger.error(f"{e} while moving run {run.id} to new run ID {new_run.id}")
+            new_run.processing_stage = ProcessingStage.SYSTEM_ERROR
+            return new_run, None
+
+        if new_run.processing_stage != ProcessingStage.PREPARED_EXECUTION:
+            return new_run, None
+        return new_run, self._run_task_arguments(new_run)
+
+    @staticmethod
+    def _default_sub_dir(run_id: UUID) -> Path:
+        # The leading characters of the (time-ordered) run IDs are the same for many runs.
+        # The random trailing characters distribute the runs evenly over the directories.
+        return Path(str(run_id)[-4:]) / str(run_id)
 
     def get_run(self, run_id: Union[UUID, str]) -> Optional[Run]:
         """
@@ -209,14 +352,33 @@ class Manager:
             run_id = UUID(run_id)
         return self.database.get_run(run_id)
 
+    def get_current_run(self, run_id: Union[UUID, str]) -> Optional[Run]:
+        """
+        Like `get_run`, but the run is updated from the Celery result backend first, unless the
+        run states are written into the database from Celery task events (`task_event_updates`).
+        """
+        run = self.get_run(run_id)
+        if run is not None and not self.task_event_updates:
+            run = self.update_run(run)
+        return run
+
     # check files, uploads and returns list of valid filenames
     def _process_workflow_attachment(self,
                                      run: Run,
                                      files: "Optional[ImmutableMultiDict[str, FileStorage]]") \
             -> List[Path]:
+        """
+        Move (or copy) the attachments into the run directory, and write their SHA-256 checksums
+        into the `<run_id>.sha256` file of the run directory. With `deduplicate_attachments`, the
+        attachments are hard links into the content-addressed `attachment_store`. With
+        `extract_attachment_archive`, a single zip or tar attachment is extracted into the run
+        directory, and the extracted files are returned in addition to the archive.
+        """
         if run.sub_dir is None:
             raise RuntimeError(f"Oops! run.subdir should be set: {run}")
+        run_dir = cast(Path, run.run_dir(self.weskit_context))
         attachment_filenames = []
+        checksums = []
         if files is not None and "workflow_attachment" in files:
             workflow_attachment_files = files.getlist("workflow_attachment")
             for attachment in workflow_attachment_files:
@@ -226,7 +388,25 @@ class Manager:
                     filename = Path(secure_filename(attachment.filename))
                     # TODO could implement checks here
                     attachment_filenames.append(filename)
-                    attachment.save(run.run_dir(self.weskit_context) / filename)  # type: ignore
+                    if self.attachment_store is not None:
+                        size, sha256 = self.attachment_store.add(attachment,
+                                                                 run_dir / filename,
+                                                                 self.max_attachment_size)
+                    else:
+                        size, sha256 = save_attachment(attachment,
+                                                       run_dir / filename,
+                                                       self.max_attachment_size)
+                    checksums.append((filename, sha256))
+                    logger.debug(f"Saved attachment {filename} of run {run.id}: "
+                                 f"{size} bytes, SHA-256 {sha256}")
+            write_checksums(run_dir / f"{run.id}.sha256", checksums)
+
+            if self.extract_attachment_archive and \
+                    len(attachment_filenames) == 1 and \
+                    is_archive(attachment_filenames[0]):
+                attachment_filenames += extract_archive(run_dir / attachment_filenames[0],
+                                                        run_dir,
+                                                        self.max_attachment_size)
         return attachment_filenames
 
     def _prepare_workflow_path(self,
@@ -265,7 +445,7 @@ class Manager:
             elif Path(workflow_url.path) in attachment_filenames:
                 # File should already be extracted to work-dir. The command is executed in the
                 # work-dir as the current work-dir, so we take it as it is.
-                workflow_path_rel = Path(secure_filename(workflow_url.path))
+                workflow_path_rel = Path(workflow_url.path)
 
             else:
                 # The file refers to an already installed workflow.
@@ -307,21 +487,34 @@ class Manager:
                           run: Run,
                           files: "Optional[ImmutableMultiDict[str, FileStorage]]" = None)\
             -> Run:
-        if files is None:
-            files = ImmutableMultiDict()
-
         if run.processing_stage != ProcessingStage.RUN_CREATED:
             logger.error("run.processing_stage not RUN_CREATED",
                          f"but {run.processing_stage.name}")
             run.processing_stage = ProcessingStage.SYSTEM_ERROR
             self.database.update_run(run, resolution_fun=Run.merge)
 
+        run = self._prepare_run(run, files)
+        if run.processing_stage == ProcessingStage.SYSTEM_ERROR:
+            self.database.update_run(run, resolution_fun=Run.merge)
+        return run
+
+    def _prepare_run(self,
+                     run: Run,
+                     files: "Optional[ImmutableMultiDict[str, FileStorage]]" = None) \
+            -> Run:
+        """
+        Prepare the run directory and the workflow, and set the fields of the run needed for the
+        execution. The run is only modified in memory. Errors set the run to SYSTEM_ERROR.
+        """
+        if files is None:
+            files = ImmutableMultiDict()
+
         # Prepare run directory
         if self.require_workdir_tag:
             run_dir_url = urlparse(run.request["tags"]["run_dir"]).path
             run.sub_dir = Path(run_dir_url)
         else:
-            run.sub_dir = Path(str(run.id)[0:4]) / str(run.id)
+            run.sub_dir = self._default_sub_dir(run.id)
 
         try:
             # Casting is safe, here. run.sub_dir is set.
@@ -345,16 +538,33 @@ class Manager:
             # run to be in SYSTEM_ERROR state.
             logger.error(f" {e} during preparation of the execution.")
             run.processing_stage = ProcessingStage.SYSTEM_ERROR
-            self.database.update_run(run, resolution_fun=Run.merge)
         return run
 
     def execute(self, run: Run) -> Run:
+        task_arguments = self._run_task_arguments(run)
+        if task_arguments is None:
+            self.database.update_run(run, resolution_fun=Run.merge)
+            return run
+
+        self._run_task.apply_async(
+            task_id=run.celery_task_id,
+            args=[],
+            kwargs=task_arguments)
+        run.processing_stage = ProcessingStage.SUBMITTED_EXECUTION
+
+        return run
+
+    def _run_task_arguments(self, run: Run) -> Optional[Dict[str, Any]]:
+        """
+        Create the command for the prepared run and return the keyword arguments for the
+        run_command task. The command and start time are set in the run, which is only modified
+        in memory. If the run cannot be executed, it is set to SYSTEM_ERROR and None is returned.
+        """
         if run.processing_stage != ProcessingStage.PREPARED_EXECUTION:
             logger.error("run.processing_stage not PREPARED_EXECUTION but",
                          f" {run.processing_stage}")
             run.processing_stage = ProcessingStage.SYSTEM_ERROR
-            self.database.update_run(run, resolution_fun=Run.merge)
-            return run
+            return None
 
         # Set workflow_type
         if run.request["workflow_type"] in self.workflow_engines.keys():
@@ -365,8 +575,7 @@ class Manager:
                          (run.request["workflow_type"],
                           ", ".join(self.workflow_engines.keys())))
             run.processing_stage = ProcessingStage.SYSTEM_ERROR
-            self.database.update_run(run, resolution_fun=Run.merge)
-            return run
+            return None
 
         # Set workflow type version
         if run.request["workflow_type_version"] in self.workflow_engines[workflow_type].keys():
@@ -377,14 +586,12 @@ class Manager:
                          (run.request["workflow_type_version"],
                           ", ".join(self.workflow_engines[workflow_type].keys())))
             run.processing_stage = ProcessingStage.SYSTEM_ERROR
-            self.database.update_run(run, resolution_fun=Run.merge)
-            return run
+            return None
 
         if run.rundir_rel_workflow_path is None:
             logger.error(f"Workflow path of run is None: {run.id}")
             run.processing_stage = ProcessingStage.SYSTEM_ERROR
-            self.database.update_run(run, resolution_fun=Run.merge)
-            return run
+            return None
 
         # Execute run
         config_files: List[Path] = [Path(f"{run.id}.yaml")]
@@ -401,15 +608,132 @@ class Manager:
         run.execution_log["cmd"] = command.command
         run.execution_log["env"] = command.environment
         run.start_time = now()
-        self._run_task.apply_async(
-            task_id=run.celery_task_id,
-            args=[],
-            kwargs={
-                "command": command,
-                "worker_context": self.weskit_context,
-                "executor_context": self.executor_context,
-                "execution_settings": execution_settings
-            })
-        run.processing_stage = ProcessingStage.SUBMITTED_EXECUTION
+        return {
+            "command": command,
+            "worker_context": self.weskit_context,
+            "executor_context": self.executor_context,
+            "execution_settings": execution_settings,
+            # The run's start time determines the log directory, such that the logs can be
+            # followed while the run is running (see Run.stdout_file()).
+            "start_time": run.start_time
+        }
+
+    def _prepare_submission(self,
+                            run: Run,
+                            files: "Optional[ImmutableMultiDict[str, FileStorage]]" = None) \
+            -> Optional[Dict[str, Any]]:
+        """
+        Prepare the new run in memory and return the arguments for its run_command task, or None
+        if the run could not be prepared (then the run is in SYSTEM_ERROR).
+        """
+        self._prepare_run(run, files)
+        if run.processing_stage != ProcessingStage.PREPARED_EXECUTION:
+            return None
+        return self._run_task_arguments(run)
+
+    def submit_run(self,
+                   validated_request,
+                   user_id: str,
+                   files: "Optional[ImmutableMultiDict[str, FileStorage]]" = None) -> Run:
+        """
+        Create, prepare and submit a run with only two writes: The fully prepared run is inserted
+        once, before its task is published, such that there is no task without a run in the
+        database. After the publication, the run is marked as submitted with a single field
+        update. Runs that could not be prepared are stored in the SYSTEM_ERROR stage.
+
+        Returns the run as inserted, i.e. without the update of the processing stage.
+
+        With `async_preparation`, the run is inserted in the PREPARING stage and its preparation
+        and submission are done by a prepare_run Celery task (see `prepare_and_execute`), such
+        that the request is answered without waiting for e.g. the installation of the workflow.
+        Requests with workflow attachments are still prepared synchronously, because the
+        attachments are only available during the request.
+        """
+        run = self._create_run(validated_request, user_id)
+        if self.async_preparation and (files is None or len(files) == 0):
+            run.processing_stage = ProcessingStage.PREPARING
+            runs: List[Run] = [run]
+            self._insert_new_runs(runs, [None])
+            run = runs[0]
+            logger.debug(f"Created run {run.id}")
+            self._send_prepare_task(run)
+            return run
 
+        runs = [run]
+        all_task_arguments = [self._prepare_submission(run, files)]
+        self._insert_new_runs(runs, all_task_arguments)
+        run, task_arguments = runs[0], all_task_arguments[0]
+        logger.debug(f"Created run {run.id}")
+        if task_arguments is not None:
+            self._run_task.apply_async(
+                task_id=run.celery_task_id,
+                args=[],
+                kwargs=task_arguments)
+            self.database.update_processing_stages([run.id],
+                                                   ProcessingStage.PREPARED_EXECUTION,
+                                                   ProcessingStage.SUBMITTED_EXECUTION)
         return run
+
+    def prepare_and_execute(self, run_id: UUID) -> Optional[Run]:
+        """
+        Prepare a run in the PREPARING stage and submit its run_command task. This is the
+        worker-side part of `submit_run` with `async_preparation`. The prepared run is stored
+        before its task is published. Runs that could not be prepared are stored in the
+        SYSTEM_ERROR stage. Returns None, if the run does not exist or is not PREPARING.
+        """
+        run = self.database.get_run(run_id)
+        if run is None:
+            logger.error(f"Cannot prepare run {run_id}: Run not found")
+            return None
+        if run.processing_stage != ProcessingStage.PREPARING:
+            logger.warning(f"Not preparing run {run_id} in stage {run.processing_stage.name}")
+            return None
+
+        try:
+            task_arguments = self._prepare_submission(run)
+        except Exception as e:
+            logger.error(f"{e} during preparation of run {run_id}")
+            run.processing_stage = ProcessingStage.SYSTEM_ERROR
+            task_arguments = None
+        run = self.database.update_run(run, resolution_fun=Run.merge)
+
+        if task_arguments is not None:
+            self._run_task.apply_async(
+                task_id=run.celery_task_id,
+                args=[],
+                kwargs=task_arguments)
+            self.database.update_processing_stages([run.id],
+                                                   ProcessingStage.PREPARED_EXECUTION,
+                                                   ProcessingStage.SUBMITTED_EXECUTION)
+        return run
+
+    def submit_runs(self, validated_requests: List[dict], user_id: str) -> List[Run]:
+        """
+        Create, prepare and submit runs for many validated requests with a few round trips: The
+        runs are prepared in memory, inserted with a single bulk insert, their tasks are published
+        as one Celery group, and they are then marked as submitted with a single update.
+
+        The runs are inserted before the tasks are published, such that there is no task
+        without a run in the database. Runs that could not be prepared are stored in the
+        SYSTEM_ERROR stage. Returns the runs in the order of the requests.
+        """
+        runs = [self._create_run(request, user_id) for request in validated_requests]
+        all_task_arguments = [self._prepare_submission(run) for run in runs]
+        self._insert_new_runs(runs, all_task_arguments)
+
+        task_signatures = [self._run_task.s(**task_arguments).set(task_id=run.celery_task_id)
+                           for run, task_arguments in zip(runs, all_task_arguments)
+                           if task_arguments is not None]
+        if len(task_signatures) > 0:
+            group(task_signatures).apply_async()
+            prepared_run_ids = [run.id for run in runs
+                                if run.processing_stage == ProcessingStage.PREPARED_EXECUTION]
+            self.database.update_processing_stages(prepared_run_ids,
+                                                   ProcessingStage.PREPARED_EXECUTION,
+                                                   ProcessingStage.SUBMITTED_EXECUTION)
+            # Read the submitted runs back with a single query, to return their stored versions.
+            submitted_runs = {run.id: run
+                              for run in self.database.get_runs({"id": {"$in": prepared_run_ids}})}
+            runs = [submitted_runs.get(run.id, run) for run in runs]
+        logger.debug(f"Submitted {len(task_signatures)} of {len(runs)} runs")
+        return runs
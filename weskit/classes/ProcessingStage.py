@@ -18,6 +18,11 @@ class ProcessingStage(enum.Enum):
     #            were partially written to the run-dir.
     RUN_CREATED = 100
 
+    # > PREPARING: The run was created and its preparation (run directory, workflow installation,
+    #              etc.) is done by a Celery task, rather than during the submission request.
+    #              There is no Celery task ID of the workflow engine execution yet.
+    PREPARING = 150
+
     # > PREPARED_EXECUTION: A Celery task ID was defined and the execution may or
     #                       may not have started.
     PREPARED_EXECUTION = 200
@@ -110,6 +115,7 @@ class ProcessingStage(enum.Enum):
     @staticmethod
     def INITIALIZING_STAGES() -> List[ProcessingStage]:
         return [ProcessingStage.RUN_CREATED,
+                ProcessingStage.PREPARING,
                 ProcessingStage.PREPARED_EXECUTION,
                 ProcessingStage.SUBMITTED_EXECUTION,
                 ProcessingStage.AWAITING_START]
@@ -137,6 +143,11 @@ class ProcessingStage(enum.Enum):
     def is_terminal(self) -> bool:
         return self in self.TERMINAL_STAGES()
 
+    @staticmethod
+    def NON_TERMINAL_STAGES() -> List[ProcessingStage]:
+        return [stage for stage in ProcessingStage
+                if stage not in ProcessingStage.TERMINAL_STAGES()]
+
     @staticmethod
     def ERROR_STAGES() -> List[ProcessingStage]:
         return [ProcessingStage.SYSTEM_ERROR,
@@ -156,6 +167,7 @@ class ProcessingStage(enum.Enum):
         # that Celery could go from SUCCESS to CANCELED.
         PRECEDENCE = {
             ProcessingStage.RUN_CREATED: 100,
+            ProcessingStage.PREPARING: 150,
             ProcessingStage.PREPARED_EXECUTION: 200,
             ProcessingStage.SUBMITTED_EXECUTION: 300,
             ProcessingStage.AWAITING_START: 400,
@@ -7,13 +7,13 @@ from __future__ import annotations
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict, Any, Mapping
+from typing import Optional, List, Dict, Any, Mapping, Iterable, Set, cast
 from uuid import UUID
 
 from weskit.serializer import to_json, from_json
 from weskit.classes.PathContext import PathContext
 from weskit.classes.ProcessingStage import ProcessingStage
-from weskit.utils import format_timestamp, from_formatted_timestamp, updated
+from weskit.utils import format_timestamp, from_formatted_timestamp
 from weskit.utils import mop
 
 logger = logging.getLogger(__name__)
@@ -23,8 +23,31 @@ class Run:
     """
     Note that some fields are translated into str and can be provided typed or as str for the
     sake of simplicity when doing serialization.
+
+    Runs loaded from the database (`from_bson_serializable`) decode the potentially large fields
+    (see `_LAZY_FIELDS`) only when they are accessed. Modifications are tracked per field by the
+    setters. Only the fields in `_MUTABLE_FIELDS` may also be modified in place. They are compared
+    to their reference, if they were accessed. All other fields must be replaced via their setters.
     """
 
+    # WARNING: If you add fields don't forget to add them to _FIELDS (and _LAZY_FIELDS, if the
+    #          values are large or mutable) and merge() and explain in the code why, in case the
+    #          field was not added there.
+    _FIELDS = ["id", "db_version", "request_time", "request", "user_id", "celery_task_id",
+               "exit_code", "sub_dir", "rundir_rel_workflow_path", "outputs", "execution_log",
+               "processing_stage", "start_time", "task_logs", "stdout", "stderr"]
+
+    _LAZY_FIELDS = ["request", "outputs", "execution_log", "task_logs", "stdout", "stderr"]
+
+    # The reference of the execution_log is its JSON string, which is immutable and free for runs
+    # loaded from the database.
+    _MUTABLE_FIELDS = ["execution_log"]
+
+    __slots__ = ["__id", "__db_version", "__request_time", "__user_id", "__exit_code",
+                 "__celery_task_id", "__run_dir", "__rundir_rel_workflow_path",
+                 "__processing_stage", "__start_time",
+                 "_decoded", "_encoded", "_references", "_modified"]
+
     def __init__(self,
                  id: UUID,
                  request_time: datetime,
@@ -40,50 +63,162 @@ class Run:
                  processing_stage: ProcessingStage = ProcessingStage.RUN_CREATED,
                  start_time: Optional[datetime] = None,
                  task_logs: Optional[list] = None,
-                 stdout: Optional[List[str]] = None,
-                 stderr: Optional[List[str]] = None
+                 stdout: Optional[Dict[str, Any]] = None,
+                 stderr: Optional[Dict[str, Any]] = None
                  ) -> None:
-        if task_logs is None:
-            task_logs = []
-        # WARNING: If you add fields don't forget to add them to __iter__ and merge() and explain
-        #          in the code why, in case the field was not added there.
+        self._init_tracking()
+        self._init_scalars(id=id,
+                           db_version=db_version,
+                           request_time=request_time,
+                           user_id=user_id,
+                           exit_code=exit_code,
+                           celery_task_id=celery_task_id,
+                           sub_dir=sub_dir,
+                           rundir_rel_workflow_path=rundir_rel_workflow_path,
+                           processing_stage=processing_stage,
+                           start_time=start_time)
+        lazy_values = {
+            "request": request,
+            "outputs": {} if len(outputs) == 0 else outputs,
+            "execution_log": {} if execution_log is None else execution_log,
+            "task_logs": [] if task_logs is None else task_logs,
+            "stdout": stdout,
+            "stderr": stderr
+        }
+        for field_name, value in lazy_values.items():
+            self._decoded[field_name] = value
+            # We keep the original data. Thus, we can detect any modification and don't have to
+            # clutter client code with copies of the old run, just to avoid identical updates in
+            # the database.
+            self._references[field_name] = Run._to_bson_value(field_name, value) \
+                if field_name in Run._MUTABLE_FIELDS else value
+        self._references["exit_code"] = self.exit_code
+
+    def _init_tracking(self) -> None:
+        self._decoded: Dict[str, Any] = {}
+        self._encoded: Dict[str, Any] = {}
+        self._references: Dict[str, Any] = {}
+        self._modified: Set[str] = set()
+
+    def _init_scalars(self,
+                      id: UUID,
+                      db_version: int,
+                      request_time: datetime,
+                      user_id: str,
+                      exit_code: Optional[int],
+                      celery_task_id: Optional[str],
+                      sub_dir: Optional[Path],
+                      rundir_rel_workflow_path: Optional[Path],
+                      processing_stage: ProcessingStage,
+                      start_time: Optional[datetime]) -> None:
         self.__id = id
         self.__db_version = db_version
         self.__request_time = request_time
-        self.__request = request
         self.__user_id = user_id
-        self.exit_code = exit_code
+        self.__exit_code = exit_code
+        self.__processing_stage = processing_stage
         self.celery_task_id = celery_task_id
         self.sub_dir = sub_dir
         self.rundir_rel_workflow_path = rundir_rel_workflow_path
-        self.outputs = {} if len(outputs) == 0 else outputs
-        if execution_log is None:
-            self.execution_log = {}
-        else:
-            self.execution_log = execution_log
-        self.__processing_stage = processing_stage
         self.start_time = start_time
-        self.task_logs = task_logs
-        self.stdout = stdout
-        self.stderr = stderr
+        self._references.update(celery_task_id=celery_task_id,
+                                sub_dir=sub_dir,
+                                rundir_rel_workflow_path=rundir_rel_workflow_path,
+                                processing_stage=processing_stage,
+                                start_time=start_time)
+
+    def _reference(self, field_name: str) -> Any:
+        reference = self._references[field_name]
+        if field_name == "execution_log" and isinstance(reference, str):
+            # Decoded once on demand, rather than encoding the current value for every check.
+            reference = self._references[field_name] = from_json(reference)
+        return reference
+
+    def _track(self, field_name: str, value: Any) -> None:
+        """
+        Mark a field as modified, if the new value differs from the reference.
+        """
+        if field_name in self._references and value != self._reference(field_name):
+            self._modified.add(field_name)
+        else:
+            self._modified.discard(field_name)
+
+    def _modified_in_place(self, field_name: str) -> bool:
+        return field_name in self._decoded and \
+            self._decoded[field_name] != self._reference(field_name)
+
+    def _lazy_value(self, field_name: str) -> Any:
+        if field_name in self._encoded:
+            # The encoded value is the reference. Only the execution_log is decoded into a new
+            # object, all other values are handed out as they were read from the database.
+            encoded = self._encoded.pop(field_name)
+            self._references[field_name] = encoded
+            self._decoded[field_name] = from_json(encoded) \
+                if field_name == "execution_log" else encoded
+        return self._decoded[field_name]
+
+    def _set_lazy_value(self, field_name: str, value: Any) -> None:
+        if field_name in self._encoded:
+            # Overwritten without having been accessed. The encoded value is the reference.
+            self._references[field_name] = self._encoded.pop(field_name)
+        self._decoded[field_name] = value
+        if field_name not in Run._MUTABLE_FIELDS:
+            # The mutable fields are compared to their reference anyway.
+            self._track(field_name, value)
 
-        # We keep a copy of the original data in the form of a dictionary representation.
-        # Thus, we can detect any modification and don't have to clutter client code with copies
-        # of the old run, just to avoid identical replacements in the database.
-        self._reference = dict(self)
+    @staticmethod
+    def _same_encoded(field_name: str, we: Run, them: Run) -> bool:
+        """
+        Fields that were not decoded in both runs are compared without decoding them.
+        """
+        return field_name in we._encoded and field_name in them._encoded and \
+            we._encoded[field_name] == them._encoded[field_name]
+
+    def _copy(self) -> Run:
+        """
+        A copy of the run with its current values as reference. As with `Run(**dict(run))`, the
+        values are shared and not copied, but fields that were not decoded stay encoded.
+        """
+        run = Run.__new__(Run)
+        run._init_tracking()
+        run._init_scalars(id=self.id,
+                          db_version=self.db_version,
+                          request_time=self.request_time,
+                          user_id=self.user_id,
+                          exit_code=self.__exit_code,
+                          celery_task_id=self.celery_task_id,
+                          sub_dir=self.sub_dir,
+                          rundir_rel_workflow_path=self.rundir_rel_workflow_path,
+                          processing_stage=self.processing_stage,
+                          start_time=self.start_time)
+        run._encoded = dict(self._encoded)
+        run._decoded = dict(self._decoded)
+        for field_name, value in self._decoded.items():
+            if field_name not in Run._MUTABLE_FIELDS:
+                run._references[field_name] = value
+            elif self._modified_in_place(field_name):
+                run._references[field_name] = Run._to_bson_value(field_name, value)
+            else:
+                # The reference is not modified in place, so it can be shared.
+                run._references[field_name] = self._references[field_name]
+        run._references["exit_code"] = self.exit_code if "execution_log" in self._decoded \
+            else self._references["exit_code"]
+        return run
 
     @staticmethod
-    def _merge_field(field_name: str, we: dict, them: dict, default_value):
+    def _merge_field(field_name: str, we: Run, them: Run, default_value):
         """
         Two values can be reconciled, if they are identical or if one of them is the default
         value. If both values differ from the default, raise an exception.
         """
-        if we[field_name] == them[field_name]:
-            return we[field_name]
-        elif we[field_name] is default_value:
-            return them[field_name]
-        elif them[field_name] is default_value:
-            return we[field_name]
+        our_value = getattr(we, field_name)
+        their_value = getattr(them, field_name)
+        if our_value == their_value:
+            return our_value
+        elif our_value == default_value:
+            return their_value
+        elif their_value == default_value:
+            return our_value
         else:
             raise RuntimeError(
                 f"Could not merge field '{field_name}':\n\twe={we}\n\tthem={them}")
@@ -103,7 +238,10 @@ class Run:
             {key: values for key, values in old_outputs.items()}
         for key, values in other_outputs.items():
             if key in new_outputs:
-                new_outputs[key] = list(set(new_outputs[key]).union(values))
+                # Keep the order, such that merging identical outputs is no modification.
+                known_values = set(new_outputs[key])
+                new_outputs[key] = new_outputs[key] + \
+                    [value for value in values if value not in known_values]
             else:
                 new_outputs[key] = values
         return new_outputs
@@ -147,69 +285,111 @@ class Run:
         * Optional fields are set to the unambiguous value != None.
         * All fields where both Runs have a non-None value are accepted, if the value is the same.
         * If a field has different non-None value in the two Runs
-        * The new run will be marked as modified if any of the self-fields have been modified.
+        * The new run will be marked as modified if it differs from `other`.
+
+        The merged run has the db_version of `other`, which usually is the run currently stored in
+        the database. Thus, the merged run can be used to update the stored run.
         """
 
         if self.id != other.id or \
                 self.request_time != other.request_time or \
-                self.request != other.request or \
+                (not Run._same_encoded("request", self, other) and
+                 self.request != other.request) or \
                 self.user_id != other.user_id:
             # db_version is not tested, because the whole point of merge is to resolve concurrent
             # modifications.
             raise RuntimeError(f"Cannot merge runs:\t\nself={self}\n\tother={other}")
         else:
-            self_d = dict(self)
-            other_d = dict(other)
-            copy = Run(**self_d)
-            # We keep a copy of the original data in the form of a dictionary representation.
-            # Thus, we can detect any modification and don't have to clutter client code with copies
-            # of the old run, just to avoid identical replacements in the database.
-            copy._reference = dict(self)
+            # Start from (a copy of) the other run. Thus, the merged run has other's db_version
+            # and only fields that differ from other are considered modified. Lazy fields that
+            # are identical in both runs are not decoded.
+            merged = other._copy()
 
             # The easy fields:
-            copy.celery_task_id = Run._merge_field("celery_task_id", self_d, other_d, None)
-            copy.exit_code = Run._merge_field("exit_code", self_d, other_d, None)
-            copy.sub_dir = Run._merge_field("sub_dir", self_d, other_d, None)
-            copy.rundir_rel_workflow_path = Run._merge_field("rundir_rel_workflow_path",
-                                                             self_d, other_d, None)
-            copy.start_time = Run._merge_field("start_time", self_d, other_d, None)
-            copy.stdout = Run._merge_field("stdout", self_d, other_d, None)
-            copy.stderr = Run._merge_field("stderr", self_d, other_d, None)
-            copy.execution_log = Run._merge_field("execution_log", self_d, other_d, {})
-            copy.task_logs = Run._merge_field("task_logs", self_d, other_d, [])
+            merged.celery_task_id = Run._merge_field("celery_task_id", self, other, None)
+            merged.sub_dir = Run._merge_field("sub_dir", self, other, None)
+            merged.rundir_rel_workflow_path = Run._merge_field("rundir_rel_workflow_path",
+                                                               self, other, None)
+            merged.start_time = Run._merge_field("start_time", self, other, None)
+            for field_name, default_value in [("stdout", None),
+                                              ("stderr", None),
+                                              ("task_logs", [])]:
+                if not Run._same_encoded(field_name, self, other):
+                    setattr(merged, field_name,
+                            Run._merge_field(field_name, self, other, default_value))
+            if not Run._same_encoded("execution_log", self, other):
+                # The exit code is derived from the execution_log.
+                merged.exit_code = Run._merge_field("exit_code", self, other, None)
+                merged.execution_log = Run._merge_field("execution_log", self, other, {})
 
             # Fields with special rules
-            copy.outputs = Run._merge_outputs(copy.outputs, other.outputs)
-            copy.processing_stage = Run._next_stage(copy.processing_stage, other.processing_stage)
-            return copy
-
-    def to_bson_serializable(self):
-        """
-        Create a BSON serializable object to be put into MongoDB.
-        """
-        result = dict(self)
-        result = updated(result,
-                         execution_log=to_json(self.execution_log),
-                         sub_dir=mop(result["sub_dir"], str),
-                         rundir_rel_workflow_path=mop(result["rundir_rel_workflow_path"], str),
-                         request_time=mop(result["request_time"], format_timestamp),
-                         start_time=mop(result["start_time"], format_timestamp),
-                         processing_stage=result["processing_stage"].name)
-        return result
+            if not Run._same_encoded("outputs", self, other):
+                merged.outputs = Run._merge_outputs(self.outputs, other.outputs)
+            merged.processing_stage = Run._next_stage(self.processing_stage,
+                                                      other.processing_stage)
+            return merged
+
+    @staticmethod
+    def _to_bson_value(field_name: str, value: Any) -> Any:
+        if field_name == "execution_log":
+            return to_json(value)
+        elif field_name in ["sub_dir", "rundir_rel_workflow_path"]:
+            return mop(value, str)
+        elif field_name in ["request_time", "start_time"]:
+            return mop(value, format_timestamp)
+        elif field_name == "processing_stage":
+            return value.name
+        else:
+            return value
+
+    def to_bson_serializable(self, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Create a BSON serializable object to be put into MongoDB. If `fields` are given, only
+        these fields are serialized (e.g. for updating only the modified fields).
+        """
+        field_names = Run._FIELDS if fields is None else fields
+        return {name: Run._to_bson_value(name, getattr(self, name)) for name in field_names}
 
     @staticmethod
     def from_bson_serializable(values: Mapping[str, Any]) -> Run:
         """
-        Construct Run from what was read from MongoDB.
+        Construct Run from what was read from MongoDB. The fields in `_LAZY_FIELDS` are only
+        decoded, when they are accessed.
+        """
+        run = Run.__new__(Run)
+        run._init_tracking()
+        run._init_scalars(
+            id=values["id"],
+            db_version=values["db_version"],
+            request_time=cast(datetime, mop(values["request_time"], from_formatted_timestamp)),
+            user_id=values["user_id"],
+            exit_code=values["exit_code"],
+            celery_task_id=values["celery_task_id"],
+            sub_dir=mop(values["sub_dir"], Path),
+            rundir_rel_workflow_path=mop(values["rundir_rel_workflow_path"], Path),
+            processing_stage=ProcessingStage.from_string(values["processing_stage"]),
+            start_time=mop(values["start_time"], from_formatted_timestamp))
+        run._encoded = {field_name: values[field_name] for field_name in Run._LAZY_FIELDS}
+        for log_name in ["stdout", "stderr"]:
+            if isinstance(run._encoded[log_name], list):
+                run._encoded[log_name] = Run._legacy_log_reference(log_name, values)
+        run._references["exit_code"] = values["exit_code"]
+        return run
+
+    @staticmethod
+    def _legacy_log_reference(log_name: str,
+                              values: Mapping[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Runs stored by older WESkit versions have the log content as a list of lines instead of a
+        reference to the log file. The reference is derived from the log file name in the
+        execution log. The size of the file is unknown. Returns None without log file name.
         """
-        args = updated(values,
-                       execution_log=from_json(values["execution_log"]),
-                       sub_dir=mop(values["sub_dir"], Path),
-                       rundir_rel_workflow_path=mop(values["rundir_rel_workflow_path"], Path),
-                       request_time=mop(values["request_time"], from_formatted_timestamp),
-                       start_time=mop(values["start_time"], from_formatted_timestamp),
-                       processing_stage=ProcessingStage.from_string(values["processing_stage"]))
-        return Run(**args)
+        execution_log = from_json(values["execution_log"]) \
+            if isinstance(values["execution_log"], str) else values["execution_log"]
+        path = (execution_log or {}).get(f"{log_name}_file")
+        if path is None:
+            return None
+        return {"path": path, "size": None, "lines": len(values[log_name])}
 
     def __eq__(self, other):
         return dict(self) == dict(other)
@@ -218,32 +398,42 @@ class Run:
         """
         This allows casting dict(run) and the reverse with Run(**run_dict).
         """
-        for (k, v) in {
-            "id": self.__id,
-            "db_version": self.__db_version,
-            "request_time": self.__request_time,
-            "request": self.__request,
-            "user_id": self.__user_id,
-            "celery_task_id": self.celery_task_id,
-            "exit_code": self.exit_code,
-            "sub_dir": self.sub_dir,
-            "rundir_rel_workflow_path": self.rundir_rel_workflow_path,
-            "outputs": self.outputs,
-            "execution_log": self.execution_log,
-            "processing_stage": self.processing_stage,
-            "start_time": self.start_time,
-            "task_logs": self.task_logs,
-            "stdout": self.stdout,
-            "stderr": self.stderr
-        }.items():
-            yield k, v
+        for field_name in Run._FIELDS:
+            yield field_name, getattr(self, field_name)
 
     def __str__(self):
         return f"Run({dict(self)})"
 
+    @property
+    def modified_fields(self) -> List[str]:
+        """
+        The names of the fields that differ from the originally constructed (or merged) run.
+        """
+        result = []
+        for field_name in Run._FIELDS:
+            if field_name in self._modified:
+                result.append(field_name)
+            elif field_name in Run._MUTABLE_FIELDS:
+                if self._modified_in_place(field_name):
+                    result.append(field_name)
+            elif field_name == "exit_code":
+                # The exit code is derived from the execution_log.
+                if "execution_log" in self._decoded and \
+                        self.exit_code != self._references["exit_code"]:
+                    result.append(field_name)
+        return result
+
+    @property
+    def stored_processing_stage(self) -> ProcessingStage:
+        """
+        The processing stage of the originally constructed (or merged) run, i.e. the stage stored
+        in the database, if the run was read from there.
+        """
+        return self._references["processing_stage"]
+
     @property
     def modified(self) -> bool:
-        return dict(self) != self._reference
+        return len(self.modified_fields) > 0
 
     @property
     def celery_task_id(self) -> Optional[str]:
@@ -251,6 +441,7 @@ class Run:
 
     @celery_task_id.setter
     def celery_task_id(self, celery_task_id: Optional[str]):
+        self._track("celery_task_id", celery_task_id)
         self.__celery_task_id = celery_task_id
 
     @property
@@ -262,6 +453,7 @@ class Run:
         if workflow_path is not None:
             if workflow_path.is_absolute():
                 raise ValueError("Run.workflow_path must be relative path")
+        self._track("rundir_rel_workflow_path", workflow_path)
         self.__rundir_rel_workflow_path = workflow_path
 
     @property
@@ -273,11 +465,12 @@ class Run:
         if rel_run_dir is not None:
             if rel_run_dir.is_absolute():
                 raise ValueError("Run.dir must be relative path")
+        self._track("sub_dir", rel_run_dir)
         self.__run_dir = rel_run_dir
 
     @property
     def request(self):
-        return self.__request
+        return self._lazy_value("request")
 
     @property
     def request_time(self) -> datetime:
@@ -297,11 +490,11 @@ class Run:
 
     @property
     def execution_log(self) -> Dict[str, Any]:
-        return self.__execution_log
+        return self._lazy_value("execution_log")
 
     @execution_log.setter
     def execution_log(self, execution_log: Dict[str, Any]):
-        self.__execution_log = execution_log
+        self._set_lazy_value("execution_log", execution_log)
 
     @property
     def exit_code(self) -> Optional[int]:
@@ -321,14 +514,23 @@ class Run:
             logger.debug("Updating stage of %s: %s -> %s" %
                          (self.id, self.__processing_stage.name, stage.name))
             self.__processing_stage = self.__processing_stage.progress_to(stage)
+            self._track("processing_stage", self.__processing_stage)
 
     @property
     def outputs(self) -> Dict[str, List[str]]:
-        return self.__outputs
+        return self._lazy_value("outputs")
 
     @outputs.setter
     def outputs(self, outputs: Dict[str, List[str]]):
-        self.__outputs = outputs
+        self._set_lazy_value("outputs", outputs)
+
+    @property
+    def task_logs(self) -> list:
+        return self._lazy_value("task_logs")
+
+    @task_logs.setter
+    def task_logs(self, task_logs: list):
+        self._set_lazy_value("task_logs", task_logs)
 
     @property
     def start_time(self) -> Optional[datetime]:
@@ -336,6 +538,7 @@ class Run:
 
     @start_time.setter
     def start_time(self, start_time: Optional[datetime]):
+        self._track("start_time", start_time)
         self.__start_time = start_time
 
     @property
@@ -343,20 +546,28 @@ class Run:
         return self.__user_id
 
     @property
-    def stdout(self) -> Optional[List[str]]:
-        return self.__stdout
+    def stdout(self) -> Optional[Dict[str, Any]]:
+        """
+        Reference to the standard output file of the workflow engine: The "path" relative to
+        the run directory, its "size" in bytes, and the number of "lines". The content itself is
+        not stored in the run.
+        """
+        return self._lazy_value("stdout")
 
     @stdout.setter
-    def stdout(self, lines: List[str]):
-        self.__stdout = lines
+    def stdout(self, log_file: Optional[Dict[str, Any]]):
+        self._set_lazy_value("stdout", log_file)
 
     @property
-    def stderr(self) -> Optional[List[str]]:
-        return self.__stderr
+    def stderr(self) -> Optional[Dict[str, Any]]:
+        """
+        Reference to the standard error file of the workflow engine (see `stdout`).
+        """
+        return self._lazy_value("stderr")
 
     @stderr.setter
-    def stderr(self, lines: List[str]):
-        self.__stderr = lines
+    def stderr(self, log_file: Optional[Dict[str, Any]]):
+        self._set_lazy_value("stderr", log_file)
 
     # Methods for context-dependent paths. E.g. in docker container, or on remote host.
     # Dependent on whether self.dir is set or not, these methods may return None.
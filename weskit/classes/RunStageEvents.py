@@ -0,0 +1,147 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional
+from uuid import UUID
+
+from pymongo.errors import OperationFailure
+
+from weskit.classes.Database import Database
+from weskit.classes.ProcessingStage import ProcessingStage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RunStageEvent:
+    run_id: UUID
+    processing_stage: ProcessingStage
+    db_version: int
+
+    @staticmethod
+    def from_run_data(run_data: Mapping[str, Any]) -> RunStageEvent:
+        return RunStageEvent(run_id=run_data["id"],
+                             processing_stage=ProcessingStage.from_string(
+                                 run_data["processing_stage"]),
+                             db_version=run_data["db_version"])
+
+
+class RunStageEvents:
+    """
+    The changes of the processing stages of the runs of a user. Iterating yields a RunStageEvent
+    for each change, or None if there was no change within `heartbeat_interval` seconds (e.g. to
+    keep a connection alive). The iteration ends after `max_duration` seconds.
+
+    The current stages of the user's non-terminal runs are yielded first. Afterwards, the changes
+    are read from a MongoDB change stream. If the database does not support change streams (e.g.
+    a standalone server rather than a replica set), the runs are polled every `poll_interval`
+    seconds.
+
+    `close()` calls `on_close` once (e.g. to release the stream's slot in `RunStageEventStreams`).
+    """
+
+    def __init__(self,
+                 database: Database,
+                 user_id: str,
+                 heartbeat_interval: float = 15.0,
+                 poll_interval: float = 2.0,
+                 max_duration: float = 300.0,
+                 on_close: Optional[Callable[[], None]] = None) -> None:
+        self.database = database
+        self.user_id = user_id
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.max_duration = max_duration
+        self._on_close = on_close
+
+    def close(self) -> None:
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close()
+
+    def __iter__(self) -> Iterator[Optional[RunStageEvent]]:
+        deadline = time.monotonic() + self.max_duration
+        try:
+            stream = self.database.watch_run_stages(
+                self.user_id,
+                max_await_time_ms=int(self.heartbeat_interval * 1000))
+        except OperationFailure as e:
+            logger.info(f"No change stream ({e}). Polling the processing stages")
+            yield from self._poll(deadline)
+            return
+
+        with stream:
+            # The stream is opened before the current stages are read, to not miss changes.
+            yield from self._current_events()
+            while time.monotonic() < deadline:
+                change = stream.try_next()
+                if change is None:
+                    yield None
+                elif change["fullDocument"] is not None:
+                    # Only changes of the user's runs are sent by the database.
+                    yield RunStageEvent.from_run_data(change["fullDocument"])
+
+    def _current_events(self) -> Iterator[RunStageEvent]:
+        for run_data in self.database.get_run_stages(self.user_id, []):
+            yield RunStageEvent.from_run_data(run_data)
+
+    def _poll(self, deadline: float) -> Iterator[Optional[RunStageEvent]]:
+        # The last seen stages of the runs that were non-terminal, when last seen.
+        known: Dict[UUID, str] = {}
+        last_event_time = time.monotonic()
+        while time.monotonic() < deadline:
+            for run_data in self.database.get_run_stages(self.user_id, known.keys()):
+                if known.get(run_data["id"]) != run_data["processing_stage"]:
+                    event = RunStageEvent.from_run_data(run_data)
+                    if event.processing_stage.is_terminal:
+                        known.pop(event.run_id, None)
+                    else:
+                        known[event.run_id] = run_data["processing_stage"]
+                    last_event_time = time.monotonic()
+                    yield event
+            if time.monotonic() - last_event_time >= self.heartbeat_interval:
+                last_event_time = time.monotonic()
+                yield None
+            time.sleep(self.poll_interval)
+
+
+class RunStageEventStreams:
+    """
+    Opens the RunStageEvents for the users, but at most `max_streams` at a time (per process).
+    Each open stream occupies a server thread for up to `max_duration` seconds, and without
+    change streams also queries the database every `poll_interval` seconds.
+    """
+
+    def __init__(self,
+                 database: Database,
+                 max_streams: int = 4,
+                 heartbeat_interval: float = 15.0,
+                 poll_interval: float = 2.0,
+                 max_duration: float = 300.0) -> None:
+        self.database = database
+        self.max_streams = max_streams
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.max_duration = max_duration
+        self._slots = threading.BoundedSemaphore(max_streams)
+
+    def open(self, user_id: str) -> Optional[RunStageEvents]:
+        """
+        The events of the user's runs, or None if `max_streams` streams are open. The slot of the
+        stream is released, when the returned RunStageEvents are closed.
+        """
+        if not self._slots.acquire(blocking=False):
+            return None
+        return RunStageEvents(self.database,
+                              user_id,
+                              heartbeat_interval=self.heartbeat_interval,
+                              poll_interval=self.poll_interval,
+                              max_duration=self.max_duration,
+                              on_close=self._slots.release)
@@ -0,0 +1,116 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from celery import states
+
+from weskit.classes.CeleryTaskSnapshot import CeleryTaskSnapshot
+from weskit.classes.Manager import Manager
+from weskit.classes.Run import Run
+
+logger = logging.getLogger(__name__)
+
+
+class TaskEventConsumer:
+    """
+    Apply the Celery task events of the run_command tasks to the runs in the database, as soon as
+    the workers send them. Workers only send events with `worker_send_task_events` (see the
+    `task_event_updates` option). The events are not persisted by the broker, so events sent
+    while no consumer is running are lost. The periodic `update_runs` task still updates such
+    runs from the result backend.
+    """
+
+    # Celery states that correspond to the task events.
+    EVENT_STATES = {
+        "task-started": states.STARTED,
+        "task-succeeded": states.SUCCESS,
+        "task-failed": states.FAILURE,
+        "task-revoked": states.REVOKED
+    }
+
+    def __init__(self,
+                 manager: Manager,
+                 max_tries: int = 3,
+                 retry_interval: float = 5.0) -> None:
+        self.manager = manager
+        self.max_tries = max_tries
+        self.retry_interval = retry_interval
+
+    @property
+    def handlers(self) -> Dict[str, Callable[[Mapping[str, Any]], Optional[Run]]]:
+        return {event_type: self.on_task_event for event_type in self.EVENT_STATES}
+
+    def _snapshot(self, task_id: str, state: str, event: Mapping[str, Any]) \
+            -> Optional[CeleryTaskSnapshot]:
+        if state == states.SUCCESS:
+            # Events contain only the repr() of the result, but the result is stored in the
+            # backend before the event is sent.
+            snapshot = CeleryTaskSnapshot.fetch_all(self.manager.celery_app, [task_id])[task_id]
+            if snapshot.state != states.SUCCESS:
+                logger.warning(f"Celery task {task_id} succeeded, but its result is in state "
+                               f"'{snapshot.state}'. Leaving the update to update_runs")
+                return None
+            return snapshot
+        else:
+            return CeleryTaskSnapshot(task_id=task_id,
+                                      state=state,
+                                      result=event.get("exception"))
+
+    def on_task_event(self, event: Mapping[str, Any]) -> Optional[Run]:
+        """
+        Update the run of the task in the event. Return the updated run, or None if the event is
+        not about a run (e.g. other WESkit tasks) or could not be applied. Errors are only logged,
+        such that a single event that cannot be applied does not stop the consumption of events.
+        """
+        try:
+            return self._apply_event(event)
+        except Exception as e:
+            logger.error(f"Could not apply '{event.get('type')}' event of Celery task "
+                         f"{event.get('uuid')}", exc_info=e)
+            return None
+
+    def _apply_event(self, event: Mapping[str, Any]) -> Optional[Run]:
+        state = self.EVENT_STATES.get(event["type"])
+        if state is None:
+            return None
+        task_id = event["uuid"]
+        run = self.manager.database.get_run_by_celery_task_id(task_id)
+        if run is None:
+            return None
+        if run.processing_stage.is_terminal:
+            # E.g. a "task-started" event that is processed after the run was updated from the
+            # result backend.
+            logger.debug(f"Ignoring '{event['type']}' event of run {run.id} in terminal stage "
+                         f"{run.processing_stage.name}")
+            return run
+
+        snapshot = self._snapshot(task_id, state, event)
+        if snapshot is None:
+            return None
+        run = self.manager.update_run(run, self.max_tries, snapshot)
+        logger.debug(f"Run {run.id} is in stage {run.processing_stage.name} "
+                     f"after '{event['type']}' event")
+        return run
+
+    def capture(self) -> None:
+        """
+        Consume the task events forever. On broker connection errors, reconnect after
+        `retry_interval` seconds.
+        """
+        celery_app = self.manager.celery_app
+        while True:
+            with celery_app.connection_for_read() as connection:
+                try:
+                    receiver = celery_app.events.Receiver(connection, handlers=self.handlers)
+                    logger.info("Consuming Celery task events")
+                    receiver.capture(limit=None, timeout=None, wakeup=True)
+                except connection.connection_errors as e:
+                    logger.warning(f"Lost connection to the broker: {e}. Reconnecting in "
+                                   f"{self.retry_interval} s")
+            time.sleep(self.retry_interval)
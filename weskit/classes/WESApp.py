@@ -8,26 +8,52 @@ from __future__ import annotations
 
 from logging import Logger
 
-from typing import Optional, cast
+from typing import IO, Optional, cast
 
-from flask import Flask
+from flask import Flask, Request, current_app
 
+from weskit.classes.Attachment import AttachmentFile
 from weskit.classes.Manager import Manager
+from weskit.classes.RunStageEvents import RunStageEventStreams
+from weskit.api.DrsUrlResolver import DrsUrlResolver
+from weskit.api.JSONProvider import OrjsonProvider
 from weskit.api.ServiceInfo import ServiceInfo
 from weskit.oidc.Login import Login
 
 
+class AttachmentRequest(Request):
+    """
+    Uploaded files are streamed in chunks to the attachment upload directory of the manager
+    while the multipart body is parsed, rather than being buffered in memory or in a temporary
+    file elsewhere (see `weskit.classes.Attachment.AttachmentFile`).
+    """
+
+    def _get_file_stream(self,
+                         total_content_length: Optional[int],
+                         content_type: Optional[str],
+                         filename: Optional[str] = None,
+                         content_length: Optional[int] = None) -> IO[bytes]:
+        manager = WESApp.from_current_app(current_app).manager
+        return cast(IO[bytes], AttachmentFile(manager.attachment_upload_dir,
+                                              manager.max_attachment_size))
+
+
 class WESApp(Flask):
     """We make a subclass of Flask that takes the important app-global
     (~thread local) resources.
     Compare https://stackoverflow.com/a/21845744/8784544"""
 
+    request_class = AttachmentRequest
+    json_provider_class = OrjsonProvider
+
     def __init__(self,
                  manager: Manager,
                  service_info: ServiceInfo,
                  request_validators: dict,
                  logger: Logger,
                  log_config: dict,
+                 run_stage_event_streams: RunStageEventStreams,
+                 drs_url_resolver: DrsUrlResolver,
                  is_login_enabled: bool = True,
                  oidc_login: Optional[Login] = None,
                  *args, **kwargs):
@@ -38,6 +64,9 @@ class WESApp(Flask):
         self._is_login_enabled = is_login_enabled
         self._oidc_login = oidc_login
         self._log_config = log_config
+        self._run_stage_event_streams = run_stage_event_streams
+        # The resolver (and its cache) is shared by all requests of the process.
+        self._drs_url_resolver = drs_url_resolver
         self.logger = logger
 
     @property
@@ -72,6 +101,14 @@ class WESApp(Flask):
     def log_config(self) -> dict:
         return self._log_config
 
+    @property
+    def run_stage_event_streams(self) -> RunStageEventStreams:
+        return self._run_stage_event_streams
+
+    @property
+    def drs_url_resolver(self) -> DrsUrlResolver:
+        return self._drs_url_resolver
+
     @staticmethod
     def from_current_app(app: Flask) -> WESApp:
         """
@@ -28,6 +28,17 @@ class DatabaseOperationError(WESkitError):
     pass
 
 
+class DuplicateRunIdError(DatabaseOperationError):
+    """
+    Raised if a run was inserted with an ID that is already used by another run. `run_ids` are
+    the colliding IDs, i.e. the IDs of the runs that were not inserted.
+    """
+
+    def __init__(self, message, run_ids=None):
+        super().__init__(message)
+        self.run_ids = [] if run_ids is None else list(run_ids)
+
+
 class ConcurrentModificationError(DatabaseOperationError):
     """
     Raised if a database modification was attempted, but the value in the database has been updated
@@ -8,8 +8,10 @@ from typing import Callable, Optional
 
 import requests
 from flask import current_app as flask_current_app
+from flask_jwt_extended import get_jwt
 from flask_jwt_extended.view_decorators import _decode_jwt_from_headers, verify_jwt_in_request
 
+from weskit.oidc.TokenValidationCache import TokenValidation
 from weskit.utils import mop
 from weskit.classes.WESApp import WESApp
 
@@ -41,10 +43,9 @@ def login_required(validate_online: bool = True):
                     # An OIDC login is configured.
                     verify_jwt_in_request()
                     if validate_online:
-                        if not validate(current_app):
-                            return {"msg": "Online validation failed"}, 401
-                        if not validate_userinfo(current_app):
-                            return {"msg": "Userinfo validation failed"}, 401
+                        validation = validate_cached(current_app)
+                        if not validation.is_valid:
+                            return {"msg": validation.error}, 401
                 return fn(*args, **kwargs)
             except Exception as e:
                 # It is important, that we also log errors during this annotation code. The
@@ -59,6 +60,30 @@ def login_required(validate_online: bool = True):
     return wrapper
 
 
+def validate_cached(app) -> TokenValidation:
+    """
+    Validate the access token online (introspection and userinfo), unless the result of a
+    recent validation of the same token is cached (see `TokenValidationCache`).
+    """
+    cache = app.oidc_login.validation_cache
+    access_token = get_token()
+    if access_token is not None:
+        cached_validation = cache.get(access_token)
+        if cached_validation is not None:
+            return cached_validation
+
+    if not validate(app):
+        validation = TokenValidation("Online validation failed")
+    elif not validate_userinfo(app):
+        validation = TokenValidation("Userinfo validation failed")
+    else:
+        validation = TokenValidation()
+
+    if access_token is not None:
+        cache.put(access_token, validation, get_jwt().get("exp"))
+    return validation
+
+
 def validate(app) -> bool:
     """
     Checks the validity of a token with a request to OIDC provider.
@@ -2,20 +2,21 @@
 #
 # SPDX-License-Identifier: MIT
 
-import json
 import logging
-from typing import Optional, Union
+import os
+from pathlib import Path
+from typing import Optional
 
 from time import sleep
 
 import requests
-from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey, RSAPrivateKey
 from flask import Flask
 from flask_jwt_extended import JWTManager
-from jwt.algorithms import RSAAlgorithm
 
 from weskit.classes.WESApp import WESApp
 from weskit.oidc.Login import Login
+from weskit.oidc.ProviderCache import ProviderCache
+from weskit.oidc.TokenValidationCache import TokenValidationCache
 from weskit.oidc.User import User
 from weskit.utils import safe_getenv
 
@@ -55,7 +56,9 @@ def setup(app: WESApp, config: dict) -> None:
        * configure Flask app
        * set up current_user (user_loader_callback)
 
-    This makes multiple requests to the issuer/identity provider!
+    The OIDC discovery document and the public keys of the issuer/identity provider are cached in
+    files (see `ProviderCache`). Only if they are not cached yet, this makes multiple requests to
+    the issuer/identity provider!
     """
     if not _is_login_enabled(config):
         app.is_login_enabled = False
@@ -75,18 +78,32 @@ def setup(app: WESApp, config: dict) -> None:
 
         # JWT Setup
         _copy_jwt_vars_to_toplevel_config(app, config)
-        oidc_config = _retrieve_oidc_config(issuer_url)
-        app.config["JWT_PUBLIC_KEY"] = _retrieve_rsa_public_key(oidc_config)
+        provider_cache = ProviderCache(issuer_url,
+                                       _provider_cache_dir(config),
+                                       fetch_oidc_config=_retrieve_oidc_config,
+                                       fetch_jwks=_retrieve_jwks,
+                                       max_age=config["login"]["provider_cache"]["max_age"])
+        app.config["JWT_PUBLIC_KEY"] = provider_cache.public_key()
         # Deactivate JWT CSRF since it is not working with external Identity Provider access tokens.
         # It is reimplemented by this module.
         app.config['JWT_COOKIE_CSRF_PROTECT'] = False
         jwt_manager = JWTManager(app)
 
         # A Login object to allow access to some information from the login_required decorator.
+        cache_config = config["login"].get("validation_cache", {})
         app.oidc_login = Login(client_id=client_id,
                                client_secret=client_secret,
                                realm=realm,
-                               oidc_config=oidc_config)
+                               provider_cache=provider_cache,
+                               validation_cache=TokenValidationCache(**cache_config))
+
+        @jwt_manager.decode_key_loader
+        def decode_key_callback(jwt_headers: dict, jwt_payload: dict):
+            """
+            The issuer's public key with the key ID of the token. Unknown key IDs (e.g. after a key
+            rotation) trigger a re-fetch of the issuer's public keys.
+            """
+            return provider_cache.public_key(jwt_headers.get("kid"))
 
         @jwt_manager.user_lookup_loader
         def user_loader_callback(jwt_headers: dict, jwt_payload: dict) -> User:
@@ -122,15 +139,12 @@ def _copy_jwt_vars_to_toplevel_config(flaskapp: Flask, config: dict) \
         flaskapp.config[key] = config['login']['jwt'][key]
 
 
-def _retrieve_rsa_public_key(oidc_config: dict) -> Union[RSAPrivateKey, RSAPublicKey]:
-    """
-    Do a sequence of requests to the identity provider to retrieve its public key
-    :param issuer_url:
-    :return:
-    """
-    jwks_uri = oidc_config["jwks_uri"]
-    jwt = _retrieve_issuers_public_key_jwt(jwks_uri)
-    return RSAAlgorithm.from_jwk(jwt)
+def _provider_cache_dir(config: dict) -> Path:
+    directory = config["login"]["provider_cache"]["directory"]
+    if directory is None:
+        return Path(os.getenv("WESKIT_DATA", "./tmp")).absolute() / ".oidc"
+    else:
+        return Path(directory)
 
 
 def _retrieve_oidc_config(issuer_url: str, timeout_sec: int = 10) -> dict:
@@ -188,15 +202,16 @@ def _validate_issuer_config_response(response) -> dict:
     return config
 
 
-def _retrieve_issuers_public_key_jwt(jwks_uri: str) -> str:
-    logger.info("Extracting public certificate from issuer")
+def _retrieve_jwks(jwks_uri: str) -> dict:
+    logger.info("Retrieving public keys from issuer")
     try:
         response = requests.get(jwks_uri, timeout=60).json()
-        public_key_jwt = json.dumps(response["keys"][0])
+        if not isinstance(response, dict) or not response.get("keys"):
+            raise ValueError("Identity provider responded without keys: %s" % response)
 
     except Exception as e:
         logger.exception("Could not connect to %s to receive the RSA public key!" % jwks_uri)
         logger.exception(e)
         raise e
 
-    return public_key_jwt
+    return response
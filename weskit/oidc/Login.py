@@ -2,17 +2,35 @@
 #
 # SPDX-License-Identifier: MIT
 
+from typing import Any, Dict, Optional
+
+from weskit.oidc.ProviderCache import ProviderCache
+from weskit.oidc.TokenValidationCache import TokenValidationCache
+
+
 class Login:
 
     def __init__(self,
                  realm: str,
                  client_id: str,
                  client_secret: str,
-                 oidc_config: dict):
+                 provider_cache: ProviderCache,
+                 validation_cache: Optional[TokenValidationCache] = None):
         self.realm = realm
         self.client_id = client_id
         self.client_secret = client_secret
-        self.config = oidc_config
+        self.provider_cache = provider_cache
+        self.validation_cache = validation_cache \
+            if validation_cache is not None \
+            else TokenValidationCache()
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        """
+        The OIDC discovery document of the issuer. It is read through the provider cache, such
+        that its (background) refreshes are used.
+        """
+        return self.provider_cache.oidc_config
 
     @property
     def introspection_endpoint(self) -> str:
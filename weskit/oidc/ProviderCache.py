@@ -0,0 +1,195 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from jwt.algorithms import RSAAlgorithm
+from jwt.exceptions import InvalidSignatureError
+
+logger = logging.getLogger(__name__)
+
+
+class CachedDocument:
+    """
+    A JSON document of the identity provider (e.g. the OIDC discovery document or the JWKS) that
+    is cached in a file, such that all (uWSGI) worker processes share it, and the document is
+    available after restarts without network requests.
+
+    A document older than `max_age` seconds is still returned, but it is refreshed in a
+    background thread. Only if there is no cached document at all, it is fetched synchronously.
+    """
+
+    def __init__(self,
+                 path: Path,
+                 fetch: Callable[[], Dict[str, Any]],
+                 max_age: float = 3600.0,
+                 clock: Callable[[], float] = time.time) -> None:
+        self.path = path
+        self.fetch = fetch
+        self.max_age = max_age
+        self._clock = clock
+        self._cached: Optional[Tuple[float, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _is_fresh(self, cached: Tuple[float, Dict[str, Any]]) -> bool:
+        return self._clock() - cached[0] < self.max_age
+
+    def _load(self) -> Optional[Tuple[float, Dict[str, Any]]]:
+        try:
+            with open(self.path, "r") as fh:
+                content = json.load(fh)
+            return content["fetched_at"], content["document"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable cached document '{self.path}': {e}")
+            return None
+
+    def _store(self, cached: Tuple[float, Dict[str, Any]]) -> None:
+        # Write atomically, because other processes may read the file concurrently.
+        try:
+            os.makedirs(self.path.parent, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=".incoming-")
+            with os.fdopen(fd, "w") as fh:
+                json.dump({"fetched_at": cached[0], "document": cached[1]}, fh)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write cached document '{self.path}': {e}")
+
+    def get(self) -> Dict[str, Any]:
+        cached = self._cached
+        if cached is None or not self._is_fresh(cached):
+            # Another process may have refreshed the file in the meantime.
+            loaded = self._load()
+            if loaded is not None and (cached is None or loaded[0] > cached[0]):
+                cached = loaded
+                self._cached = cached
+        if cached is None:
+            return self.refresh()
+        if not self._is_fresh(cached):
+            self.refresh_in_background()
+        return cached[1]
+
+    def refresh(self) -> Dict[str, Any]:
+        """
+        Fetch the document from the identity provider and update the cache.
+        """
+        cached = (self._clock(), self.fetch())
+        self._store(cached)
+        self._cached = cached
+        return cached[1]
+
+    def refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def _refresh():
+            try:
+                self.refresh()
+                logger.info(f"Refreshed cached document '{self.path}'")
+            except Exception as e:
+                logger.warning(f"Could not refresh cached document '{self.path}': {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=_refresh, name="oidc-cache-refresh", daemon=True).start()
+
+
+class ProviderCache:
+    """
+    The OIDC discovery document and the JWKS (public keys) of the identity provider, cached in the
+    `directory` (see `CachedDocument`).
+
+    Tokens signed with a key ID (`kid`) that is not in the cached JWKS (e.g. after a key rotation)
+    trigger a synchronous re-fetch of the JWKS, but at most every `min_jwks_refresh_interval`
+    seconds, such that tokens with bogus key IDs cannot flood the identity provider. If the
+    re-fetch fails, the token is rejected like a token with an unknown key ID.
+    """
+
+    def __init__(self,
+                 issuer_url: str,
+                 directory: Path,
+                 fetch_oidc_config: Callable[[str], Dict[str, Any]],
+                 fetch_jwks: Callable[[str], Dict[str, Any]],
+                 max_age: float = 3600.0,
+                 min_jwks_refresh_interval: float = 10.0,
+                 clock: Callable[[], float] = time.time) -> None:
+        prefix = hashlib.sha256(issuer_url.encode("utf-8")).hexdigest()[:16]
+        self._oidc_config = CachedDocument(directory / f"{prefix}-openid-configuration.json",
+                                           lambda: fetch_oidc_config(issuer_url),
+                                           max_age,
+                                           clock)
+        self._jwks = CachedDocument(directory / f"{prefix}-jwks.json",
+                                    lambda: fetch_jwks(self.oidc_config["jwks_uri"]),
+                                    max_age,
+                                    clock)
+        self.min_jwks_refresh_interval = min_jwks_refresh_interval
+        self._clock = clock
+        self._last_jwks_refresh = float("-inf")
+        self._refresh_lock = threading.Lock()
+        self._keys: Tuple[Optional[Dict[str, Any]], Dict[Optional[str], Any]] = (None, {})
+
+    @property
+    def oidc_config(self) -> Dict[str, Any]:
+        return self._oidc_config.get()
+
+    def _parsed_keys(self, jwks: Dict[str, Any]) -> Dict[Optional[str], Any]:
+        """
+        The public keys by key ID. The first key is also the key for tokens without key ID. The
+        keys are only parsed again, if the JWKS changed.
+        """
+        parsed_jwks, keys = self._keys
+        if parsed_jwks is not jwks:
+            keys = {}
+            for jwk in jwks.get("keys", []):
+                if jwk.get("kty") != "RSA" or jwk.get("use", "sig") != "sig":
+                    continue
+                key = RSAAlgorithm.from_jwk(json.dumps(jwk))
+                keys.setdefault(None, key)
+                keys[jwk.get("kid")] = key
+            self._keys = (jwks, keys)
+        return keys
+
+    def public_key(self, kid: Optional[str] = None) -> Any:
+        """
+        The public key with the key ID (or the first key, if no key ID is given). Raises an
+        InvalidSignatureError, if the identity provider has no such key.
+        """
+        keys = self._parsed_keys(self._jwks.get())
+        if kid not in keys and self._may_refresh_jwks():
+            logger.info(f"Unknown key ID '{kid}'. Fetching the JWKS of the identity provider")
+            try:
+                keys = self._parsed_keys(self._jwks.refresh())
+            except Exception as e:
+                # E.g. the identity provider is not reachable. Clients can send tokens with
+                # arbitrary key IDs, so this must not result in a server error.
+                logger.warning(f"Could not fetch the JWKS of the identity provider: {e}")
+        if kid not in keys:
+            raise InvalidSignatureError(f"Token signed with unknown key ID '{kid}'")
+        return keys[kid]
+
+    def _may_refresh_jwks(self) -> bool:
+        """
+        Whether the JWKS may be re-fetched (at most every `min_jwks_refresh_interval` seconds,
+        counting failed attempts, and only by one thread at a time).
+        """
+        with self._refresh_lock:
+            now = self._clock()
+            if now - self._last_jwks_refresh < self.min_jwks_refresh_interval:
+                return False
+            self._last_jwks_refresh = now
+            return True
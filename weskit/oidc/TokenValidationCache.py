@@ -0,0 +1,95 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class TokenValidation:
+    """
+    The result of the online validation of an access token. `error` is None, if the token is
+    valid, otherwise it is the message of the failed validation.
+    """
+    error: Optional[str] = None
+
+    @property
+    def is_valid(self) -> bool:
+        return self.error is None
+
+
+class TokenValidationCache:
+    """
+    A thread-safe LRU cache of online token validation results (token introspection and userinfo
+    validation), such that repeated requests with the same access token do not need round trips
+    to the identity provider.
+
+    Successful validations are cached for at most `max_age` seconds, but never beyond the
+    expiry time (`exp` claim) of the token. Failed validations (e.g. inactive tokens, or an
+    unreachable identity provider) are cached for `failure_max_age` seconds. At most `max_size`
+    tokens are cached. Tokens are only stored as SHA-256 hashes. A `max_age` (or
+    `failure_max_age`) of 0 disables the caching of successful (or failed) validations.
+    """
+
+    def __init__(self,
+                 max_age: float = 60.0,
+                 failure_max_age: float = 5.0,
+                 max_size: int = 10000,
+                 clock: Callable[[], float] = time.time) -> None:
+        self.max_age = max_age
+        self.failure_max_age = failure_max_age
+        self.max_size = max_size
+        self._clock = clock
+        self._entries: OrderedDict[str, Tuple[float, TokenValidation]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[TokenValidation]:
+        """
+        Return the cached validation of the token, or None if it is not cached (anymore).
+        """
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, validation = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return validation
+
+    def put(self,
+            token: str,
+            validation: TokenValidation,
+            token_expires_at: Optional[float] = None) -> None:
+        """
+        Cache the validation of the token. `token_expires_at` is the `exp` claim of the token
+        (seconds since the epoch).
+        """
+        now = self._clock()
+        expires_at = now + (self.max_age if validation.is_valid else self.failure_max_age)
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        if expires_at <= now:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, validation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,25 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import logging
+
+from weskit.celery_app import celery_app
+from weskit.tasks.ManagerTask import ManagerTask
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(base=ManagerTask, ignore_result=True)
+def collect_attachment_garbage() -> None:
+    """
+    Remove the stored attachments that are not linked from any run directory anymore (see
+    `weskit.classes.Attachment.AttachmentStore`). This task is triggered periodically by
+    `celery beat`.
+    """
+    store = collect_attachment_garbage.manager.attachment_store
+    if store is not None:
+        removed = store.collect_garbage()
+        logger.info(f"Removed {removed} unreferenced attachments")
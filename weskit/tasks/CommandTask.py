@@ -66,7 +66,8 @@ class CommandTask(Task, metaclass=ABCMeta):
 def run_command(command: ShellCommand,
                 execution_settings: ExecutionSettings,
                 worker_context: PathContext,
-                executor_context: PathContext):
+                executor_context: PathContext,
+                start_time: Optional[datetime] = None):
     """
     Run a command in a working directory. The sub_workdir has to be a relative path, such that
     `base_workdir/sub_workdir` is the path in which the command is executed. base_workdir
@@ -77,7 +78,9 @@ def run_command(command: ShellCommand,
     Write log files into a timestamp sub-directory of `sub_workdir/log_base`. There will be
     `stderr` and `stdout` files for the respective output of the command and `log.json` with
     general logging information, including the "command", "start_time", "end_time", and the
-    "exit_code". Paths in the execution log are all relative.
+    "exit_code". Paths in the execution log are all relative. If the `start_time` is given (e.g.
+    the start time of the run), it is used for the timestamp sub-directory, such that the log
+    files can be located (and read) while the command is still running.
 
     Returns a dict with fields "stdout_file", "stderr_file", "log_file" for the three log
     files, and "output_files" for all files created by the process, except the three log-files.
@@ -92,7 +95,8 @@ def run_command(command: ShellCommand,
       * -2: The process was waited for without timeout, but no valid exit-code was produced
             (Executor.wait_for() should always result in an exit-code != None).
     """
-    start_time = datetime.now()
+    if start_time is None:
+        start_time = datetime.now()
 
     # It's a bug to have workdir not defined here!
     if command.workdir is None:
@@ -0,0 +1,32 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import logging
+from abc import ABCMeta
+
+from celery import Task
+from werkzeug.utils import cached_property
+
+from weskit.celery_app import read_config
+from weskit.classes.Manager import Manager
+
+logger = logging.getLogger(__name__)
+
+
+class ManagerTask(Task, metaclass=ABCMeta):
+    """
+    Process-global state for tasks that process runs (e.g. update_runs, prepare_run). The
+    Manager, and with it the database connection, is created only once per worker process.
+    """
+
+    @cached_property
+    def manager(self) -> Manager:
+        # Imported here, because the `weskit` package imports the Manager, which imports the tasks.
+        from weskit import create_database, create_manager, validate_config
+        config = validate_config(read_config())
+        if isinstance(config, list):
+            raise ValueError(f"Could not validate WESkit configuration: {config}")
+        return create_manager(self.app, create_database(), config)
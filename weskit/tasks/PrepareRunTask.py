@@ -0,0 +1,25 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import logging
+from uuid import UUID
+
+from weskit.celery_app import celery_app
+from weskit.tasks.ManagerTask import ManagerTask
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(base=ManagerTask, ignore_result=True)
+def prepare_run(run_id: str) -> None:
+    """
+    Prepare a run in the PREPARING stage (run directory, workflow installation, etc.) and
+    submit its run_command task. With the `async_preparation` option, this is done by a worker,
+    rather than during the submission request (see `Manager.submit_run`).
+    """
+    run = prepare_run.manager.prepare_and_execute(UUID(run_id))
+    if run is not None:
+        logger.info(f"Prepared run {run.id}: {run.processing_stage.name}")
@@ -0,0 +1,23 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import logging
+
+from weskit.celery_app import celery_app
+from weskit.tasks.ManagerTask import ManagerTask
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(base=ManagerTask, ignore_result=True)
+def recount_states() -> None:
+    """
+    Recount the runs per processing stage, to correct drift of the materialized counters used
+    for the service-info (see `weskit.classes.Database.recount_states`). This task is triggered
+    periodically by `celery beat`.
+    """
+    counts = recount_states.manager.database.recount_states()
+    logger.info(f"Recounted {sum(counts.values())} runs in {len(counts)} processing stages")
@@ -0,0 +1,24 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from __future__ import annotations
+
+import logging
+
+from weskit.celery_app import celery_app
+from weskit.tasks.ManagerTask import ManagerTask
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(base=ManagerTask, ignore_result=True)
+def update_runs(max_tries: int = 3) -> None:
+    """
+    Update the processing stages of all runs that are not in a terminal stage from the Celery
+    result backend. This task is triggered periodically by `celery beat` (see
+    `weskit.celery_app.run_update_schedule`), such that the REST endpoints listing runs only need
+    to read the database.
+    """
+    runs = update_runs.manager.update_runs(max_tries=max_tries)
+    logger.info(f"Updated {len(runs)} non-terminal runs")
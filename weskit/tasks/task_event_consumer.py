@@ -0,0 +1,22 @@
+# SPDX-FileCopyrightText: 2023 The WESkit Contributors
+#
+# SPDX-License-Identifier: MIT
+
+from weskit import create_database, create_manager, validate_config
+from weskit.celery_app import celery_app, read_config, update_celery_config_from_env
+from weskit.classes.TaskEventConsumer import TaskEventConsumer
+
+
+def main():
+    update_celery_config_from_env()
+    config = validate_config(read_config())
+    if isinstance(config, list):
+        raise ValueError(f"Could not validate WESkit configuration: {config}")
+    manager = create_manager(celery_app, create_database(), config)
+    TaskEventConsumer(manager).capture()
+
+
+# A start script for the single consumer of Celery task events per WESkit installation (see
+# `weskit.classes.TaskEventConsumer`).
+if __name__ == "__main__":
+    main()
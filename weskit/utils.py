@@ -5,12 +5,13 @@
 import asyncio
 import logging
 import os
+import threading
 import traceback
 from asyncio import AbstractEventLoop
 from datetime import datetime
 from importlib.abc import Traversable
 from importlib.resources import files
-from typing import Dict, Union, List, TypeVar, Optional, Callable, Any, Mapping
+from typing import Dict, Union, List, TypeVar, Optional, Callable, Any, Mapping, Tuple
 from urllib.parse import urlparse
 
 import boto3
@@ -48,6 +49,51 @@ def to_filename(uris):
     return filenames
 
 
+def read_file_range(path: Union[str, os.PathLike],
+                    offset: int,
+                    limit: int) -> Tuple[bytes, int]:
+    """
+    Read at most `limit` bytes starting at byte `offset` of the file. Only the requested range is
+    read (by seeking), so this is cheap even for large (and growing) files. Returns the data and
+    the offset from which to continue reading.
+    """
+    with open(path, "rb") as fh:
+        fh.seek(offset)
+        data = fh.read(limit)
+    return data, offset + len(data)
+
+
+def read_file_tail(path: Union[str, os.PathLike],
+                   lines: int,
+                   limit: int,
+                   chunk_size: int = 64 * 1024) -> Tuple[bytes, int]:
+    """
+    Read the last `lines` lines of the file, but at most `limit` bytes. The file is read backwards
+    in chunks from its end. Returns the data and the offset from which to continue reading (i.e.
+    the end of the file at the time of reading).
+    """
+    with open(path, "rb") as fh:
+        end = fh.seek(0, os.SEEK_END)
+        lower = max(end - limit, 0)
+        start = end
+        data = b""
+        while start > lower:
+            read_size = min(chunk_size, start - lower)
+            start -= read_size
+            fh.seek(start)
+            data = fh.read(read_size) + data
+            # A trailing newline terminates the last line, but does not separate two lines.
+            if data.count(b"\n", 0, len(data) - 1) >= lines:
+                break
+    if data.count(b"\n", 0, len(data) - 1) >= lines:
+        # Drop the (partial) lines before the requested ones.
+        cut = len(data) - 1
+        for _ in range(lines):
+            cut = data.rindex(b"\n", 0, cut)
+        data = data[cut + 1:]
+    return data, end
+
+
 def now() -> datetime:
     """
     MongoDB stores datetime as int64 in microseconds. This means that through storage of datetimes
@@ -84,12 +130,20 @@ def get_traceback(e: Exception) -> str:
 
 def create_validator(schema):
     """Return a validator function that can be provided a data structure to
-    be validated. The validator is returned as second argument."""
+    be validated. The validator is returned as second argument.
+
+    The schema is parsed and checked only once per thread, when the thread's Cerberus Validator
+    is created. Validators are stateful and therefore not shared between threads."""
+    validators = threading.local()
+
     def _validate(target) -> Union[Dict[str, dict], List[str]]:
-        validator = Validator()
-        validation_success = validator.validate(target, schema)
-        if validation_success:
-            return validator.normalized(target, schema)
+        validator = getattr(validators, "validator", None)
+        if validator is None:
+            validator = Validator(schema)
+            validators.validator = validator
+        if validator.validate(target):
+            # Validation normalizes a (shallow) copy of the target.
+            return validator.document
         else:
             return [validator.errors]
     return _validate